@@ -1,11 +1,25 @@
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 import pandas as pd
-from datetime import datetime
-import sqlite3
-import os
-from fpdf import FPDF
-import ast
+import numpy as np
+from datetime import datetime, timedelta
+import hashlib
 import json
+import os
+import sys
+
+from quote_engine.storage import (
+    PRODUCTS_CSV_PATH, init_db, add_client, update_client, get_all_clients, get_client_by_id,
+    save_quote_to_db, update_quote, update_quote_status, convert_quotes_to_invoices, get_quote_by_id, delete_quote,
+    get_all_quotes_for_client, duplicate_quote, parse_included_charges, get_products_for_dropdown,
+    add_product, update_product, delete_product, create_sample_csv, get_price_history, get_price_as_of,
+    list_quote_history, diff_quote_versions, restore_quote_version, get_report_data,
+    get_pricing_rules, get_pricing_charges, save_pricing_charges, get_price_tiers, save_price_tiers,
+    get_client_prices, save_client_prices,
+)
+from quote_engine.lineitems import QuoteLines
+from quote_engine.pricing import rate_label
+from quote_engine import assets, estimator, jobs, metrics, profiling, tracing
 
 # ----------------------------
 # PAGE CONFIG & CONSTANTS
@@ -17,676 +31,204 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-DB_PATH = "rigc_app.db"
-PRODUCTS_CSV_PATH = "products.csv"
 MAX_ATTEMPTS = 3
 USER_PASSCODES = {"fabian": "samuel2", "metprord": "Gerencia2026"}
+# Background workers started with the server; 0 = run `python -m quote_engine.jobs` separately
+JOB_WORKERS = int(os.environ.get("RIGC_JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = 1
+JOB_LABELS = {"sync_products": "Sincronizando productos", "render_pdf": "Generando PDF",
+              "export_quotes": "Exportando cotizaciones", "reprice_drafts": "Actualizando precios de borradores"}
+# Users who may turn on rerun tracing from the sidebar (RIGC_TRACE=1 traces every rerun)
+TRACE_ADMINS = {u.strip() for u in os.environ.get("RIGC_TRACE_ADMINS", "fabian").split(",") if u.strip()}
+TRACE_PANEL_SPANS = 60
+LINE_EDITOR_COLUMNS = ["product_name", "quantity", "unit_price", "discount_type", "discount_value",
+                       "discount_amount", "subtotal"]
 
-# ----------------------------
-# DATABASE SETUP
-# ----------------------------
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def init_db():
-    with get_db_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS clients (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            company_name TEXT NOT NULL,
-            contact_name TEXT,
-            email TEXT,
-            phone TEXT,
-            address TEXT,
-            tax_id TEXT,
-            notes TEXT
-        )
-        """)
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            description TEXT,
-            unit_price REAL NOT NULL
-        )
-        """)
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS quotes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            quote_id TEXT UNIQUE NOT NULL,
-            client_id INTEGER NOT NULL,
-            project_name TEXT,
-            date TEXT NOT NULL,
-            total_amount REAL NOT NULL,
-            status TEXT NOT NULL DEFAULT 'Draft',
-            notes TEXT,
-            included_charges TEXT,
-            FOREIGN KEY (client_id) REFERENCES clients(id)
-        )
-        """)
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS quote_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            quote_id TEXT NOT NULL,
-            product_name TEXT NOT NULL,
-            quantity REAL NOT NULL,
-            unit_price REAL NOT NULL,
-            discount_type TEXT DEFAULT 'none',
-            discount_value REAL DEFAULT 0,
-            auto_imported BOOLEAN DEFAULT 0,
-            FOREIGN KEY (quote_id) REFERENCES quotes(quote_id)
-        )
-        """)
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS quote_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            quote_id TEXT NOT NULL,
-            snapshot_date TEXT NOT NULL,
-            snapshot_data TEXT NOT NULL
-        )
-        """)
-        # Add missing columns if needed
-        try:
-            cur.execute("SELECT discount_type FROM quote_items LIMIT 1")
-        except sqlite3.OperationalError:
-            cur.execute("ALTER TABLE quote_items ADD COLUMN discount_type TEXT DEFAULT 'none'")
-            cur.execute("ALTER TABLE quote_items ADD COLUMN discount_value REAL DEFAULT 0")
-        
-        conn.commit()
-    
-    # Auto-sync products from CSV if file exists
-    if os.path.exists(PRODUCTS_CSV_PATH):
-        try:
-            result, msg = sync_products_from_csv()
-            if result:
-                print(f"✅ Products auto-synced from CSV: {msg}")
-        except Exception as e:
-            print(f"⚠️ Error auto-syncing from CSV: {str(e)}")
-    else:
-        # Only insert sample products if CSV doesn't exist AND products table is empty
-        with get_db_connection() as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT COUNT(*) FROM products")
-            if cur.fetchone()[0] == 0:
-                print("⚠️ No products.csv found. Creating sample products...")
-                samples = [
-                    ("Steel Beam IPE 200", "European standard I-beam", 125.50),
-                    ("Galvanized Sheet 2mm", "Corrosion-resistant roofing", 45.75),
-                    ("Anchor Bolts M20", "Heavy-duty foundation bolts", 8.90),
-                ]
-                cur.executemany("INSERT INTO products (name, description, unit_price) VALUES (?, ?, ?)", samples)
-                conn.commit()
-                print("✅ Sample products created")
-
-if not os.path.exists(DB_PATH):
-    init_db()
-else:
+@st.cache_resource
+def init_storage():
+    """Create/migrate the schema and sync the catalog once per server process, not per rerun."""
     init_db()
 
-# ----------------------------
-# DATABASE HELPERS
-# ----------------------------
-def query_db(query, params=(), fetch_one=False, fetch_all=False):
-    with get_db_connection() as conn:
-        cur = conn.cursor()
-        cur.execute(query, params)
-        if fetch_one:
-            return cur.fetchone()
-        elif fetch_all:
-            return cur.fetchall()
-        else:
-            conn.commit()
-
-def get_next_quote_id():
-    year = datetime.now().year
-    result = query_db(
-        f"SELECT quote_id FROM quotes WHERE quote_id LIKE 'COT-{year}-%' ORDER BY quote_id DESC LIMIT 1",
-        fetch_one=True
-    )
-    if not result:
-        return f"COT-{year}-001"
-    last_id = result[0]
-    try:
-        num = int(last_id.split("-")[-1])
-        return f"COT-{year}-{num+1:03d}"
-    except:
-        return f"COT-{year}-001"
-
-def add_client(company, contact="", email="", phone="", address="", tax_id="", notes=""):
-    with get_db_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO clients (company_name, contact_name, email, phone, address, tax_id, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (company, contact, email, phone, address, tax_id, notes))
-        conn.commit()
-        return cur.lastrowid
-
-def update_client(client_id, company, contact="", email="", phone="", address="", tax_id="", notes=""):
-    with get_db_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            UPDATE clients SET
-                company_name = ?, contact_name = ?, email = ?, phone = ?,
-                address = ?, tax_id = ?, notes = ?
-            WHERE id = ?
-        """, (company, contact, email, phone, address, tax_id, notes, client_id))
-        conn.commit()
-
-def get_all_clients():
-    rows = query_db("SELECT * FROM clients ORDER BY company_name", fetch_all=True)
-    return [dict(row) for row in rows]
-
-def get_client_by_id(client_id):
-    row = query_db("SELECT * FROM clients WHERE id = ?", (client_id,), fetch_one=True)
-    return dict(row) if row else None
-
-def save_quote_to_db(client_id, project_name, items, total, notes, included_charges, status="Draft"):
-    quote_id = get_next_quote_id()
-    date_str = datetime.now().strftime("%Y-%m-%d")
-    charges_str = str(included_charges)
-    
-    with get_db_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO quotes (quote_id, client_id, project_name, date, total_amount, status, notes, included_charges)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (quote_id, client_id, project_name, date_str, total, status, notes, charges_str))
-        
-        for item in items:
-            cur.execute("""
-                INSERT INTO quote_items (
-                    quote_id, product_name, quantity, unit_price,
-                    discount_type, discount_value, auto_imported
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                quote_id,
-                item["product_name"],
-                item["quantity"],
-                item["unit_price"],
-                item.get("discount_type", "none"),
-                item.get("discount_value", 0),
-                int(item.get("auto_imported", False))
-            ))
-        conn.commit()
-    return quote_id
-
-def update_quote_status(quote_id, status):
-    if status == "Invoiced":
-        invoice_id = quote_id.replace("COT-", "INV-")
-        existing = query_db("SELECT quote_id FROM quotes WHERE quote_id = ?", (invoice_id,), fetch_one=True)
-        if existing:
-            query_db("UPDATE quotes SET status = ? WHERE quote_id = ?", (status, quote_id))
-            return quote_id
-        query_db("UPDATE quote_items SET quote_id = ? WHERE quote_id = ?", (invoice_id, quote_id))
-        query_db("UPDATE quotes SET status = ?, quote_id = ? WHERE quote_id = ?", (status, invoice_id, quote_id))
-        return invoice_id
-    else:
-        query_db("UPDATE quotes SET status = ? WHERE quote_id = ?", (status, quote_id))
-        return quote_id
-
-def get_quote_by_id(quote_id):
-    quote_row = query_db("SELECT * FROM quotes WHERE quote_id = ?", (quote_id,), fetch_one=True)
-    if not quote_row:
-        return None, None
-    items_rows = query_db("SELECT * FROM quote_items WHERE quote_id = ?", (quote_id,), fetch_all=True)
-    items = [dict(row) for row in items_rows]
-    return dict(quote_row), items
-
-def delete_quote(quote_id):
-    with get_db_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("DELETE FROM quote_items WHERE quote_id = ?", (quote_id,))
-        cur.execute("DELETE FROM quotes WHERE quote_id = ?", (quote_id,))
-        conn.commit()
-
-def get_all_quotes_for_client(client_id):
-    quotes_rows = query_db(
-        "SELECT quote_id, project_name, date, total_amount, status, notes, included_charges FROM quotes WHERE client_id = ? ORDER BY date DESC",
-        (client_id,),
-        fetch_all=True
-    )
-    return [dict(row) for row in quotes_rows]
-
-def get_products_for_dropdown():
-    with get_db_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT id, name, description, unit_price FROM products ORDER BY name")
-        rows = cur.fetchall()
-        return [dict(row) for row in rows]
+@st.cache_resource
+def start_metrics_exporter():
+    """Publish this server's metrics on RIGC_METRICS_PORT / RIGC_METRICS_FILE, when set."""
+    return metrics.start_exporter()
 
-def add_product(name, description, unit_price):
-    try:
-        with get_db_connection() as conn:
-            cur = conn.cursor()
-            cur.execute("INSERT INTO products (name, description, unit_price) VALUES (?, ?, ?)", 
-                       (name, description, unit_price))
-            conn.commit()
-            return cur.lastrowid
-    except sqlite3.IntegrityError:
-        return None
+@st.cache_resource
+def start_job_workers():
+    """Worker processes shared by every session; they exit with the server."""
+    return jobs.start_workers(JOB_WORKERS) if JOB_WORKERS > 0 else []
 
-def update_product(product_id, name, description, unit_price):
+def rerun_fragment():
+    """Rerun only the calling fragment, or the whole app when the click arrived in a full rerun."""
     try:
-        with get_db_connection() as conn:
-            cur = conn.cursor()
-            cur.execute("UPDATE products SET name = ?, description = ?, unit_price = ? WHERE id = ?",
-                       (name, description, unit_price, product_id))
-            conn.commit()
-            return True
-    except sqlite3.IntegrityError:
-        return False
-
-def delete_product(product_id):
-    query_db("DELETE FROM products WHERE id = ?", (product_id,))
-
-def sync_products_from_csv(csv_file_path=PRODUCTS_CSV_PATH):
-    if not os.path.exists(csv_file_path):
-        return None, "CSV file not found"
-    
-    try:
-        df = pd.read_csv(csv_file_path)
-        required_columns = ['name', 'unit_price']
-        if not all(col in df.columns for col in required_columns):
-            return None, f"CSV must have columns: {', '.join(required_columns)}"
-        
-        if 'description' not in df.columns:
-            df['description'] = ''
-        
-        df['name'] = df['name'].str.strip()
-        df['description'] = df['description'].fillna('').str.strip()
-        df['unit_price'] = pd.to_numeric(df['unit_price'], errors='coerce')
-        df = df.dropna(subset=['name', 'unit_price'])
-        df = df[df['unit_price'] > 0]
-        
-        if df.empty:
-            return None, "No valid products found in CSV"
-        
-        added = updated = 0
-        errors = []
-        
-        with get_db_connection() as conn:
-            cur = conn.cursor()
-            for _, row in df.iterrows():
-                try:
-                    existing = cur.execute("SELECT id FROM products WHERE name = ?", (row['name'],)).fetchone()
-                    if existing:
-                        cur.execute("UPDATE products SET description = ?, unit_price = ? WHERE name = ?",
-                                  (row['description'], row['unit_price'], row['name']))
-                        updated += 1
-                    else:
-                        cur.execute("INSERT INTO products (name, description, unit_price) VALUES (?, ?, ?)",
-                                  (row['name'], row['description'], row['unit_price']))
-                        added += 1
-                except Exception as e:
-                    errors.append(f"{row['name']}: {str(e)}")
-            conn.commit()
-        
-        message = f"✅ Synced: {added} added, {updated} updated"
-        if errors:
-            message += f"\n⚠️ {len(errors)} errors"
-        return {'added': added, 'updated': updated, 'errors': errors}, message
-    except Exception as e:
-        return None, f"Error reading CSV: {str(e)}"
-
-def create_sample_csv():
-    sample_data = {
-        'name': ['Steel Beam IPE 200', 'Galvanized Sheet 2mm', 'Anchor Bolts M20', 'Concrete Mix 25MPa', 'Rebar 12mm'],
-        'description': [
-            'European standard I-beam',
-            'Corrosion-resistant roofing',
-            'Heavy-duty foundation bolts',
-            'High-strength concrete',
-            'Reinforcement steel bar'
-        ],
-        'unit_price': [125.50, 45.75, 8.90, 95.00, 12.50]
-    }
-    df = pd.DataFrame(sample_data)
-    df.to_csv(PRODUCTS_CSV_PATH, index=False)
-    return df
-
-def save_quote_snapshot(quote_id, data_dict):
-    timestamp = datetime.now().isoformat()
-    snapshot = {"quote_id": quote_id, "snapshot_date": timestamp, "data": data_dict}
-    with get_db_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("INSERT INTO quote_history (quote_id, snapshot_date, snapshot_data) VALUES (?, ?, ?)",
-                   (quote_id, timestamp, json.dumps(snapshot, default=str)))
-        conn.commit()
-
-def get_quote_history(quote_id):
-    rows = query_db("SELECT snapshot_data FROM quote_history WHERE quote_id = ? ORDER BY snapshot_date DESC",
-                   (quote_id,), fetch_all=True)
-    return [json.loads(row[0]) for row in rows]
-
-def duplicate_quote(original_quote_id):
-    original_quote, items = get_quote_by_id(original_quote_id)
-    if not original_quote:
-        return None
-    try:
-        included_charges = ast.literal_eval(original_quote["included_charges"])
-    except:
-        included_charges = {k: True for k in ['supervision','admin','insurance','transport','contingency']}
-    
-    notes = original_quote.get('notes', '')
-    notes = f"{notes}\n\nCopied from {original_quote_id}" if notes else f"Copied from {original_quote_id}"
-    
-    return save_quote_to_db(
-        client_id=original_quote['client_id'],
-        project_name=original_quote.get('project_name', ''),
-        items=items,
-        total=original_quote['total_amount'],
-        notes=notes,
-        included_charges=included_charges,
-        status="Draft"
-    )
-
-# ----------------------------
-# QUOTATION LOGIC
-# ----------------------------
-def calculate_item_discount(unit_price, quantity, discount_type, discount_value):
-    subtotal = unit_price * quantity
-    if discount_type == "percentage":
-        return subtotal * (discount_value / 100)
-    elif discount_type == "fixed":
-        return discount_value
-    return 0
-
-def calculate_quote(products, included_charges):
-    items_total = sum(float(p.get('quantity', 0)) * float(p.get('unit_price', 0)) for p in products)
-    total_discounts = sum(calculate_item_discount(
-        float(p.get('unit_price', 0)),
-        float(p.get('quantity', 0)),
-        p.get('discount_type', 'none'),
-        float(p.get('discount_value', 0))
-    ) for p in products)
-    items_after_discount = items_total - total_discounts
-    supervision = items_after_discount * 0.10 if included_charges.get('supervision') else 0.0
-    admin = items_after_discount * 0.04 if included_charges.get('admin') else 0.0
-    insurance = items_after_discount * 0.01 if included_charges.get('insurance') else 0.0
-    transport = items_after_discount * 0.03 if included_charges.get('transport') else 0.0
-    contingency = items_after_discount * 0.03 if included_charges.get('contingency') else 0.0
-    subtotal = items_after_discount + supervision + admin + insurance + transport + contingency
-    itbis = subtotal * 0.18
-    return {
-        'items_total': items_total,
-        'total_discounts': total_discounts,
-        'items_after_discount': items_after_discount,
-        'supervision': supervision,
-        'admin': admin,
-        'insurance': insurance,
-        'transport': transport,
-        'contingency': contingency,
-        'subtotal_general': subtotal,
-        'itbis': itbis,
-        'grand_total': subtotal + itbis,
-    }
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
 
 # ----------------------------
-# PDF GENERATOR
+# BACKGROUND JOBS
 # ----------------------------
-class QuotePDF(FPDF):
-    def header(self):
-        self.set_fill_color(41, 128, 185)
-        self.rect(0, 0, 210, 40, 'F')
-        if os.path.exists("logo.png"):
-            self.image("logo.png", 10, 8, 25)
-        logo_offset = 40 if os.path.exists("logo.png") else 10
-        self.set_text_color(255, 255, 255)
-        self.set_font("Helvetica", "", 4)
-        self.set_xy(logo_offset, 12)
-        lines = [
-            "Parque Industrial Disdo",
-            "Calle Central No. 1, Hato Nuevo Palave",
-            "Santo Domingo Oeste",
-            "Tel: 829-439-8476 | RNC: 131-71683-2"
-        ]
-        for line in lines:
-            self.cell(0, 2, line, 0, 1, "R")
-        self.set_font("Helvetica", "B", 16)
-        self.set_xy(logo_offset, 28)
-        self.cell(0, 8, "COTIZACION", 0, 1, "R")
-        self.set_text_color(0, 0, 0)
-        self.ln(10)
-
-    def footer(self):
-        self.set_y(-50)
-
-        col_width = 85
-        left_x = 20
-        right_x = 115
-
-        line_width = col_width - 20
-
-        # ---------- LEFT SIGNATURE (AUTHORIZED) ----------
-        left_text_x = left_x + 10
-
-        self.set_font("Helvetica", "B", 10)
-        self.set_xy(left_text_x, -45)
-        self.line(
-            left_text_x,
-            self.get_y(),
-            left_text_x + line_width,
-            self.get_y()
-        )
-
-        self.set_xy(left_text_x, -40)
-        self.set_font("Helvetica", "", 8)
-        self.cell(line_width, 4, "Autorizado Por:", 0, 0, "C")
-
-        self.set_xy(left_text_x, -36)
-        self.cell(line_width, 4, "Karmary Mata", 0, 0, "C")
+def track_job(job_id):
+    st.session_state.active_jobs = st.session_state.active_jobs | {job_id}
 
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_job_monitor():
+    """Poll this session's jobs without rerunning the page; rerun it once one finishes."""
+    finished, running = [], {}
+    for job_id in sorted(st.session_state.active_jobs):
+        job = jobs.get_job(job_id)
+        if job is None or job['status'] not in jobs.ACTIVE_STATUSES:
+            finished.append(job_id)
+            if job and job['status'] == 'failed':
+                error = (job['error'] or '').splitlines()[0] if job['error'] else 'error desconocido'
+                st.session_state.job_notices.append(("error", f"❌ {JOB_LABELS.get(job['kind'], job['kind'])}: {error}"))
+            elif job and job['result_type'] == 'application/json':
+                result, _ = jobs.get_job_result(job_id)
+                st.session_state.job_notices.append(("success", json.loads(result)['message']))
+            continue
+        running.setdefault(job['kind'], []).append(job)
+    for kind, kind_jobs in running.items():
+        text = f"⏳ {JOB_LABELS.get(kind, kind)}"
+        job = kind_jobs[0]
+        if len(kind_jobs) > 1:
+            text += f" — {len(kind_jobs)} pendientes"
+        elif job['message']:
+            text += f" — {job['message']}"
+        elif job['status'] == 'queued':
+            text += " (en cola)" if not job['attempts'] else f" (reintento {job['attempts'] + 1})"
+        st.progress(sum(j['progress'] for j in kind_jobs) / len(kind_jobs), text=text)
+    if finished:
+        st.session_state.active_jobs = st.session_state.active_jobs - set(finished)
+        st.rerun()
 
-    # ---------- RIGHT SIGNATURE (CLIENT) ----------
-        right_text_x = right_x + 10
-
-        self.set_xy(right_text_x, -45)
-        self.line(
-            right_text_x,
-            self.get_y(),
-            right_text_x + line_width,
-            self.get_y()
-        )
-
-        self.set_xy(right_text_x, -40)
-        self.cell(line_width, 4, "Firma Cliente", 0, 1, "C")
-
-        # ---------- FOOTER INFO ----------
-        self.set_y(-25)
-        self.set_font("Helvetica", "I", 7)
-        self.set_text_color(128, 128, 128)
-
-        self.cell(
-            0,
-            4,
-            "Parque Industrial Disdo, Calle Central No. 1, Hato Nuevo Palave",
-            0,
-            1,
-            "C"
-        )
-        self.cell(
-            0,
-            4,
-            "Santo Domingo Oeste | Tel: 829-439-8476 | RNC: 131-71683-2",
-            0,
-            1,
-            "C"
-        )
-
-        self.set_y(-15)
-        self.cell(0, 4, f"Pagina {self.page_no()}", 0, 0, "C")
-
-
-    def quote_info(self, quote_data, client_data):
-        self.set_xy(10, 55)
-        self.set_fill_color(240, 240, 240)
-        self.set_font("Helvetica", "B", 11)
-        self.cell(90, 8, "DATOS PEDIDO", 0, 1, "L", True)
-        self.set_font("Helvetica", "", 9)
-        for label, key in [("Cotizacion #:", 'quote_id'), ("Fecha:", 'date'), ("Proyecto:", 'project_name')]:
-            self.set_x(10)
-            self.cell(40, 6, label, 0, 0, "L")
-            self.set_font("Helvetica", "B", 9)
-            self.cell(50, 6, str(quote_data.get(key, 'N/A')), 0, 1, "L")
-            self.set_font("Helvetica", "", 9)
-        self.set_xy(110, 55)
-        self.set_font("Helvetica", "B", 11)
-        self.set_fill_color(240, 240, 240)
-        self.cell(90, 8, "CLIENTE", 0, 1, "L", True)
-        self.set_font("Helvetica", "", 9)
-        for label, key in [("Empresa:", 'company_name'), ("Contacto:", 'contact_name'),
-                           ("RNC/Cedula:", 'tax_id'), ("Email:", 'email'), ("Telefono:", 'phone')]:
-            if client_data.get(key):
-                self.set_x(110)
-                self.cell(40, 6, label, 0, 0, "L")
-                self.set_font("Helvetica", "B", 9)
-                if key == 'company_name':
-                    self.multi_cell(50, 6, str(client_data[key]), 0, "L")
-                else:
-                    self.cell(50, 6, str(client_data[key]), 0, 1, "L")
-                self.set_font("Helvetica", "", 9)
-        self.ln(10)
-
-    def items_table(self, items_list):
-        self.set_fill_color(52, 152, 219)
-        self.set_text_color(255, 255, 255)
-        self.set_font("Helvetica", "B", 10)
-        for text, width in [("DESCRIPCION", 90), ("CANTIDAD", 30), ("PRECIO UNIT.", 35), ("TOTAL", 35)]:
-            self.cell(width, 9, text, 1, 0, "C" if width < 90 else "L", True)
-        self.ln()
-        self.set_text_color(0, 0, 0)
-        self.set_font("Helvetica", "", 9)
-        fill = False
-        for item in items_list:
-            desc = self._clean_text(str(item["product_name"]))
-            self.set_fill_color(245, 245, 245) if fill else self.set_fill_color(255, 255, 255)
-            self.cell(90, 6, desc[:50], 1, 0, "L", fill)
-            self.cell(30, 6, f"{item['quantity']:,.2f}", 1, 0, "C", fill)
-            self.cell(35, 6, f"${item['unit_price']:,.2f}", 1, 0, "R", fill)
-            total = item["quantity"] * item["unit_price"]
-            self.cell(35, 6, f"${total:,.2f}", 1, 1, "R", fill)
-            fill = not fill
-        self.ln(5)
+def show_job_notices():
+    for kind, message in st.session_state.job_notices:
+        (st.error if kind == "error" else st.success)(message)
+    st.session_state.job_notices = []
 
-    def cost_summary(self, totals, included_charges):
-        self.set_draw_color(52, 152, 219)
-        self.set_line_width(0.5)
-        self.set_font("Helvetica", "B", 10)
-        self.set_fill_color(240, 248, 255)
-        self.cell(0, 8, "RESUMEN FINANCIERO", 1, 1, "L", True)
-        self.set_font("Helvetica", "", 9)
-        self.set_line_width(0.2)
-        self.cell(130, 6, "Subtotal de Items:", 1, 0, "L")
-        self.cell(60, 6, f"${totals['items_total']:,.2f}", 1, 1, "R")
-        if totals.get('total_discounts', 0) > 0:
-            self.set_text_color(220, 53, 69)
-            self.cell(130, 6, "Descuentos Aplicados:", 1, 0, "L")
-            self.cell(60, 6, f"-${totals['total_discounts']:,.2f}", 1, 1, "R")
-            self.set_text_color(0, 0, 0)
-        self.set_font("Helvetica", "B", 9)
-        self.cell(130, 6, "Total Despues de Descuentos:", 1, 0, "L")
-        self.cell(60, 6, f"${totals['items_after_discount']:,.2f}", 1, 1, "R")
-        self.set_font("Helvetica", "", 9)
-        for key, label in [
-            ('supervision', "Supervision Tecnica (10%):"),
-            ('admin', "Gastos Administrativos (4%):"),
-            ('insurance', "Seguro de Riesgo (1%):"),
-            ('transport', "Transporte (3%):"),
-            ('contingency', "Imprevisto (3%):")
-        ]:
-            if included_charges.get(key):
-                self.cell(130, 6, label, 1, 0, "L")
-                self.cell(60, 6, f"${totals[key]:,.2f}", 1, 1, "R")
-        self.set_font("Helvetica", "B", 10)
-        self.set_fill_color(230, 240, 250)
-        self.cell(130, 7, "SUBTOTAL GENERAL:", 1, 0, "L", True)
-        self.cell(60, 7, f"${totals['subtotal_general']:,.2f}", 1, 1, "R", True)
-        self.set_font("Helvetica", "", 9)
-        self.cell(130, 6, "ITBIS (18%):", 1, 0, "L")
-        self.cell(60, 6, f"${totals['itbis']:,.2f}", 1, 1, "R")
-        self.set_font("Helvetica", "B", 12)
-        self.set_fill_color(52, 152, 219)
-        self.set_text_color(255, 255, 255)
-        self.cell(130, 10, "TOTAL GENERAL:", 1, 0, "L", True)
-        self.cell(60, 10, f"${totals['grand_total']:,.2f}", 1, 1, "R", True)
-        self.set_text_color(0, 0, 0)
+def show_job_download(kind, payload, job_key, button_label, file_name, widget_key, priority=0):
+    """Download button for a job result; before that, a button that submits the job."""
+    job = jobs.find_job(job_key)
+    if job and job['status'] == 'done':
+        data, mime = jobs.get_job_result(job['id'])
+        st.download_button(button_label, data, file_name, mime, use_container_width=True, key=widget_key)
+    elif job:
+        track_job(job['id'])
+        st.button("⏳ Generando...", key=widget_key, disabled=True, use_container_width=True)
+    elif st.button(button_label, key=widget_key, use_container_width=True):
+        track_job(jobs.submit_job(kind, payload, priority, dedupe_key=job_key))
+        st.rerun()
 
-    def notes_section(self, notes):
-        if notes and notes.strip():
-            self.ln(5)
+def content_key(*parts):
+    """Short fingerprint of the data a job result depends on."""
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:16]
 
-            # Section title
-            self.set_font("Helvetica", "B", 8.5)
-            self.set_text_color(40, 40, 40)
-            self.cell(0, 5, "NOTAS Y CONDICIONES", 0, 1, "L")
+def pdf_job_key(quote_data, items, client_data):
+    return f"pdf:{quote_data['quote_id']}:{content_key(quote_data, items, client_data)}"
 
-            # Notes text (bold but compact)
-            self.set_font("Helvetica", "B", 6.5)
-            self.set_text_color(80, 80, 80)
-            self.multi_cell(
-                0,
-                3.6,
-                self._clean_text(notes),
-                0,
-                "L"
-            )
+# ----------------------------
+# PERFORMANCE TRACING
+# ----------------------------
+def tracing_enabled():
+    return tracing.ENABLED or (st.session_state.get('trace_rerun', False)
+                               and st.session_state.get('username') in TRACE_ADMINS)
 
-        self.set_text_color(0, 0, 0)
+def show_trace_panel(trace):
+    import plotly.graph_objects as go
 
+    spans = trace.spans
+    with st.sidebar.expander(f"⏱️ Rerun: {trace.duration_ms:,.0f} ms · {len(spans)} spans", expanded=True):
+        sql = [s for s in spans if s['name'] == 'sql']
+        st.caption(f"SQL: {len(sql)} sentencias, {sum(s['duration_ms'] for s in sql):,.1f} ms · traza {trace.id}")
+        shown = spans[:TRACE_PANEL_SPANS]
+        labels = [f"{n:02d} {'·' * s['depth']}{s['attrs']['sql'][:30] if s['name'] == 'sql' else s['name']}"
+                  for n, s in enumerate(shown)]
+        fig = go.Figure(go.Bar(x=[s['duration_ms'] for s in shown], base=[s['start_ms'] for s in shown],
+                               y=labels, orientation='h',
+                               marker_color=['#95a5a6' if s['name'] == 'sql' else '#2980b9' for s in shown],
+                               hovertemplate="%{y}<br>%{base:.1f} ms + %{x:.2f} ms<extra></extra>"))
+        fig.update_layout(height=max(200, 16 * len(shown) + 60), margin=dict(l=0, r=0, t=10, b=0),
+                          yaxis=dict(autorange="reversed", tickfont=dict(size=9)), xaxis_title="ms")
+        st.plotly_chart(fig, use_container_width=True)
+        if len(spans) > len(shown):
+            st.caption(f"Mostrando {len(shown)} de {len(spans)} spans")
+        totals = (pd.DataFrame(spans).groupby('name')['duration_ms'].agg(['count', 'sum'])
+                  .sort_values('sum', ascending=False).rename(columns={'count': 'Veces', 'sum': 'ms'}))
+        st.dataframe(totals, use_container_width=True)
 
-    def _clean_text(self, text):
-        replacements = {
-            "\u2022": "-", "\u2013": "-", "\u2014": "--", "\u2018": "'",
-            "\u2019": "'", "\u201c": '"', "\u201d": '"', "\u00a0": " "
-        }
-        for old, new in replacements.items():
-            text = text.replace(old, new)
-        return text.encode('latin1', errors='replace').decode('latin1')
+def _deep_sizeof(obj, seen):
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, QuoteLines):
+        usage = obj.memory_usage()
+        return sys.getsizeof(obj) + usage['arrays'] + usage['names']
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_sizeof(v, seen) for v in obj)
+    return size
 
-class InvoicePDF(QuotePDF):
-    def header(self):
-        self.set_fill_color(231, 76, 60)
-        self.rect(0, 0, 210, 40, 'F')
-        if os.path.exists("logo.png"):
-            self.image("logo.png", 10, 8, 25)
-        logo_offset = 40 if os.path.exists("logo.png") else 10
-        self.set_text_color(255, 255, 255)
-        self.set_font("Helvetica", "", 4)
-        self.set_xy(logo_offset, 12)
-        lines = [
-            "Parque Industrial Disdo",
-            "Calle Central No. 1, Hato Nuevo Palave",
-            "Santo Domingo Oeste",
-            "Tel: 829-439-8476 | RNC: 131-71683-2"
-        ]
-        for line in lines:
-            self.cell(0, 2, line, 0, 1, "R")
-        self.set_font("Helvetica", "B", 16)
-        self.set_xy(logo_offset, 28)
-        self.cell(0, 8, "FACTURA", 0, 1, "R")
-        self.set_text_color(0, 0, 0)
-        self.ln(10)
+def show_session_memory():
+    """Approximate bytes held by each session-state entry of this session."""
+    seen = set()
+    sizes = {key: _deep_sizeof(st.session_state[key], seen) for key in st.session_state.keys()}
+    total = sum(sizes.values())
+    st.metric("Total", f"{total / 1024:,.1f} KB")
+    lines = st.session_state.get('quote_lines')
+    if lines:
+        usage = lines.memory_usage()
+        st.caption(f"Partidas: {usage['lines']} (capacidad {usage['capacity']}) · arreglos "
+                   f"{usage['arrays'] / 1024:,.1f} KB · nombres {usage['names'] / 1024:,.1f} KB (compartidos)")
+    top = sorted(sizes.items(), key=lambda kv: kv[1], reverse=True)[:15]
+    st.dataframe(pd.DataFrame([{"Clave": str(k), "KB": v / 1024} for k, v in top]), hide_index=True,
+                 use_container_width=True, column_config={"KB": st.column_config.NumberColumn("KB", format="%.1f")})
+    shared = [a for a in assets.stats() if a["loaded"]]
+    if shared:
+        st.caption("Recursos compartidos por todas las sesiones: " +
+                   ", ".join(f"{a['name']} {a['bytes'] / 1024:,.0f} KB ({a['loads']} cargas)" for a in shared))
 
 # ----------------------------
 # CSS LOADER
 # ----------------------------
-def load_css(file_path):
-    """Load external CSS file into Streamlit app."""
-    with open(file_path) as f:
-        st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+def load_css():
+    """Inject style.css (read once per process by quote_engine.assets) if it exists."""
+    css = assets.get("style.css")
+    if css:
+        st.markdown(f"<style>{css}</style>", unsafe_allow_html=True)
 
 # ----------------------------
 # REPORTS MODULE
 # ----------------------------
+def _report_card(title, value, change=None):
+    if change is None:
+        trend = ""
+    else:
+        color = "#2E8B57" if change >= 0 else "#FF8C00"
+        arrow = "↑" if change >= 0 else "↓"
+        trend = f'''<div style="font-size: 12px; color: {color}; margin-top: 0.5rem;">
+                {arrow} {abs(change):.0f}% vs mes anterior
+            </div>'''
+    st.markdown(f"""
+    <div class="info-card">
+        <div class="info-card-header">{title}</div>
+        <div class="info-card-value">{value}</div>
+        {trend}
+    </div>
+    """, unsafe_allow_html=True)
+
+def _pct_change(current, previous):
+    return (current - previous) / previous * 100 if previous else None
+
 def show_reports_module():
     st.markdown('<div class="section-header">📊 Reportes</div>', unsafe_allow_html=True)
     
-    st.info("Módulo de reportes en desarrollo")
-    
     # Add custom CSS for info cards
     st.markdown("""
     <style>
@@ -711,49 +253,81 @@ def show_reports_module():
     </style>
     """, unsafe_allow_html=True)
     
-    # Mock report cards
-    col1, col2, col3 = st.columns(3)
+    status = st.selectbox("Estado (clientes y productos)", ["All", "Draft", "Invoiced"], key="report_status")
+    data = get_report_data(status=None if status == "All" else status)
+    if not data["monthly"]:
+        st.info("📭 Aún no hay cotizaciones para reportar")
+        return
     
-    with col1:
-        st.markdown("""
-        <div class="info-card">
-            <div class="info-card-header">Total Cotizaciones</div>
-            <div class="info-card-value">25</div>
-            <div style="font-size: 12px; color: #2E8B57; margin-top: 0.5rem;">
-                ↑ 15% vs mes anterior
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+    monthly = pd.DataFrame(data["monthly"])
+    by_month = monthly.pivot_table(index="month", columns="status", values=["quote_count", "total_value"],
+                                   aggfunc="sum", fill_value=0)
+    counts = by_month["quote_count"].sum(axis=1)
+    values = by_month["total_value"].sum(axis=1)
+    invoiced = by_month["quote_count"]["Invoiced"] if "Invoiced" in by_month["quote_count"] else counts * 0
+    conversion = (invoiced / counts * 100).fillna(0)
     
-    with col2:
-        st.markdown("""
-        <div class="info-card">
-            <div class="info-card-header">Valor Total</div>
-            <div class="info-card-value">$125,450</div>
-            <div style="font-size: 12px; color: #2E8B57; margin-top: 0.5rem;">
-                ↑ 23% vs mes anterior
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+    current_month = datetime.now().strftime("%Y-%m")
+    previous_month = (datetime.now().replace(day=1) - timedelta(days=1)).strftime("%Y-%m")
+    month_count = counts.get(current_month, 0)
+    month_value = values.get(current_month, 0)
+    month_conversion = conversion.get(current_month, 0)
     
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        _report_card("Cotizaciones del Mes", f"{month_count:,.0f}",
+                     _pct_change(month_count, counts.get(previous_month, 0)))
+    with col2:
+        _report_card("Valor del Mes", f"${month_value:,.0f}",
+                     _pct_change(month_value, values.get(previous_month, 0)))
     with col3:
-        st.markdown("""
-        <div class="info-card">
-            <div class="info-card-header">Tasa de Conversión</div>
-            <div class="info-card-value">68%</div>
-            <div style="font-size: 12px; color: #FF8C00; margin-top: 0.5rem;">
-                ↓ 5% vs mes anterior
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+        _report_card("Tasa de Conversión", f"{month_conversion:.0f}%",
+                     _pct_change(month_conversion, conversion.get(previous_month, 0)))
+    
+    total_count = counts.sum()
+    st.caption(f"Histórico: {total_count:,.0f} cotizaciones · ${values.sum():,.2f} · "
+               f"{(invoiced.sum() / total_count * 100) if total_count else 0:.0f}% facturadas")
     
     st.markdown("---")
-    st.markdown("### 📈 Próximamente")
-    st.caption("• Reportes por cliente\n• Histórico de cotizaciones\n• Análisis de productos más vendidos")
+    st.markdown("### 📈 Cotizaciones por Mes")
+    trend = pd.DataFrame({"Cotizaciones": counts, "Valor": values, "Conversión %": conversion})
+    col1, col2 = st.columns(2)
+    with col1:
+        st.bar_chart(by_month["quote_count"])
+    with col2:
+        st.line_chart(trend["Valor"])
+    st.dataframe(trend.sort_index(ascending=False),
+                 column_config={"Valor": st.column_config.NumberColumn("Valor", format="$%.2f"),
+                                "Conversión %": st.column_config.NumberColumn("Conversión %", format="%.0f%%")},
+                 use_container_width=True)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("### 👥 Principales Clientes")
+        if data["clients"]:
+            clients_df = pd.DataFrame(data["clients"])[['company_name', 'quote_count', 'total_value']].rename(columns={
+                'company_name': 'Cliente', 'quote_count': 'Cotizaciones', 'total_value': 'Valor'
+            })
+            st.dataframe(clients_df, column_config={"Valor": st.column_config.NumberColumn("Valor", format="$%.2f")},
+                         hide_index=True, use_container_width=True)
+        else:
+            st.caption("Sin datos")
+    with col2:
+        st.markdown("### 📦 Productos con Mayor Ingreso")
+        if data["products"]:
+            products_df = pd.DataFrame(data["products"])[['product_name', 'quantity', 'revenue']].rename(columns={
+                'product_name': 'Producto', 'quantity': 'Cantidad', 'revenue': 'Ingreso'
+            })
+            st.dataframe(products_df, column_config={"Ingreso": st.column_config.NumberColumn("Ingreso", format="$%.2f")},
+                         hide_index=True, use_container_width=True)
+        else:
+            st.caption("Sin datos")
 
 # ----------------------------
 # PRODUCT MANAGER MODULE
 # ----------------------------
+@st.fragment
+@tracing.traced()
 def show_product_manager():
     st.markdown("---")
     st.markdown("## 📦 Gestión de Productos")
@@ -803,22 +377,23 @@ def show_product_manager():
                 else:
                     st.markdown(f"#### 📊 Vista previa - Total: {len(preview)} registros")
                     st.dataframe(preview, use_container_width=True, height=400)
+                    reprice = st.checkbox("🔁 Actualizar precios en cotizaciones borrador", value=True,
+                                          key="sync_reprice_drafts")
                     col1, col2 = st.columns([1, 3])
                     with col1:
-                        if st.button("✅ Sincronizar Ahora", type="primary", use_container_width=True):
-                            with st.spinner("Sincronizando productos..."):
-                                result, msg = sync_products_from_csv()
-                                if result:
-                                    st.success(msg)
-                                    st.balloons()
-                                    st.session_state.show_csv_sync = False
-                                    st.rerun()
-                                else:
-                                    st.error(msg)
+                        syncing = st.session_state.sync_job_id in st.session_state.active_jobs
+                        if st.button("✅ Sincronizar Ahora", type="primary", use_container_width=True,
+                                     disabled=syncing):
+                            st.session_state.sync_job_id = jobs.submit_job(
+                                "sync_products", {"csv_path": PRODUCTS_CSV_PATH, "reprice_drafts": reprice},
+                                priority=10)
+                            track_job(st.session_state.sync_job_id)
+                            st.session_state.show_csv_sync = False
+                            st.rerun()
                     with col2:
                         if st.button("❌ Cancelar", use_container_width=True):
                             st.session_state.show_csv_sync = False
-                            st.rerun()
+                            rerun_fragment()
             except pd.errors.EmptyDataError:
                 st.error("❌ El archivo CSV está vacío")
             except pd.errors.ParserError:
@@ -833,7 +408,7 @@ def show_product_manager():
                     create_sample_csv()
                     st.success(f"✅ Archivo `{PRODUCTS_CSV_PATH}` creado exitosamente")
                     st.info("📝 Puedes editar este archivo con Excel o cualquier editor de texto")
-                    st.rerun()
+                    rerun_fragment()
                 except Exception as e:
                     st.error(f"❌ Error al crear archivo: {str(e)}")
         st.markdown("---")
@@ -868,7 +443,7 @@ def show_product_manager():
                 cancel = st.form_submit_button("❌ Cancelar", use_container_width=True)
             if cancel:
                 st.session_state.show_add_product = False
-                st.rerun()
+                rerun_fragment()
             if submit:
                 if not name or not name.strip():
                     st.error("❌ El nombre del producto es obligatorio")
@@ -883,7 +458,7 @@ def show_product_manager():
                             st.success(f"✅ Producto '{name}' agregado exitosamente (ID: {new_id})")
                             st.balloons()
                             st.session_state.show_add_product = False
-                            st.rerun()
+                            rerun_fragment()
                         else:
                             st.error(f"❌ Ya existe un producto con el nombre '{name}'")
                     except Exception as e:
@@ -917,6 +492,7 @@ def show_product_manager():
                     format="%.2f",
                     help="Precio por unidad en dólares"
                 )
+                reprice = st.checkbox("🔁 Actualizar precio en cotizaciones borrador", value=True)
                 st.markdown("---")
                 col1, col2 = st.columns(2)
                 with col1:
@@ -925,7 +501,7 @@ def show_product_manager():
                     cancel = st.form_submit_button("❌ Cancelar", use_container_width=True)
                 if cancel:
                     st.session_state.editing_product_id = None
-                    st.rerun()
+                    rerun_fragment()
                 if submit:
                     if not name or not name.strip():
                         st.error("❌ El nombre del producto es obligatorio")
@@ -937,6 +513,9 @@ def show_product_manager():
                         try:
                             success = update_product(product['id'], name, desc, price)
                             if success:
+                                if reprice and price != product['unit_price']:
+                                    track_job(jobs.submit_job("reprice_drafts", {"product_ids": [product['id']]},
+                                                              priority=10))
                                 st.success(f"✅ Producto '{name}' actualizado exitosamente")
                                 st.session_state.editing_product_id = None
                                 st.rerun()
@@ -963,15 +542,17 @@ def show_product_manager():
                         delete_product(st.session_state.confirm_delete_product)
                         del st.session_state.confirm_delete_product
                         st.success(f"✅ Producto '{product['name']}' eliminado exitosamente")
-                        st.rerun()
+                        rerun_fragment()
                     except Exception as e:
                         st.error(f"❌ Error al eliminar: {str(e)}")
             with col2:
                 if st.button("❌ Cancelar", use_container_width=True):
                     del st.session_state.confirm_delete_product
-                    st.rerun()
+                    rerun_fragment()
         st.markdown("---")
     
+    show_pricing_rules()
+    
     # Products List (ONLY ONCE)
     st.markdown("### 📋 Lista de Productos")
     products = get_products_for_dropdown()
@@ -1019,16 +600,244 @@ def show_product_manager():
             selected_idx = event.selection.rows[0]
             st.session_state.selected_product_id = df.iloc[selected_idx]['ID']
         st.info(f"📊 Mostrando {len(filtered_products)} de {len(products)} productos")
+        if st.session_state.get('selected_product_id'):
+            show_price_history(int(st.session_state.selected_product_id))
     else:
         st.warning(f"⚠️ No se encontraron productos con '{search_query}'")
 
+def show_pricing_rules():
+    with st.expander("⚙️ Reglas de precios"):
+        tab_charges, tab_tiers, tab_clients = st.tabs(["Cargos e impuestos", "Descuentos por volumen", "Precios por cliente"])
+        with tab_charges:
+            charges_df = pd.DataFrame(get_pricing_charges(), columns=['key', 'kind', 'label', 'rate', 'sort_order'])
+            charges_df['rate'] = charges_df['rate'] * 100
+            edited = st.data_editor(charges_df, num_rows="dynamic", hide_index=True, use_container_width=True,
+                                    key="pricing_charges_editor",
+                                    column_config={
+                                        "key": "Clave",
+                                        "kind": st.column_config.SelectboxColumn("Tipo", options=["surcharge", "tax"]),
+                                        "label": "Nombre",
+                                        "rate": st.column_config.NumberColumn("Tasa %", min_value=0.0, format="%.2f"),
+                                        "sort_order": st.column_config.NumberColumn("Orden", step=1),
+                                    })
+            if st.button("💾 Guardar cargos", key="save_pricing_charges"):
+                rows = edited.dropna(subset=['key', 'kind', 'label', 'rate']).to_dict('records')
+                if len({r['key'] for r in rows}) != len(rows):
+                    st.error("❌ Las claves deben ser únicas")
+                else:
+                    save_pricing_charges([{**r, 'rate': r['rate'] / 100,
+                                           'sort_order': 0 if pd.isna(r['sort_order']) else int(r['sort_order'])}
+                                          for r in rows])
+                    st.success("✅ Cargos actualizados")
+                    rerun_fragment()
+        products = get_products_for_dropdown()
+        product_ids = {p['name']: p['id'] for p in products}
+        all_products = "(Todos)"
+        with tab_tiers:
+            st.caption("El descuento aplica desde la cantidad mínima; las reglas de un producto reemplazan a las de (Todos).")
+            tiers_df = pd.DataFrame(get_price_tiers(), columns=['product_name', 'min_quantity', 'discount_pct'])
+            tiers_df['product_name'] = tiers_df['product_name'].fillna(all_products)
+            edited = st.data_editor(tiers_df, num_rows="dynamic", hide_index=True, use_container_width=True,
+                                    key="price_tiers_editor",
+                                    column_config={
+                                        "product_name": st.column_config.SelectboxColumn(
+                                            "Producto", options=[all_products] + list(product_ids), default=all_products),
+                                        "min_quantity": st.column_config.NumberColumn("Cantidad mínima", min_value=0.0),
+                                        "discount_pct": st.column_config.NumberColumn("Descuento %", min_value=0.0,
+                                                                                      max_value=100.0, format="%.2f"),
+                                    })
+            if st.button("💾 Guardar descuentos", key="save_price_tiers"):
+                rows = edited.dropna(subset=['min_quantity', 'discount_pct']).to_dict('records')
+                save_price_tiers([{**r, 'product_id': product_ids.get(r['product_name'])} for r in rows])
+                st.success("✅ Descuentos por volumen actualizados")
+                rerun_fragment()
+        with tab_clients:
+            clients = get_all_clients()
+            if not clients:
+                st.info("📭 No hay clientes registrados")
+            else:
+                client_id = st.selectbox("Cliente", options=[c['id'] for c in clients], key="client_prices_client",
+                                         format_func=lambda x: next(c['company_name'] for c in clients if c['id'] == x))
+                prices_df = pd.DataFrame(get_client_prices(client_id), columns=['product_name', 'catalog_price', 'unit_price'])
+                edited = st.data_editor(prices_df, num_rows="dynamic", hide_index=True, use_container_width=True,
+                                        key=f"client_prices_editor_{client_id}", disabled=["catalog_price"],
+                                        column_config={
+                                            "product_name": st.column_config.SelectboxColumn("Producto",
+                                                                                             options=list(product_ids)),
+                                            "catalog_price": st.column_config.NumberColumn("Catálogo", format="$%.2f"),
+                                            "unit_price": st.column_config.NumberColumn("Precio cliente", min_value=0.01,
+                                                                                        format="$%.2f"),
+                                        })
+                if st.button("💾 Guardar precios del cliente", key="save_client_prices"):
+                    rows = edited.dropna(subset=['product_name', 'unit_price'])
+                    save_client_prices(client_id, {product_ids[r['product_name']]: r['unit_price']
+                                                   for r in rows.to_dict('records')})
+                    st.success("✅ Lista de precios actualizada")
+                    rerun_fragment()
+
+def show_price_history(product_id):
+    history = get_price_history(product_id)
+    if not history:
+        return
+    with st.expander(f"📈 Historial de precios ({len(history)} cambios)"):
+        hist_df = pd.DataFrame(history).rename(columns={
+            'valid_from': 'Desde', 'unit_price': 'Precio', 'source': 'Origen'})
+        hist_df['Desde'] = pd.to_datetime(hist_df['Desde'])
+        if len(hist_df) > 1:
+            st.line_chart(hist_df.set_index('Desde')['Precio'])
+        st.dataframe(hist_df, hide_index=True, use_container_width=True,
+                     column_config={"Precio": st.column_config.NumberColumn("Precio", format="$%.2f")})
+        as_of = st.date_input("Precio vigente al", value=datetime.now().date(), key=f"price_asof_{product_id}")
+        price = get_price_as_of(product_id, as_of)
+        st.metric("Precio", f"${price:,.2f}" if price is not None else "—")
+
+# ----------------------------
+# WAREHOUSE ESTIMATOR
+# ----------------------------
+def show_estimator():
+    st.markdown("## 📐 Estimador de Naves")
+    st.caption("Nave a dos aguas; medidas en metros. Los precios salen del catálogo (o de la lista del cliente activo).")
+    prices = estimator.load_prices(client_id=st.session_state.current_client_id)
+    cols = st.columns(4)
+    length = cols[0].number_input("Largo", min_value=1.0, value=60.0, step=1.0, key="est_length")
+    width = cols[1].number_input("Ancho", min_value=1.0, value=25.0, step=1.0, key="est_width")
+    lateral_height = cols[2].number_input("Altura lateral", min_value=1.0, value=7.0, step=0.5, key="est_lateral")
+    roof_height = cols[3].number_input("Altura cumbrera", min_value=1.0, value=9.0, step=0.5, key="est_roof")
+    result = estimator.estimate(length, width, lateral_height, roof_height, prices)
+    rows = [{"Material": label, "Producto": product, "Cantidad": float(result["quantities"][key]),
+             "Precio": prices.get(product), "Costo": float(result["costs"][key])}
+            for key, label, product, _, _ in estimator.DEFAULT_SPEC.materials]
+    st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True,
+                 column_config={"Precio": st.column_config.NumberColumn("Precio", format="$%.2f"),
+                                "Costo": st.column_config.NumberColumn("Costo", format="$%.2f")})
+    c1, c2 = st.columns(2)
+    c1.metric("Costo de materiales", f"${float(result['total']):,.2f}")
+    c2.metric("Costo por m²", f"${float(result['total']) / (length * width):,.2f}")
+    items, missing = estimator.quote_items(length, width, lateral_height, roof_height, prices)
+    if missing:
+        st.warning("⚠️ Productos no encontrados en el catálogo: " + ", ".join(missing))
+    if st.button("➕ Agregar a la cotización", type="primary", disabled=not items):
+        st.session_state.quote_lines.extend(items)
+        st.session_state.show_estimator = False
+        st.success(f"✅ {len(items)} partidas agregadas")
+        st.rerun()
+
+    with st.expander("📈 Análisis de variantes"):
+        c1, c2 = st.columns(2)
+        lengths = c1.slider("Largo (m)", 10, 200, (30, 90), key="sweep_length")
+        widths = c2.slider("Ancho (m)", 5, 80, (15, 40), key="sweep_width")
+        lateral = c1.slider("Altura lateral (m)", 3.0, 15.0, (6.0, 8.0), 0.5, key="sweep_lateral")
+        roof = c2.slider("Altura cumbrera (m)", 3.0, 20.0, (8.0, 10.0), 0.5, key="sweep_roof")
+        step = st.number_input("Paso de largo y ancho (m)", min_value=0.5, value=1.0, step=0.5, key="sweep_step")
+        axes = (np.arange(lengths[0], lengths[1] + step / 2, step),
+                np.arange(widths[0], widths[1] + step / 2, step),
+                np.arange(lateral[0], lateral[1] + 0.25, 0.5),
+                np.arange(roof[0], roof[1] + 0.25, 0.5))
+        size = estimator.sweep_size(*axes)
+        too_big = size > estimator.SWEEP_MAX_VARIANTS
+        if too_big:
+            st.warning(f"⚠️ {size:,} combinaciones superan el límite de {estimator.SWEEP_MAX_VARIANTS:,}; "
+                       "reduzca los rangos o aumente el paso")
+        # Results are kept until a range, the step or the active client changes
+        sweep_key = (lengths, widths, lateral, roof, step, st.session_state.current_client_id)
+        if st.button(f"▶️ Evaluar {size:,} combinaciones", disabled=too_big, key="run_sweep"):
+            variants = estimator.sweep(*axes, prices)
+            st.session_state.sweep_result = (sweep_key, variants[variants["roof_height"] >= variants["lateral_height"]])
+        stored = st.session_state.get("sweep_result")
+        if not stored or stored[0] != sweep_key:
+            return
+        variants = stored[1]
+        st.caption(f"{len(variants):,} variantes evaluadas")
+        if variants.empty:
+            return
+        st.markdown("**Costo por m² según largo** (mejor combinación de alturas para cada ancho)")
+        curve = variants.pivot_table(index="length", columns="width", values="cost_per_m2", aggfunc="min")
+        st.line_chart(curve[curve.columns[::max(1, len(curve.columns) // 8)]])
+        st.markdown("**Variantes más económicas por m²**")
+        st.dataframe(variants.nsmallest(10, "cost_per_m2")[list(estimator.DIMENSIONS) + ["floor_area", "total", "cost_per_m2"]],
+                     hide_index=True, use_container_width=True,
+                     column_config={"total": st.column_config.NumberColumn("Total", format="$%.2f"),
+                                    "cost_per_m2": st.column_config.NumberColumn("Costo/m²", format="$%.2f")})
+
 # ----------------------------
 # QUOTE MANAGEMENT MODULES
 # ----------------------------
-def show_saved_quotes():
-    if not st.session_state.current_client_id:
-        st.warning("⚠️ Seleccione un cliente primero para ver sus cotizaciones")
+def show_quote_history(quote_id):
+    st.markdown(f"### 🕰️ Historial de {quote_id}")
+    versions = list_quote_history(quote_id)
+    if not versions:
+        st.info("📭 Esta cotización no tiene versiones anteriores")
+        if st.button("❌ Cerrar Historial", key="close_history"):
+            st.session_state.viewing_history_for = None
+            rerun_fragment()
         return
+    hist_df = pd.DataFrame(versions)[['version', 'snapshot_date', 'item_count', 'total_amount']].rename(columns={
+        'version': 'Versión', 'snapshot_date': 'Fecha', 'item_count': 'Líneas', 'total_amount': 'Total'
+    })
+    st.dataframe(hist_df, column_config={"Total": st.column_config.NumberColumn("Total", format="$%.2f")},
+                 hide_index=True, use_container_width=True)
+    version_numbers = [v['version'] for v in versions]
+    col1, col2 = st.columns(2)
+    with col1:
+        from_version = st.selectbox("Desde versión", version_numbers, key="history_from")
+    with col2:
+        to_version = st.selectbox("Hasta", [None] + version_numbers,
+                                  format_func=lambda v: "Actual" if v is None else f"Versión {v}",
+                                  key="history_to")
+    diff = diff_quote_versions(quote_id, from_version, to_version)
+    if diff is None:
+        st.error("❌ No se pudo cargar la versión seleccionada")
+    else:
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("Agregadas", len(diff['added']))
+        c2.metric("Eliminadas", len(diff['removed']))
+        c3.metric("Modificadas", len(diff['changed']))
+        c4.metric("Sin cambios", diff['unchanged'])
+        for field, (old, new) in diff['quote'].items():
+            st.write(f"**{field}:** {old} → {new}")
+        rows = [{"Cambio": "➕", "Producto": i['product_name'], "Detalle": f"{i['quantity']} × ${i['unit_price']:,.2f}"}
+                for i in diff['added']]
+        rows += [{"Cambio": "➖", "Producto": i['product_name'], "Detalle": f"{i['quantity']} × ${i['unit_price']:,.2f}"}
+                 for i in diff['removed']]
+        rows += [{"Cambio": "✏️", "Producto": c['product_name'],
+                  "Detalle": ", ".join(f"{f}: {old} → {new}" for f, (old, new) in c['changes'].items())}
+                 for c in diff['changed']]
+        if rows:
+            st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+        else:
+            st.success("✅ Sin diferencias en las líneas")
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button(f"⏪ Restaurar versión {from_version}", key="restore_history", use_container_width=True):
+            st.session_state.confirm_restore = from_version
+    with col2:
+        if st.button("❌ Cerrar Historial", key="close_history", use_container_width=True):
+            st.session_state.viewing_history_for = None
+            rerun_fragment()
+    if st.session_state.get('confirm_restore') == from_version:
+        st.warning(f"⚠️ ¿Restaurar {quote_id} a la versión {from_version}? El estado actual se guardará en el historial.")
+        col_a, col_b = st.columns(2)
+        with col_a:
+            if st.button("✅ Sí, Restaurar", key="conf_restore", type="primary", use_container_width=True):
+                if restore_quote_version(quote_id, from_version):
+                    st.success(f"✅ {quote_id} restaurada a la versión {from_version}")
+                else:
+                    st.error("❌ No se pudo restaurar la versión")
+                del st.session_state.confirm_restore
+                rerun_fragment()
+        with col_b:
+            if st.button("❌ Cancelar", key="canc_restore", use_container_width=True):
+                del st.session_state.confirm_restore
+                rerun_fragment()
+    st.markdown("---")
+
+@st.fragment
+@tracing.traced()
+def show_saved_quotes(client):
+    """Search, filters and actions rerun only this list; the client comes from the last full run."""
+    
+    if st.session_state.viewing_history_for:
+        show_quote_history(st.session_state.viewing_history_for)
     
     # Search & Filters
     search = st.text_input("🔍 Buscar", value=st.session_state.global_search_query, key="search")
@@ -1042,11 +851,33 @@ def show_saved_quotes():
             if st.button("🧹 Limpiar"):
                 st.session_state.filter_status = "All"
                 st.session_state.global_search_query = ""
-                st.rerun()
+                rerun_fragment()
         st.session_state.filter_status = status
     
     # Get and filter quotes
-    all_quotes = get_all_quotes_for_client(st.session_state.current_client_id)
+    all_quotes = get_all_quotes_for_client(client['id'])
+    if all_quotes:
+        col1, col2 = st.columns([3, 1])
+        with col2:
+            show_job_download("export_quotes", {"client_id": client['id']},
+                              f"export:{client['id']}:{content_key(all_quotes)}",
+                              "📥 Exportar Excel", "cotizaciones.xlsx", "export_quotes")
+        drafts = [q['quote_id'] for q in all_quotes if q['status'] == "Draft"]
+        if drafts:
+            with st.expander("🧾 Facturación en lote"):
+                selected = st.multiselect("Cotizaciones a facturar", drafts, key="bulk_invoice_ids")
+                prerender = st.checkbox("📄 Generar PDFs de las facturas", value=True, key="bulk_invoice_pdfs")
+                if st.button(f"🖨️ Convertir {len(selected)} a Factura", disabled=not selected,
+                             type="primary", key="bulk_invoice"):
+                    converted = convert_quotes_to_invoices(selected)
+                    if prerender:
+                        for invoice_id in converted.values():
+                            quote_data, items = get_quote_by_id(invoice_id)
+                            jobs.submit_job("render_pdf", {"quote_id": invoice_id}, priority=1,
+                                            dedupe_key=pdf_job_key(quote_data, items, client))
+                    st.session_state.job_notices.append(("success", f"✅ {len(converted)} facturas creadas"))
+                    st.session_state.pop("bulk_invoice_ids", None)
+                    st.rerun()
     filtered = []
     for q in all_quotes:
         if st.session_state.filter_status != "All" and q['status'] != st.session_state.filter_status:
@@ -1067,12 +898,8 @@ def show_saved_quotes():
             with st.expander(f"{q['quote_id']} - {q['project_name']} (${q['total_amount']:,.2f}) - {q['status']}"):
                 st.write(f"**Fecha:** {q['date']}")
                 quote_data, items = get_quote_by_id(q["quote_id"])
-                client_data = get_client_by_id(st.session_state.current_client_id)
-                try:
-                    charges = ast.literal_eval(quote_data["included_charges"])
-                except:
-                    charges = {k: True for k in ['supervision','admin','insurance','transport','contingency']}
-                totals = calculate_quote(items, charges)
+                charges = parse_included_charges(quote_data["included_charges"])
+                pdf_key = pdf_job_key(quote_data, items, client)
                 # Items table
                 if items:
                     items_df = pd.DataFrame(items)[['product_name', 'quantity', 'unit_price']]
@@ -1082,9 +909,10 @@ def show_saved_quotes():
                     col1, col2, col3, col4 = st.columns(4)
                     with col1:
                         if st.button("✏️ Editar", key=f"edit_{q['quote_id']}", use_container_width=True):
+                            reset_quote_form()
                             st.session_state.editing_quote_id = q['quote_id']
                             st.session_state.editing_quote_data = quote_data
-                            st.session_state.quote_products = items
+                            st.session_state.quote_lines = QuoteLines(items, get_pricing_rules())
                             st.session_state.included_charges = charges
                             st.rerun()
                     with col2:
@@ -1092,23 +920,14 @@ def show_saved_quotes():
                             new_id = duplicate_quote(q['quote_id'])
                             if new_id:
                                 st.success(f"✅ Duplicado: {new_id}")
-                                st.rerun()
+                                rerun_fragment()
                     with col3:
                         if st.button("🕰️ Historial", key=f"hist_{q['quote_id']}", use_container_width=True):
                             st.session_state.viewing_history_for = q['quote_id']
-                            st.rerun()
+                            rerun_fragment()
                     with col4:
-                        pdf = QuotePDF()
-                        pdf.add_page()
-                        pdf.quote_info(quote_data, client_data)
-                        pdf.items_table(items)
-                        pdf.cost_summary(totals, charges)
-                        if quote_data.get('notes'):
-                            pdf.notes_section(quote_data['notes'])
-                        raw = pdf.output(dest="S")
-                        pdf_bytes = raw.encode("latin-1") if isinstance(raw, str) else bytes(raw)
-                        st.download_button("📄 PDF", pdf_bytes, f"{q['quote_id']}_cotizacion.pdf",
-                                           "application/pdf", use_container_width=True, key=f"dl_{q['quote_id']}")
+                        show_job_download("render_pdf", {"quote_id": q['quote_id']}, pdf_key, "📄 PDF",
+                                          f"{q['quote_id']}_cotizacion.pdf", f"dl_{q['quote_id']}", priority=5)
                     st.markdown("---")
                     if st.button("🖨️ Convertir a Factura", key=f"inv_{q['quote_id']}", use_container_width=True):
                         st.session_state.confirm_convert = q["quote_id"]
@@ -1120,11 +939,11 @@ def show_saved_quotes():
                                 new_id = update_quote_status(q["quote_id"], "Invoiced")
                                 st.success(f"✅ Factura: {new_id}")
                                 del st.session_state.confirm_convert
-                                st.rerun()
+                                rerun_fragment()
                         with col_b:
                             if st.button("❌ No", key=f"canc_{q['quote_id']}"):
                                 del st.session_state.confirm_convert
-                                st.rerun()
+                                rerun_fragment()
                     if st.button(f"🗑️ Eliminar", key=f"del_{q['quote_id']}", type="secondary"):
                         st.session_state.confirm_delete_quote = q["quote_id"]
                     if st.session_state.get('confirm_delete_quote') == q["quote_id"]:
@@ -1135,23 +954,14 @@ def show_saved_quotes():
                                 delete_quote(q["quote_id"])
                                 del st.session_state.confirm_delete_quote
                                 st.success("Eliminado")
-                                st.rerun()
+                                rerun_fragment()
                         with col_b:
                             if st.button("❌ Cancelar", key=f"xdel_{q['quote_id']}"):
                                 del st.session_state.confirm_delete_quote
-                                st.rerun()
+                                rerun_fragment()
                 elif q["status"] == "Invoiced":
-                    pdf = InvoicePDF()
-                    pdf.add_page()
-                    pdf.quote_info(quote_data, client_data)
-                    pdf.items_table(items)
-                    pdf.cost_summary(totals, charges)
-                    if quote_data.get('notes'):
-                        pdf.notes_section(quote_data['notes'])
-                    raw = pdf.output(dest="S")
-                    pdf_bytes = raw.encode("latin-1") if isinstance(raw, str) else bytes(raw)
-                    st.download_button("📥 Descargar Factura", pdf_bytes, f"{q['quote_id']}_factura.pdf",
-                                       "application/pdf", use_container_width=True, key=f"dl_inv_{q['quote_id']}")
+                    show_job_download("render_pdf", {"quote_id": q['quote_id']}, pdf_key, "📥 Descargar Factura",
+                                      f"{q['quote_id']}_factura.pdf", f"dl_inv_{q['quote_id']}", priority=5)
                     if st.button(f"🗑️ Eliminar Factura", key=f"del_inv_{q['quote_id']}", type="secondary"):
                         st.session_state.confirm_delete_invoice = q["quote_id"]
                     if st.session_state.get('confirm_delete_invoice') == q["quote_id"]:
@@ -1162,37 +972,49 @@ def show_saved_quotes():
                                 delete_quote(q["quote_id"])
                                 del st.session_state.confirm_delete_invoice
                                 st.success("Eliminado")
-                                st.rerun()
+                                rerun_fragment()
                         with col_b:
                             if st.button("❌ Cancelar", key=f"xdel_inv_{q['quote_id']}"):
                                 del st.session_state.confirm_delete_invoice
-                                st.rerun()
+                                rerun_fragment()
     else:
         st.info("📭 No hay cotizaciones que coincidan con los filtros")
 
-def show_quote_form():
+def reset_quote_form():
+    """Empty the quote being built (or edited), including its project and notes inputs."""
+    st.session_state.quote_lines = QuoteLines()
+    st.session_state.editing_quote_id = None
+    st.session_state.editing_quote_data = None
+    for key in ("quote_project_name", "quote_notes"):
+        st.session_state.pop(key, None)
+
+@st.fragment
+@tracing.traced()
+def show_quote_form(client):
+    """Quote editor: project info, line items and the totals panel.
+
+    Adding or editing lines reruns only this fragment; the charges and save buttons live in
+    the nested show_quote_totals fragment. Saving reruns the app so the saved list updates.
+    """
     st.markdown("Información de la Cotización")
     if st.session_state.editing_quote_id:
         st.info(f"✏️ Editando: {st.session_state.editing_quote_id}")
         if st.button("❌ Cancelar Edición"):
-            st.session_state.editing_quote_id = None
-            st.session_state.editing_quote_data = None
-            st.session_state.quote_products = []
+            reset_quote_form()
             st.rerun()
     
-    # Project info
+    # Project info; kept under session keys so the totals fragment can save them
+    editing = st.session_state.editing_quote_data or {}
+    st.session_state.setdefault("quote_project_name", editing.get('project_name', ''))
+    st.session_state.setdefault("quote_notes", editing.get('notes', ''))
     col1, col2 = st.columns(2)
     with col1:
-        if st.session_state.current_client_id:
-            client = get_client_by_id(st.session_state.current_client_id)
-            client_name = st.text_input("Cliente", value=client['company_name'], disabled=True)
-        else:
-            client_name = st.text_input("Cliente", placeholder="Seleccione cliente")
+        st.text_input("Cliente", value=client['company_name'], disabled=True)
     with col2:
-        default_project = st.session_state.editing_quote_data.get('project_name', '') if st.session_state.editing_quote_data else ''
-        project_name = st.text_input("Proyecto", value=default_project)
-    default_notes = st.session_state.editing_quote_data.get('notes', '') if st.session_state.editing_quote_data else ''
-    notes = st.text_area("Notas", value=default_notes)
+        st.text_input("Proyecto", key="quote_project_name")
+    st.text_area("Notas", key="quote_notes")
+    
+    rules = get_pricing_rules()
     
     # Add products
     st.markdown("Agregar Producto")
@@ -1218,11 +1040,12 @@ def show_quote_form():
                 disc_type, disc_val = "none", 0.0
         if st.button("➕ Agregar desde Catálogo"):
             if qty > 0:
-                st.session_state.quote_products.append({
-                    "product_name": prod["name"], "quantity": qty, "unit_price": prod["unit_price"],
+                unit_price = rules.unit_price(prod["name"], client['id'], prod["unit_price"])
+                st.session_state.quote_lines.append({
+                    "product_name": prod["name"], "quantity": qty, "unit_price": unit_price,
                     "discount_type": disc_type, "discount_value": disc_val
                 })
-                st.rerun()
+                rerun_fragment()
     
     # Manual entry
     with st.form("manual_product"):
@@ -1232,46 +1055,49 @@ def show_quote_form():
         qty_m = col2.number_input("Cantidad", min_value=0.0, step=1.0)
         price = col3.number_input("Precio", min_value=0.0, step=0.01)
         if st.form_submit_button("➕ Agregar Manual") and name and qty_m > 0 and price > 0:
-            st.session_state.quote_products.append({
+            st.session_state.quote_lines.append({
                 "product_name": name, "quantity": qty_m, "unit_price": price,
                 "discount_type": "none", "discount_value": 0
             })
-            st.rerun()
+            rerun_fragment()
     
-    # Display products
-    if st.session_state.quote_products:
-        for p in st.session_state.quote_products:
-            p['discount_amount'] = calculate_item_discount(p.get('unit_price', 0), p.get('quantity', 0),
-                                                          p.get('discount_type', 'none'), p.get('discount_value', 0))
-            p['subtotal'] = (p.get('quantity', 0) * p.get('unit_price', 0)) - p['discount_amount']
-        df = pd.DataFrame(st.session_state.quote_products)
-        edited = st.data_editor(df,
-                                column_config={
-                                    "product_name": "Producto",
-                                    "quantity": st.column_config.NumberColumn("Cant.", format="%.2f"),
-                                    "unit_price": st.column_config.NumberColumn("Precio", format="$%.2f"),
-                                    "discount_type": st.column_config.SelectboxColumn("Desc.Tipo", options=["none", "percentage", "fixed"]),
-                                    "discount_value": st.column_config.NumberColumn("Desc.Val", format="%.2f"),
-                                    "discount_amount": st.column_config.NumberColumn("Desc.$", format="$%.2f"),
-                                    "subtotal": st.column_config.NumberColumn("Total", format="$%.2f")
-                                },
-                                hide_index=True,
-                                use_container_width=True,
-                                num_rows="dynamic",
-                                key="products_editor"
-                                )
-        st.session_state.quote_products = edited.to_dict('records')
+    # Display products; the editor's changes are applied to the lines row by row in on_change
+    lines = st.session_state.quote_lines
+    lines.set_rules(rules)
+    if lines:
+        st.data_editor(lines.to_frame(),
+                       column_config={
+                           "product_name": "Producto",
+                           "quantity": st.column_config.NumberColumn("Cant.", format="%.2f"),
+                           "unit_price": st.column_config.NumberColumn("Precio", format="$%.2f"),
+                           "discount_type": st.column_config.SelectboxColumn("Desc.Tipo", options=["none", "percentage", "fixed"]),
+                           "discount_value": st.column_config.NumberColumn("Desc.Val", format="%.2f"),
+                           "discount_amount": st.column_config.NumberColumn("Desc.$", format="$%.2f"),
+                           "subtotal": st.column_config.NumberColumn("Total", format="$%.2f")
+                       },
+                       column_order=LINE_EDITOR_COLUMNS,
+                       disabled=["discount_amount", "subtotal"],
+                       hide_index=True,
+                       use_container_width=True,
+                       num_rows="dynamic",
+                       key="products_editor",
+                       on_change=apply_line_edits
+                       )
     
-    # Charges
+    show_quote_totals(client, rules)
+
+def apply_line_edits():
+    st.session_state.quote_lines.apply_editor_changes(st.session_state.products_editor)
+
+@st.fragment
+def show_quote_totals(client, rules):
+    """Charges, summary and save buttons; toggling a charge reruns only this panel."""
     st.markdown("### ⚙️ Cargos Adicionales")
-    cols = st.columns(5)
+    cols = st.columns(max(len(rules.surcharges), 1))
     charges = st.session_state.included_charges
-    charges['supervision'] = cols[0].checkbox("Supervisión (10%)", value=charges['supervision'])
-    charges['admin'] = cols[1].checkbox("Admin (4%)", value=charges['admin'])
-    charges['insurance'] = cols[2].checkbox("Seguro (1%)", value=charges['insurance'])
-    charges['transport'] = cols[3].checkbox("Transporte (3%)", value=charges['transport'])
-    charges['contingency'] = cols[4].checkbox("Imprevisto (3%)", value=charges['contingency'])
-    totals = calculate_quote(st.session_state.quote_products, charges)
+    for col, (key, label, rate) in zip(cols, rules.surcharges):
+        charges[key] = col.checkbox(rate_label(label, rate), value=charges.get(key, True))
+    totals = st.session_state.quote_lines.totals(charges)
     
     # Summary
     st.markdown("### 💰 Resumen")
@@ -1282,7 +1108,8 @@ def show_quote_form():
             st.metric("Descuentos", f"-${totals['total_discounts']:,.2f}")
     with c2:
         st.metric("Subtotal", f"${totals['subtotal_general']:,.2f}")
-        st.metric("ITBIS (18%)", f"${totals['itbis']:,.2f}")
+        for tax in totals['taxes']:
+            st.metric(tax['label'], f"${tax['amount']:,.2f}")
     with c3:
         st.markdown(f"""
         <div style="background:rgba(18,18,36,0.7); padding:1rem; border-radius:16px; text-align:center;">
@@ -1292,52 +1119,29 @@ def show_quote_form():
         """, unsafe_allow_html=True)
     
     # Save/Clear buttons
+    project_name = st.session_state.get("quote_project_name", "")
+    notes = st.session_state.get("quote_notes", "")
     col1, col2 = st.columns(2)
     with col1:
         btn_text = "💾 Actualizar" if st.session_state.editing_quote_id else "💾 Guardar"
         if st.button(btn_text, type="primary", use_container_width=True):
-            if not st.session_state.current_client_id:
-                st.error("Seleccione un cliente")
-                return
             if st.session_state.editing_quote_id:
-                # Save snapshot before update
-                current_quote, current_items = get_quote_by_id(st.session_state.editing_quote_id)
-                if current_quote:
-                    save_quote_snapshot(st.session_state.editing_quote_id,
-                                        {"quote": current_quote, "items": current_items})
-                # Update
-                with get_db_connection() as conn:
-                    cur = conn.cursor()
-                    cur.execute("""UPDATE quotes SET project_name = ?, notes = ?, total_amount = ?,
-                                included_charges = ? WHERE quote_id = ?""",
-                                (project_name, notes, totals['grand_total'], str(charges),
-                                 st.session_state.editing_quote_id))
-                    cur.execute("DELETE FROM quote_items WHERE quote_id = ?",
-                                (st.session_state.editing_quote_id,))
-                    for item in st.session_state.quote_products:
-                        cur.execute("""INSERT INTO quote_items (quote_id, product_name, quantity, unit_price,
-                                    discount_type, discount_value, auto_imported) VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                                    (st.session_state.editing_quote_id, item["product_name"], item["quantity"],
-                                     item["unit_price"], item.get("discount_type", "none"),
-                                     item.get("discount_value", 0), 0))
-                    conn.commit()
+                # Snapshot the stored version and update in one transaction
+                update_quote(st.session_state.editing_quote_id, project_name, st.session_state.quote_lines.to_items(),
+                             totals['grand_total'], notes, charges, snapshot=True)
                 st.success(f"✅ Actualizado: {st.session_state.editing_quote_id}")
-                st.session_state.editing_quote_id = None
-                st.session_state.editing_quote_data = None
-                st.session_state.quote_products = []
+                reset_quote_form()
                 st.rerun()
             else:
                 # New quote
-                quote_id = save_quote_to_db(st.session_state.current_client_id, project_name,
-                                            st.session_state.quote_products, totals['grand_total'], notes, charges)
+                quote_id = save_quote_to_db(client['id'], project_name,
+                                            st.session_state.quote_lines.to_items(), totals['grand_total'], notes, charges)
                 st.success(f"✅ Guardado: {quote_id}")
-                st.session_state.quote_products = []
+                reset_quote_form()
                 st.rerun()
         with col2:
             if st.button("🔄 Limpiar", use_container_width=True):
-                st.session_state.quote_products = []
-                st.session_state.editing_quote_id = None
-                st.session_state.editing_quote_data = None
+                reset_quote_form()
                 st.rerun()
             else:
              st.info("👆 Agregue productos")
@@ -1351,10 +1155,11 @@ def init_session_state():
         'attempts': 0,
         'username': "",
         'current_client_id': None,
-        'quote_products': [],
-        'included_charges': {'supervision': True, 'admin': True, 'insurance': True, 'transport': True, 'contingency': True},
+        'quote_lines': QuoteLines(),
+        'included_charges': {},
         'show_product_manager': False,
         'show_reports': False,  # ← ADDED
+        'show_estimator': False,
         'editing_product_id': None,
         'editing_quote_id': None,
         'editing_quote_data': None,
@@ -1362,6 +1167,9 @@ def init_session_state():
         'global_search_query': "",
         'filter_status': "All",
         'editing_client_id': None,
+        'active_jobs': set(),
+        'job_notices': [],
+        'sync_job_id': None,
     }
     for k, v in defaults.items():
         if k not in st.session_state:
@@ -1374,8 +1182,9 @@ def show_login_page():
     # Logo (centered)
     col1, col2, col3 = st.columns([1, 2, 1])
     with col1:
-        if os.path.exists("logo.png"):
-            st.image("logo.png", width=120)  # Adjust width as needed
+        logo = assets.get("logo.ui")
+        if logo:
+            st.image(logo, width=120)
         else:
             st.markdown('<div style="font-size:72px; text-align:center;">🏗️</div>', unsafe_allow_html=True)
     st.markdown(
@@ -1406,6 +1215,7 @@ def show_login_page():
 # ----------------------------
 # MAIN APP
 # ----------------------------
+@tracing.traced()
 def show_main_app():
     # Sidebar
     with st.sidebar:
@@ -1488,10 +1298,21 @@ def show_main_app():
             st.session_state.show_product_manager = not st.session_state.show_product_manager
         if st.button("📊 Reportes", use_container_width=True):  # ← BUTTON ADDED
             st.session_state.show_reports = not st.session_state.get('show_reports', False)
+        if st.button("📐 Estimador de Naves", use_container_width=True):
+            st.session_state.show_estimator = not st.session_state.show_estimator
+        if st.session_state.username in TRACE_ADMINS:
+            st.toggle("⏱️ Trazas de rendimiento", key="trace_rerun",
+                      help=f"Muestra dónde se va el tiempo de cada recarga y lo guarda en {tracing.TRACE_FILE}")
+            with st.expander("🧠 Memoria de la sesión"):
+                show_session_memory()
         if st.button("❌ Cerrar Sesión", use_container_width=True):
             for key in list(st.session_state.keys()):
                 del st.session_state[key]
             st.rerun()
+        if st.session_state.active_jobs:
+            st.markdown("---")
+            show_job_monitor()
+    show_job_notices()
     
     # Header
     st.markdown("""
@@ -1534,6 +1355,10 @@ def show_main_app():
         show_product_manager()
         return  # ← EXIT EARLY
     
+    if st.session_state.show_estimator:
+        show_estimator()
+        return
+    
     # Client Info Banner
     if st.session_state.current_client_id:
         client = get_client_by_id(st.session_state.current_client_id)
@@ -1556,20 +1381,30 @@ def show_main_app():
     
     st.divider()
     # Quote Form & Saved Quotes
-    show_quote_form()
+    show_quote_form(client)
     st.markdown("### 📂 Cotizaciones Guardadas")
-    show_saved_quotes()
+    show_saved_quotes(client)
 
 # ----------------------------
 # ENTRY POINT
 # ----------------------------
 def main():
+    init_storage()
+    start_metrics_exporter()
+    start_job_workers()
     # Initialize session state FIRST
     init_session_state()
-    # Load external CSS if exists
-    if os.path.exists("style.css"):
-        load_css("style.css")
-    # Route
+    if not tracing_enabled():
+        with profiling.profile("rerun"):
+            route()
+        return
+    with profiling.profile("rerun"), tracing.trace("rerun", user=st.session_state.username) as rerun:
+        route()
+    # Not reached after st.stop()/st.rerun(); those traces are still written to the trace file
+    show_trace_panel(rerun)
+
+def route():
+    load_css()
     if not st.session_state.authenticated:
         show_login_page()
     else:
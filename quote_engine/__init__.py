@@ -0,0 +1,10 @@
+"""Headless quote engine behind the METPRO ERP Streamlit app.
+
+Import the submodules directly; none of them needs Streamlit:
+
+    from quote_engine import storage, pricing
+    from quote_engine.pdf import QuotePDF       # imports fpdf
+    from quote_engine import analytics          # imports pandas when queried
+
+Nothing touches the database until storage.init_db() is called.
+"""
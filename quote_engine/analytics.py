@@ -0,0 +1,131 @@
+"""SQL-side aggregations over quote_items.
+
+Every function takes an open sqlite3 connection (see storage.get_db_connection) and runs a
+single GROUP BY query; results come back as pandas DataFrames. The connection is only read
+from; product links and aliases are written through storage.execute_write.
+"""
+import difflib
+import unicodedata
+
+from . import storage
+from .storage import line_net_sql
+
+LINE_NET_SQL = line_net_sql("i")
+
+DIMENSIONS = {
+    "product": ["COALESCE(i.product_id, -1) AS product_id", "COALESCE(p.name, i.product_name) AS product"],
+    "client": ["q.client_id AS client_id", "COALESCE(c.company_name, '#' || q.client_id) AS client"],
+    "month": ["substr(q.date, 1, 7) AS month"],
+    "quarter": ["substr(q.date, 1, 4) || '-Q' || ((CAST(substr(q.date, 6, 2) AS INTEGER) + 2) / 3) AS quarter"],
+    "year": ["substr(q.date, 1, 4) AS year"],
+    "status": ["q.status AS status"],
+}
+
+MEASURES = f"""
+    COUNT(DISTINCT q.quote_id) AS quote_count,
+    COUNT(*) AS line_count,
+    SUM(i.quantity) AS quantity,
+    SUM(i.quantity * i.unit_price) AS gross,
+    SUM({LINE_NET_SQL}) AS net"""
+MEASURE_NAMES = ("quote_count", "line_count", "quantity", "gross", "net")
+
+def product_key(name):
+    """Normalize a free-text product name: no accents, case or repeated whitespace."""
+    text = unicodedata.normalize("NFKD", str(name or ""))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.casefold().split())
+
+def _catalog_keys(conn):
+    keys = {product_key(name): pid for pid, name in conn.execute("SELECT id, name FROM products")}
+    keys.update({product_key(alias): pid for alias, pid in
+                 conn.execute("SELECT alias, product_id FROM product_aliases")})
+    return keys
+
+def resolve_product_ids(conn):
+    """Link quote lines that have no product_id yet to a catalog product by normalized name.
+
+    Lines are resolved once, so later renames in the catalog do not split a product's history.
+    Returns the number of lines linked.
+    """
+    names = [r[0] for r in conn.execute(
+        "SELECT DISTINCT product_name FROM quote_items WHERE product_id IS NULL")]
+    if not names:
+        return 0
+    keys = _catalog_keys(conn)
+    matches = [(keys[product_key(n)], n) for n in names if product_key(n) in keys]
+    if not matches:
+        return 0
+    return storage.execute_write(lambda cur: cur.executemany(
+        "UPDATE quote_items SET product_id = ? WHERE product_id IS NULL AND product_name = ?", matches).rowcount)
+
+def add_product_alias(conn, alias, product_id):
+    """Map an extra spelling to a catalog product and link any matching quote lines."""
+    storage.execute_write(lambda cur: cur.execute(
+        "INSERT OR REPLACE INTO product_aliases (alias, product_id) VALUES (?, ?)", (product_key(alias), product_id)))
+    return resolve_product_ids(conn)
+
+def unmatched_products(conn, cutoff=0.8):
+    """Product names on quote lines that match no catalog product, with the closest catalog name."""
+    import pandas as pd
+
+    df = pd.read_sql_query("""
+        SELECT product_name, COUNT(*) AS line_count, SUM(quantity * unit_price) AS gross
+        FROM quote_items WHERE product_id IS NULL
+        GROUP BY product_name ORDER BY gross DESC
+    """, conn)
+    catalog = {product_key(name): name for (name,) in conn.execute("SELECT name FROM products")}
+    suggestions = []
+    for name in df["product_name"]:
+        close = difflib.get_close_matches(product_key(name), list(catalog), n=1, cutoff=cutoff)
+        suggestions.append(catalog[close[0]] if close else None)
+    df["suggestion"] = suggestions
+    return df
+
+def aggregate_quote_items(conn, by=("product",), start=None, end=None, status=None, client_id=None,
+                          order_by="net", limit=None):
+    """Group quote lines by any of DIMENSIONS and return quote/line counts, quantity, gross and net.
+
+    start and end are inclusive "YYYY-MM-DD" bounds on the quote date. For example
+    aggregate_quote_items(conn, by=("quarter", "product")) answers which products sell most per quarter.
+    """
+    import pandas as pd
+
+    by = [by] if isinstance(by, str) else list(by)
+    unknown = [d for d in by if d not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown dimension(s): {', '.join(unknown)}")
+    if "product" in by:
+        resolve_product_ids(conn)
+    columns = [col for d in by for col in DIMENSIONS[d]]
+    group_cols = [col.rsplit(" AS ", 1)[1] for col in columns]
+    if order_by and order_by not in MEASURE_NAMES + tuple(group_cols):
+        raise ValueError(f"Unknown order_by column: {order_by}")
+    where, params = [], []
+    for clause, value in (("q.date >= ?", start), ("q.date <= ?", end),
+                          ("q.status = ?", status), ("q.client_id = ?", client_id)):
+        if value is not None:
+            where.append(clause)
+            params.append(value)
+    sql = f"""
+        SELECT {", ".join(columns + [MEASURES])}
+        FROM quote_items i
+        JOIN quotes q ON q.quote_id = i.quote_id
+        {"LEFT JOIN products p ON p.id = i.product_id" if "product" in by else ""}
+        {"LEFT JOIN clients c ON c.id = q.client_id" if "client" in by else ""}
+        {"WHERE " + " AND ".join(where) if where else ""}
+        {"GROUP BY " + ", ".join(group_cols) if group_cols else ""}
+    """
+    sort = [f"{order_by} DESC"] if order_by else []
+    if any(d in by for d in ("month", "quarter", "year")):
+        sort.insert(0, next(d for d in ("month", "quarter", "year") if d in by))
+    if sort:
+        sql += " ORDER BY " + ", ".join(sort)
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return pd.read_sql_query(sql, conn, params=params)
+
+def top_products_by_period(conn, period="quarter", n=10, **filters):
+    """The n best-selling products (by net value) within each month, quarter or year."""
+    df = aggregate_quote_items(conn, by=(period, "product"), **filters)
+    return df.groupby(period, sort=True, group_keys=False).head(n).reset_index(drop=True)
@@ -0,0 +1,141 @@
+"""Static assets (stylesheet, logo) loaded once per process and shared by every session and PDF.
+
+    css = assets.get("style.css")          # str, or None when the file is missing
+    png = assets.get("logo.ui")            # logo scaled for the login page
+    info = assets.get("logo.pdf")          # logo pre-parsed for fpdf (QuotePDF.draw_logo)
+
+Each asset is built from a file under RIGC_ASSET_DIR (default: the working directory) the
+first time it is asked for and kept until the file's mtime changes, which is checked at most
+every RIGC_ASSET_CHECK_SECONDS (default 2), so edited files are picked up without a restart.
+Callers get the shared object itself; treat it as read-only.
+
+The PDF logo is scaled to LOGO_PDF_WIDTH_PX and split into the colour and alpha streams fpdf
+writes, so documents no longer run fpdf's pure-Python PNG decoder (seconds for the full-size
+logo) on every render. Quotes use the core Helvetica font, so there are no font files to load;
+a TTF added later is registered here like the others.
+"""
+import io
+import os
+import threading
+import time
+import zlib
+
+from . import metrics
+
+ASSET_DIR = os.environ.get("RIGC_ASSET_DIR", ".")
+CHECK_SECONDS = float(os.environ.get("RIGC_ASSET_CHECK_SECONDS", "2"))
+# Login page shows the logo 120 px wide; twice that stays sharp on high-density screens
+LOGO_UI_WIDTH_PX = 240
+# PDF headers print it 25 mm wide; 300 px is about 300 dpi
+LOGO_PDF_WIDTH_PX = 300
+
+class Asset:
+    """One file and the value built from it, rebuilt when the file changes."""
+
+    def __init__(self, name, filename, build):
+        self.name = name
+        self.filename = filename
+        self.build = build
+        self.value = None
+        self.mtime = None
+        self.checked = 0.0
+        self.loads = 0
+        self.hits = 0
+
+    @property
+    def path(self):
+        return os.path.join(ASSET_DIR, self.filename)
+
+    def get(self):
+        now = time.monotonic()
+        if self.loads and now - self.checked < CHECK_SECONDS:
+            self.hits += 1
+            return self.value
+        self.checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if self.loads and mtime == self.mtime:
+            self.hits += 1
+            return self.value
+        self.value = self.build(self.path) if mtime is not None else None
+        self.mtime = mtime
+        self.loads += 1
+        return self.value
+
+    def size(self):
+        value = self.value
+        if isinstance(value, dict):
+            return sum(len(v) for v in value.values() if isinstance(v, (bytes, str)))
+        return len(value) if value is not None else 0
+
+_lock = threading.Lock()
+_assets = {}
+
+def register(name, filename, build):
+    """Declare an asset; build(path) is called when it is first needed and after the file changes."""
+    with _lock:
+        _assets[name] = Asset(name, filename, build)
+
+def get(name):
+    """The asset's shared value, or None when its file does not exist."""
+    asset = _assets[name]
+    with _lock:
+        return asset.get()
+
+def stats():
+    """[{name, file, loaded, loads, hits, bytes}] for the asset panel and metrics."""
+    with _lock:
+        return [{"name": a.name, "file": a.path, "loaded": a.mtime is not None, "loads": a.loads,
+                 "hits": a.hits, "bytes": a.size()} for a in _assets.values()]
+
+def _cache_info():
+    entries = stats()
+    return sum(a["hits"] for a in entries), sum(a["loads"] for a in entries)
+
+metrics.register_cache("assets", _cache_info)
+
+# ----------------------------
+# BUILDERS
+# ----------------------------
+def _read_text(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+def _scaled_png(width):
+    def build(path):
+        from PIL import Image
+
+        with Image.open(path) as im:
+            if im.width > width:
+                im = im.resize((width, round(im.height * width / im.width)), Image.LANCZOS)
+            out = io.BytesIO()
+            im.save(out, format="PNG", optimize=True)
+        return out.getvalue()
+    return build
+
+def _png_rows(raw, row_bytes, height):
+    """Prefix every row with PNG filter type 0, the layout fpdf declares as /Predictor 15."""
+    return b"".join(b"\0" + raw[i * row_bytes:(i + 1) * row_bytes] for i in range(height))
+
+def _fpdf_image(width):
+    """The image dict fpdf's PNG parser would produce (colour plus alpha soft mask), via Pillow."""
+    def build(path):
+        from PIL import Image
+
+        with Image.open(path) as im:
+            im = im.convert("RGBA")
+            if im.width > width:
+                im = im.resize((width, round(im.height * width / im.width)), Image.LANCZOS)
+            w, h = im.size
+            color = _png_rows(im.convert("RGB").tobytes(), 3 * w, h)
+            alpha = _png_rows(im.getchannel("A").tobytes(), w, h)
+        return {"w": w, "h": h, "cs": "DeviceRGB", "bpc": 8, "f": "FlateDecode",
+                "dp": f"/Predictor 15 /Colors 3 /BitsPerComponent 8 /Columns {w}", "pal": "", "trns": "",
+                "data": zlib.compress(color), "smask": zlib.compress(alpha)}
+    return build
+
+register("style.css", "style.css", _read_text)
+register("logo.ui", "logo.png", _scaled_png(LOGO_UI_WIDTH_PX))
+register("logo.pdf", "logo.png", _fpdf_image(LOGO_PDF_WIDTH_PX))
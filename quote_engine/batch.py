@@ -0,0 +1,283 @@
+"""Bulk quote creation from CSV, JSON Lines or Excel files.
+
+    python -m quote_engine.batch tender.xlsx --pdf-dir pdfs/ --workers 4
+
+JSON Lines: one quote per line, e.g.
+    {"client": "ACME SRL", "project_name": "Nave 3", "charges": ["supervision", "admin"],
+     "items": [{"product_name": "Anchor Bolts M20", "quantity": 40}]}
+
+CSV / Excel: one line item per row, grouped into quotes by the `quote_ref` column
+(or by client + project_name when there is none). Columns: quote_ref, client or client_id,
+project_name, notes, charges, product_name, quantity, unit_price, discount_type, discount_value.
+
+unit_price may be left empty to use the client's price list or else the catalog price. `charges` is
+a comma/semicolon list of surcharge keys (supervision, admin, insurance, transport, contingency
+unless the pricing rules say otherwise), or "all" / "none" (default: all).
+"""
+import argparse
+import json
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from . import storage
+from .pricing import DEFAULT_RULES, calculate_quote
+
+CHARGE_KEYS = DEFAULT_RULES.surcharge_keys
+DISCOUNT_TYPES = ("none", "percentage", "fixed")
+
+def _blank(value):
+    return value is None or (isinstance(value, float) and value != value) or str(value).strip() == ""
+
+def _number(value):
+    """float(value), refusing NaN and infinities; raises TypeError or ValueError."""
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"not a finite number: {value!r}")
+    return number
+
+def parse_charges(value, keys=CHARGE_KEYS):
+    if isinstance(value, dict):
+        return {k: bool(value.get(k)) for k in keys}
+    if _blank(value):
+        return {k: True for k in keys}
+    names = value if isinstance(value, list) else str(value).replace(";", ",").split(",")
+    names = {str(n).strip().lower() for n in names if str(n).strip()}
+    if names == {"all"}:
+        return {k: True for k in keys}
+    unknown = names - set(keys) - {"none"}
+    if unknown:
+        raise ValueError(f"unknown charges: {', '.join(sorted(unknown))}")
+    return {k: k in names for k in keys}
+
+def read_requests(path):
+    """Read quote requests from .jsonl/.json, .csv or .xlsx/.xls into a list of dicts."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".jsonl", ".json"):
+        with open(path, encoding="utf-8") as f:
+            if ext == ".json":
+                data = json.load(f)
+                return data if isinstance(data, list) else [data]
+            return [json.loads(line) for line in f if line.strip()]
+
+    import pandas as pd
+
+    if ext in (".xlsx", ".xls"):
+        df = pd.read_excel(path)
+    elif ext == ".csv":
+        df = pd.read_csv(path)
+    else:
+        raise ValueError(f"Unsupported file type: {ext}")
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    if "quote_ref" not in df.columns:
+        keys = [c for c in ("client", "client_id", "project_name") if c in df.columns]
+        df["quote_ref"] = df[keys].astype(str).agg("|".join, axis=1) if keys else "1"
+    requests = []
+    for ref, rows in df.groupby("quote_ref", sort=False):
+        first = rows.iloc[0]
+        item_cols = [c for c in ("product_name", "quantity", "unit_price", "discount_type", "discount_value")
+                     if c in rows.columns]
+        requests.append({
+            "ref": str(ref),
+            "client": first.get("client"),
+            "client_id": first.get("client_id"),
+            "project_name": first.get("project_name"),
+            "notes": first.get("notes"),
+            "charges": first.get("charges"),
+            "items": rows[item_cols].to_dict("records"),
+        })
+    return requests
+
+def client_index(clients):
+    """(ids by normalized company name, set of every client id) for validate_request.
+
+    Company names are not unique, so each name maps to all the ids that share it.
+    """
+    by_name = {}
+    for c in clients:
+        by_name.setdefault(str(c["company_name"] or "").strip().lower(), []).append(c["id"])
+    return by_name, {c["id"] for c in clients}
+
+def validate_request(request, clients_by_name, catalog, client_ids=None, rules=None):
+    """Return (quote dict ready for save_quotes_bulk, list of errors).
+
+    clients_by_name and client_ids come from client_index(). The quote dict also carries the
+    full calculate_quote breakdown under "totals".
+    """
+    if not isinstance(request, dict):
+        return None, ["request must be an object"]
+    rules = rules or DEFAULT_RULES
+    errors = []
+    client_id = request.get("client_id")
+    if not _blank(client_id):
+        try:
+            client_id = int(client_id)
+        except (TypeError, ValueError, OverflowError):
+            errors.append(f"invalid client_id {client_id!r}")
+            client_id = None
+        if client_ids is None:
+            client_ids = {i for ids in clients_by_name.values() for i in ids}
+        if client_id is not None and client_id not in client_ids:
+            errors.append(f"client_id {client_id} not found")
+    else:
+        name = request.get("client")
+        matches = clients_by_name.get(str(name).strip().lower(), []) if not _blank(name) else []
+        client_id = matches[0] if len(matches) == 1 else None
+        if not matches:
+            errors.append(f"client {name!r} not found")
+        elif len(matches) > 1:
+            errors.append(f"client {name!r} is ambiguous (ids {', '.join(map(str, matches))}); use client_id")
+    try:
+        charges = parse_charges(request.get("charges"), rules.surcharge_keys)
+    except ValueError as e:
+        errors.append(str(e))
+        charges = {}
+
+    items = []
+    raw_items = request.get("items") or []
+    if not isinstance(raw_items, list):
+        errors.append("items must be a list")
+        raw_items = []
+    for n, raw in enumerate(raw_items, start=1):
+        if not isinstance(raw, dict):
+            errors.append(f"line {n}: not an object")
+            continue
+        name = raw.get("product_name")
+        if _blank(name):
+            errors.append(f"line {n}: missing product_name")
+            continue
+        name = str(name).strip()
+        quantity = raw.get("quantity")
+        try:
+            quantity = 0.0 if _blank(quantity) else _number(quantity)
+        except (TypeError, ValueError):
+            errors.append(f"line {n} ({name}): invalid quantity {quantity!r}")
+            continue
+        if quantity <= 0:
+            errors.append(f"line {n} ({name}): quantity must be > 0")
+        price = raw.get("unit_price")
+        if _blank(price):
+            price = rules.unit_price(name, client_id, catalog.get(name.lower()))
+            if price is None:
+                errors.append(f"line {n} ({name}): no unit_price and not in catalog")
+                continue
+        try:
+            price = _number(price)
+        except (TypeError, ValueError):
+            errors.append(f"line {n} ({name}): invalid unit_price {price!r}")
+            continue
+        if price <= 0:
+            errors.append(f"line {n} ({name}): unit_price must be > 0")
+        discount_type = raw.get("discount_type")
+        discount_type = "none" if _blank(discount_type) else str(discount_type).strip().lower()
+        if discount_type not in DISCOUNT_TYPES:
+            errors.append(f"line {n} ({name}): invalid discount_type {discount_type!r}")
+        discount_value = raw.get("discount_value")
+        try:
+            discount_value = 0.0 if _blank(discount_value) else _number(discount_value)
+        except (TypeError, ValueError):
+            errors.append(f"line {n} ({name}): invalid discount_value {discount_value!r}")
+            continue
+        items.append({"product_name": name, "quantity": quantity, "unit_price": price,
+                      "discount_type": discount_type, "discount_value": discount_value,
+                      "tier_pct": rules.tier_pct(name, quantity)})
+    if not items and not errors:
+        errors.append("no items")
+    if errors:
+        return None, errors
+
+    totals = calculate_quote(items, charges, rules)
+    project = request.get("project_name")
+    notes = request.get("notes")
+    return {
+        "client_id": client_id,
+        "project_name": "" if _blank(project) else str(project),
+        "notes": "" if _blank(notes) else str(notes),
+        "items": items,
+        "total": totals["grand_total"],
+        "totals": totals,
+        "included_charges": charges,
+    }, []
+
+def _render_pdf_file(args):
+    quote_id, pdf_dir = args
+    from .pdf import render_stored_quote_pdf
+
+    path = os.path.join(pdf_dir, f"{quote_id}_cotizacion.pdf")
+    with open(path, "wb") as f:
+        f.write(render_stored_quote_pdf(quote_id))
+    return path
+
+def render_pdfs(quote_ids, pdf_dir, workers=None):
+    """Render quote PDFs into pdf_dir, in parallel processes when workers > 1."""
+    os.makedirs(pdf_dir, exist_ok=True)
+    tasks = [(qid, pdf_dir) for qid in quote_ids]
+    if workers == 1 or len(tasks) <= 1:
+        return [_render_pdf_file(t) for t in tasks]
+    with ProcessPoolExecutor(max_workers=workers, initializer=storage.set_db_path,
+                             initargs=(storage.DB_PATH,)) as pool:
+        return list(pool.map(_render_pdf_file, tasks, chunksize=max(1, len(tasks) // ((workers or 4) * 4))))
+
+def run_batch(requests, batch_size=500, dry_run=False, pdf_dir=None, workers=None):
+    """Validate, price and insert requests; returns a result dict per request."""
+    clients_by_name, client_ids = client_index(storage.get_all_clients())
+    catalog = {p["name"].strip().lower(): p["unit_price"] for p in storage.get_products_for_dropdown()}
+    rules = storage.get_pricing_rules()
+    results, valid = [], []
+    for n, request in enumerate(requests, start=1):
+        quote, errors = validate_request(request, clients_by_name, catalog, client_ids, rules)
+        ref = request.get("ref", str(n)) if isinstance(request, dict) else str(n)
+        result = {"ref": ref, "errors": errors}
+        if quote:
+            result["total"] = quote["total"]
+            valid.append((result, quote))
+        results.append(result)
+    if not dry_run:
+        for start in range(0, len(valid), batch_size):
+            chunk = valid[start:start + batch_size]
+            quote_ids = storage.save_quotes_bulk([quote for _, quote in chunk])
+            for (result, _), quote_id in zip(chunk, quote_ids):
+                result["quote_id"] = quote_id
+        if pdf_dir:
+            saved = [r for r in results if r.get("quote_id")]
+            for result, path in zip(saved, render_pdfs([r["quote_id"] for r in saved], pdf_dir, workers)):
+                result["pdf"] = path
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m quote_engine.batch", description="Create quotes in bulk.")
+    parser.add_argument("input", help="CSV, JSON Lines (.jsonl) or Excel (.xlsx) file with quote requests")
+    parser.add_argument("--db", help="database path (default: RIGC_DB_PATH or rigc_app.db)")
+    parser.add_argument("--batch-size", type=int, default=500, help="quotes per transaction")
+    parser.add_argument("--pdf-dir", help="render a PDF per saved quote into this directory")
+    parser.add_argument("--workers", type=int, default=None, help="PDF worker processes (default: CPU count)")
+    parser.add_argument("--dry-run", action="store_true", help="validate and price only, save nothing")
+    parser.add_argument("--strict", action="store_true", help="save nothing if any request is invalid")
+    parser.add_argument("--report", help="write per-request results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        storage.set_db_path(args.db)
+    storage.init_db()
+    requests = read_requests(args.input)
+    dry_run = args.dry_run
+    if args.strict and not dry_run:
+        checked = run_batch(requests, dry_run=True)
+        if any(r["errors"] for r in checked):
+            dry_run = True
+            print("⚠️ Invalid requests found; nothing was saved (--strict)", file=sys.stderr)
+    results = run_batch(requests, args.batch_size, dry_run, args.pdf_dir, args.workers)
+
+    failed = [r for r in results if r["errors"]]
+    for r in failed:
+        print(f"❌ {r['ref']}: {'; '.join(r['errors'])}", file=sys.stderr)
+    saved = sum(1 for r in results if r.get("quote_id"))
+    print(f"✅ {len(results)} requests: {saved} saved, {len(results) - len(failed)} valid, {len(failed)} invalid")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, default=str)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
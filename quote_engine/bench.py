@@ -0,0 +1,232 @@
+"""Benchmarks for the quoting hot paths on a seeded synthetic database.
+
+    python -m quote_engine.bench --scales small medium --output bench.json
+    python -m quote_engine.bench --scales small --compare bench.json
+
+Each scale builds a scratch database with N clients, M quotes of K items and a catalog of
+P products (same seed, same data), then times calculate_quote, save_quote_to_db,
+get_quote_by_id, sync_products_from_csv, the saved-quotes list data path and PDF rendering.
+Results are written as JSON, with the per-statement query stats of each scale; --compare prints the change in the fastest round against an
+earlier run (the least noisy statistic) and exits 1 when a benchmark got slower than --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from . import querylog, storage
+from .pricing import DEFAULT_RULES, calculate_quote
+
+# name: (clients, quotes, items per quote, catalog products)
+SCALES = {
+    "small": (10, 200, 10, 200),
+    "medium": (50, 2000, 25, 1000),
+    "large": (200, 10000, 50, 5000),
+}
+DISCOUNTS = [("none", 0.0)] * 6 + [("percentage", 5.0), ("percentage", 10.0), ("fixed", 25.0)]
+
+# ----------------------------
+# DATA GENERATOR
+# ----------------------------
+def write_catalog_csv(path, products, rng, price_change=0.0):
+    """Write a products CSV; price_change is the fraction of prices moved by up to +-10%."""
+    import pandas as pd
+
+    prices = [round(rng.uniform(1, 2000), 2) for _ in range(products)]
+    if price_change:
+        prices = [round(p * rng.uniform(0.9, 1.1), 2) if rng.random() < price_change else p for p in prices]
+    pd.DataFrame({"name": [f"BENCH PRODUCT {i:05d}" for i in range(products)],
+                  "description": [f"Synthetic product {i}" for i in range(products)],
+                  "unit_price": prices}).to_csv(path, index=False)
+
+def random_items(rng, catalog, count):
+    items = []
+    for product in rng.sample(catalog, min(count, len(catalog))):
+        discount_type, discount_value = rng.choice(DISCOUNTS)
+        items.append({"product_name": product["name"], "quantity": float(rng.randint(1, 100)),
+                      "unit_price": product["unit_price"], "discount_type": discount_type,
+                      "discount_value": discount_value})
+    return items
+
+def generate_dataset(clients, quotes, items_per_quote, products, seed=42, csv_path=None):
+    """Fill the current (empty) database; returns the client ids."""
+    rng = random.Random(seed)
+    csv_path = csv_path or os.path.join(os.path.dirname(os.path.abspath(storage.DB_PATH)), "catalog.csv")
+    write_catalog_csv(csv_path, products, random.Random(seed))
+    storage.sync_products_from_csv(csv_path)
+    catalog = storage.get_products_for_dropdown()
+    client_ids = [storage.add_client(f"Bench Client {i:04d}", f"Contact {i}", f"client{i}@example.com")
+                  for i in range(clients)]
+    charge_keys = DEFAULT_RULES.surcharge_keys
+    batch = []
+    for n in range(quotes):
+        items = random_items(rng, catalog, items_per_quote)
+        charges = {k: rng.random() > 0.2 for k in charge_keys}
+        batch.append({"client_id": rng.choice(client_ids), "project_name": f"Proyecto {n}",
+                      "items": items, "total": calculate_quote(items, charges)["grand_total"],
+                      "notes": "", "included_charges": charges})
+        if len(batch) == 500:
+            storage.save_quotes_bulk(batch)
+            batch = []
+    storage.save_quotes_bulk(batch)
+    return client_ids
+
+# ----------------------------
+# TIMING
+# ----------------------------
+def time_calls(fn, repeat, number=1):
+    """Seconds per call for each of `repeat` rounds of `number` calls."""
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - start) / number)
+    return rounds
+
+def summarize(rounds):
+    ms = sorted(r * 1000 for r in rounds)
+    return {"min_ms": ms[0], "median_ms": statistics.median(ms), "mean_ms": statistics.fmean(ms),
+            "p95_ms": ms[min(len(ms) - 1, int(round(0.95 * (len(ms) - 1))))]}
+
+def saved_quotes_path(client_id):
+    """What show_saved_quotes loads for a client: the list, then each quote's detail."""
+    quotes = storage.get_all_quotes_for_client(client_id)
+    client = storage.get_client_by_id(client_id)
+    for q in quotes:
+        quote_data, items = storage.get_quote_by_id(q["quote_id"])
+        storage.parse_included_charges(quote_data["included_charges"])
+    return client, len(quotes)
+
+def run_scale(name, repeat=5, seed=42, workdir=None):
+    clients, quotes, items_per_quote, products = SCALES[name]
+    workdir = workdir or tempfile.mkdtemp(prefix=f"bench-{name}-")
+    db_path = os.path.join(workdir, "bench.db")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    storage.set_db_path(db_path)
+    # Point init_db at a missing catalog CSV so it seeds only its sample products
+    csv_default, storage.PRODUCTS_CSV_PATH = storage.PRODUCTS_CSV_PATH, os.path.join(workdir, "missing.csv")
+    try:
+        storage.init_db()
+    finally:
+        storage.PRODUCTS_CSV_PATH = csv_default
+    start = time.perf_counter()
+    generate_dataset(clients, quotes, items_per_quote, products, seed, os.path.join(workdir, "catalog.csv"))
+    generate_seconds = time.perf_counter() - start
+    querylog.reset()
+
+    rng = random.Random(seed + 1)
+    catalog = storage.get_products_for_dropdown()
+    charges = {k: True for k in DEFAULT_RULES.surcharge_keys}
+    items = random_items(rng, catalog, items_per_quote)
+    big_quote = [random_items(rng, catalog, 1)[0] for _ in range(5000)]
+    quote_ids = [r["quote_id"] for r in storage.query_db("SELECT quote_id FROM quotes", fetch_all=True)]
+    busiest = storage.query_db("SELECT client_id FROM quotes GROUP BY client_id ORDER BY COUNT(*) DESC LIMIT 1",
+                               fetch_one=True)["client_id"]
+    csv_paths = [os.path.join(workdir, f"catalog_{i}.csv") for i in range(2)]
+    for i, path in enumerate(csv_paths):
+        write_catalog_csv(path, products, random.Random(seed), price_change=0.1 * (i + 1))
+    csv_cycle = iter(csv_paths * repeat)
+
+    benchmarks = [
+        ("calculate_quote", lambda: calculate_quote(items, charges), 1000),
+        ("calculate_quote_5000_lines", lambda: calculate_quote(big_quote, charges), 20),
+        ("save_quote_to_db", lambda: storage.save_quote_to_db(busiest, "Bench", items, 0.0, "", charges), 20),
+        ("get_quote_by_id", lambda: storage.get_quote_by_id(rng.choice(quote_ids)), 200),
+        ("saved_quotes_path", lambda: saved_quotes_path(busiest), 1),
+        ("sync_products_from_csv", lambda: storage.sync_products_from_csv(next(csv_cycle)), 1),
+    ]
+    try:
+        from .pdf import render_stored_quote_pdf
+        benchmarks.append(("render_quote_pdf", lambda: render_stored_quote_pdf(rng.choice(quote_ids)), 1))
+    except ImportError:
+        print("⚠️ fpdf not installed; skipping render_quote_pdf", file=sys.stderr)
+
+    results = [{"scale": name, "benchmark": "generate_dataset", "repeat": 1, "number": 1,
+                **summarize([generate_seconds])}]
+    for bench_name, fn, number in benchmarks:
+        fn()  # warm-up
+        results.append({"scale": name, "benchmark": bench_name, "repeat": repeat, "number": number,
+                        **summarize(time_calls(fn, repeat, number))})
+        print(f"  {name:>6} {bench_name:<28} {results[-1]['median_ms']:10.3f} ms")
+    return results
+
+# ----------------------------
+# RESULTS
+# ----------------------------
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(baseline, current, threshold=1.2):
+    """Print min_ms ratios current/baseline; returns the benchmarks slower than threshold."""
+    before = {(r["scale"], r["benchmark"]): r for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        old = before.get((r["scale"], r["benchmark"]))
+        if not old or not old["min_ms"]:
+            continue
+        ratio = r["min_ms"] / old["min_ms"]
+        flag = "🔺" if ratio > threshold else ("🔻" if ratio < 1 / threshold else "  ")
+        print(f"{flag} {r['scale']:>6} {r['benchmark']:<28} {old['min_ms']:10.3f} -> "
+              f"{r['min_ms']:10.3f} ms  x{ratio:.2f}")
+        if ratio > threshold:
+            regressions.append(r)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m quote_engine.bench", description="Benchmark the quoting hot paths.")
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=["small", "medium"])
+    parser.add_argument("--repeat", type=int, default=5, help="timed rounds per benchmark")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results JSON here (default: bench-<commit>.json)")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio that fails --compare")
+    parser.add_argument("--keep-db", action="store_true", help="keep the scratch databases")
+    args = parser.parse_args(argv)
+
+    commit = _git_commit()
+    report = {
+        "meta": {"commit": commit, "timestamp": datetime.now().isoformat(timespec="seconds"),
+                 "python": platform.python_version(), "platform": platform.platform(),
+                 "seed": args.seed, "repeat": args.repeat,
+                 "scales": {name: dict(zip(("clients", "quotes", "items_per_quote", "products"), SCALES[name]))
+                            for name in args.scales}},
+        "results": [],
+        "queries": {},
+    }
+    for name in args.scales:
+        workdir = tempfile.mkdtemp(prefix=f"bench-{name}-")
+        print(f"⏱️ {name}: {SCALES[name]} in {workdir}")
+        try:
+            report["results"] += run_scale(name, args.repeat, args.seed, workdir)
+            report["queries"][name] = querylog.stats(limit=20)
+        finally:
+            if not args.keep_db:
+                shutil.rmtree(workdir, ignore_errors=True)
+    output = args.output or f"bench-{commit or 'results'}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results written to {output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} benchmarks slower than x{args.threshold}", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""Material take-off and cost estimates for gable-roof warehouses.
+
+Layouts use the dimensions of the calculations model in database.py, in metres:
+warehouse_length x warehouse_width on plan, lateral_height at the eaves and roof_height at
+the ridge. Every function broadcasts over NumPy arrays, so sweeping thousands of layout
+variants is a handful of array operations:
+
+    prices = estimator.load_prices()
+    curves = estimator.sweep(range(30, 91, 5), range(15, 41, 5), [6, 7, 8], [8, 9, 10], prices)
+    items, missing = estimator.quote_items(60, 25, 7, 9, prices)
+"""
+import numpy as np
+
+from . import storage
+
+FT_PER_M = 3.28084
+SQFT_PER_M2 = 10.7639
+
+# (key, label, catalog product, basis, factor): quantity = ceil(geometry[basis] * factor) in the
+# product's catalog unit (ft2 of sheeting, lb of structural steel, ft of purlin, pieces)
+DEFAULT_MATERIALS = [
+    ("roof_sheeting", "Cubierta de aluzinc", "SUMINISTRO Y COLOCACION DE ALUZINC NATURAL CAL. 26",
+     "roof_area", SQFT_PER_M2 * 1.10),
+    ("wall_sheeting", "Cerramiento de aluzinc", "SUMINISTRO Y COLOCACION DE ALUZINC NATURAL CAL. 26",
+     "wall_area", SQFT_PER_M2 * 1.05),
+    ("columns", "Columnas W 14 x 30", "SUMINISTRO Y COLOCACION DE COLUMNAS EN VIGAS 14¨X 30 LBS PIE",
+     "column_length", FT_PER_M * 30),
+    ("rafters", "Vigas de techo W 14 x 26", "SUMINISTRO Y COLOCACION DE VIGAS W 14 x 26",
+     "rafter_length", FT_PER_M * 26),
+    ("purlins", "Correas Z de 8\"", "SUMINISTRO Y COLOCACION DE CORREAS Z DE 8¨", "purlin_length", FT_PER_M),
+    ("girts", "Largueros Z de 8\"", "SUMINISTRO Y COLOCACION DE CORREAS Z DE 8¨", "girt_length", FT_PER_M),
+    ("sheeting_screws", "Tornillos de techo y pared", "TORNILLOS PARA TECHOS 14 x 1¨", "sheeting_area", 6.0),
+    ("purlin_screws", "Tornillos de correas", "TORNILLOS PARA CORREAS DE 1/2 X 1", "purlin_joints", 4.0),
+    ("anchor_bolts", "Pernos de anclaje", "SUMINISTRO Y COLOCACION DE JUEGO DE PERNOS CON BARRAS DE 1¨ ROSCADA",
+     "columns", 1.0),
+]
+DIMENSIONS = ("length", "width", "lateral_height", "roof_height")
+# Layouts one sweep may evaluate: about 50k rows x 17 columns, a few MB and well under a second
+SWEEP_MAX_VARIANTS = 50_000
+
+class WarehouseSpec:
+    """Structural assumptions behind the take-off.
+
+    Portal frames every frame_spacing metres along the length (one column per side each),
+    purlins every purlin_spacing metres up each roof slope and girts every girt_spacing
+    metres up the walls, all running the full length of their face.
+    """
+
+    def __init__(self, frame_spacing=6.0, purlin_spacing=1.5, girt_spacing=1.5, materials=DEFAULT_MATERIALS):
+        self.frame_spacing = float(frame_spacing)
+        self.purlin_spacing = float(purlin_spacing)
+        self.girt_spacing = float(girt_spacing)
+        self.materials = [(key, label, product, basis, float(factor))
+                          for key, label, product, basis, factor in materials]
+
+    @property
+    def products(self):
+        return list(dict.fromkeys(product for _, _, product, _, _ in self.materials))
+
+DEFAULT_SPEC = WarehouseSpec()
+
+def _product_key(name):
+    return " ".join(str(name).split()).lower()
+
+def load_prices(spec=None, client_id=None):
+    """{catalog product: unit price} for the spec's materials, using the client's prices if any.
+
+    Products missing from the catalog are left out; estimate() prices them at 0 and
+    quote_items() reports them.
+    """
+    spec = spec or DEFAULT_SPEC
+    rules = storage.get_pricing_rules()
+    catalog = {_product_key(p["name"]): p for p in storage.get_products_for_dropdown()}
+    prices = {}
+    for product in spec.products:
+        row = catalog.get(_product_key(product))
+        if row:
+            prices[product] = rules.unit_price(row["name"], client_id, row["unit_price"])
+    return prices
+
+def geometry(length, width, lateral_height, roof_height, spec=None):
+    """Take-off bases (areas in m2, lengths in m, counts) for one or many layouts."""
+    spec = spec or DEFAULT_SPEC
+    length, width, lateral_height, roof_height = np.broadcast_arrays(
+        *(np.asarray(d, dtype=float) for d in (length, width, lateral_height, roof_height)))
+    rise = np.maximum(roof_height - lateral_height, 0.0)
+    slope = np.hypot(width / 2, rise)
+    frames = np.ceil(length / spec.frame_spacing) + 1
+    columns = frames * 2
+    purlin_lines = 2 * (np.ceil(slope / spec.purlin_spacing) + 1)
+    girt_lines = np.ceil(lateral_height / spec.girt_spacing)
+    roof_area = 2 * slope * length
+    wall_area = 2 * (length + width) * lateral_height + width * rise
+    return {
+        "floor_area": length * width,
+        "roof_area": roof_area,
+        "wall_area": wall_area,
+        "sheeting_area": roof_area + wall_area,
+        "frames": frames,
+        "columns": columns,
+        "column_length": columns * lateral_height,
+        "rafter_length": frames * 2 * slope,
+        "purlin_length": purlin_lines * length,
+        "girt_length": girt_lines * 2 * (length + width),
+        "purlin_joints": purlin_lines * frames + girt_lines * columns,
+    }
+
+def takeoff(length, width, lateral_height, roof_height, spec=None):
+    """{material key: quantity array} in catalog units."""
+    spec = spec or DEFAULT_SPEC
+    bases = geometry(length, width, lateral_height, roof_height, spec)
+    return {key: np.ceil(bases[basis] * factor) for key, _, _, basis, factor in spec.materials}
+
+def estimate(length, width, lateral_height, roof_height, prices, spec=None):
+    """Quantities, costs per material and total cost for one or many layouts."""
+    spec = spec or DEFAULT_SPEC
+    quantities = takeoff(length, width, lateral_height, roof_height, spec)
+    costs = {key: quantities[key] * prices.get(product, 0.0) for key, _, product, _, _ in spec.materials}
+    return {"quantities": quantities, "costs": costs, "total": sum(costs.values())}
+
+def sweep_size(lengths, widths, lateral_heights, roof_heights):
+    """Number of layouts sweep() would evaluate for these values."""
+    return int(np.prod([np.size(v) for v in (lengths, widths, lateral_heights, roof_heights)], dtype=np.int64))
+
+def sweep(lengths, widths, lateral_heights, roof_heights, prices, spec=None, max_variants=SWEEP_MAX_VARIANTS):
+    """Estimate every combination of the given dimensions; one DataFrame row per layout.
+
+    Columns: the four dimensions, floor_area, a cost column per material, total and
+    cost_per_m2. Pivot on two dimensions for cost curves. Raises ValueError when the grid
+    has more than max_variants layouts.
+    """
+    import pandas as pd
+
+    size = sweep_size(lengths, widths, lateral_heights, roof_heights)
+    if size > max_variants:
+        raise ValueError(f"{size:,} variants requested; the limit is {max_variants:,}")
+    spec = spec or DEFAULT_SPEC
+    grid = [g.ravel() for g in np.meshgrid(*(np.asarray(v, dtype=float).ravel()
+                                             for v in (lengths, widths, lateral_heights, roof_heights)),
+                                           indexing="ij")]
+    result = estimate(*grid, prices, spec)
+    floor_area = grid[0] * grid[1]
+    columns = dict(zip(DIMENSIONS, grid))
+    columns["floor_area"] = floor_area
+    columns.update(result["costs"])
+    columns["total"] = result["total"]
+    columns["cost_per_m2"] = np.divide(result["total"], floor_area, out=np.zeros_like(floor_area),
+                                       where=floor_area > 0)
+    return pd.DataFrame(columns)
+
+def quote_items(length, width, lateral_height, roof_height, prices, spec=None):
+    """(quote items for one layout, catalog products without a price).
+
+    Materials that share a catalog product are merged into one line; the items are in the
+    save_quote_to_db format.
+    """
+    spec = spec or DEFAULT_SPEC
+    quantities = takeoff(length, width, lateral_height, roof_height, spec)
+    lines, missing = {}, []
+    for key, _, product, _, _ in spec.materials:
+        if product not in prices:
+            if product not in missing:
+                missing.append(product)
+            continue
+        quantity = float(quantities[key])
+        if quantity <= 0:
+            continue
+        line = lines.setdefault(product, {"product_name": product, "quantity": 0.0, "unit_price": prices[product],
+                                          "discount_type": "none", "discount_value": 0.0})
+        line["quantity"] += quantity
+    return list(lines.values()), missing
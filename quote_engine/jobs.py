@@ -0,0 +1,361 @@
+"""Durable background jobs stored in the `jobs` table.
+
+    python -m quote_engine.jobs --workers 4
+
+The UI (or any process) calls submit_job() and polls get_job(); worker processes claim
+queued jobs by priority, run the handler registered for the job kind, and store the result
+blob. Failed jobs are retried with exponential backoff up to max_attempts, and jobs whose
+worker stopped sending heartbeats are handed to another worker. Each worker also deletes
+finished jobs older than KEEP_FINISHED_DAYS once every PURGE_INTERVAL_SECONDS. While a
+handler runs, its heartbeat is refreshed every HEARTBEAT_SECONDS whether or not it reports
+progress.
+
+Built-in kinds:
+    sync_products   {"csv_path": ..., "reprice_drafts": bool} -> JSON summary
+    reprice_drafts  {"product_ids": [...] or omitted}  -> JSON per-quote deltas
+    render_pdf      {"quote_id": ...}                  -> quote or invoice PDF
+    export_quotes   {"client_id": ... or omitted}      -> Excel workbook of quotes and items
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+
+from . import metrics, profiling, storage, tracing
+
+ACTIVE_STATUSES = ("queued", "running")
+STALE_AFTER_SECONDS = 15 * 60
+# run_job refreshes the heartbeat this often while a handler runs, progress() calls or not
+HEARTBEAT_SECONDS = 60
+RETRY_BASE_SECONDS = 2
+KEEP_FINISHED_DAYS = 7
+PURGE_INTERVAL_SECONDS = 3600
+# A finished job is reused for the same dedupe_key for this long, then the work runs again
+DEDUPE_FINISHED_SECONDS = 24 * 3600
+# Unfinished jobs with the key, or ones finished within DEDUPE_FINISHED_SECONDS
+DEDUPE_MATCH_SQL = """
+    SELECT id FROM jobs
+    WHERE dedupe_key = ? AND (status IN ('queued', 'running') OR (status = 'done' AND finished_at >= ?))
+    ORDER BY id DESC LIMIT 1
+"""
+
+HANDLERS = {}
+
+JOBS_RUN = metrics.counter("rigc_jobs_total", "Job attempts run by this worker, by outcome.", ["kind", "outcome"])
+JOB_SECONDS = metrics.histogram("rigc_job_seconds", "Job handler run time.", ["kind"],
+                                buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300))
+
+def job_handler(kind):
+    """Register fn(payload, progress) -> (result bytes, content type) or None for a job kind."""
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+# ----------------------------
+# QUEUE API
+# ----------------------------
+def submit_job(kind, payload=None, priority=0, max_attempts=3, dedupe_key=None):
+    """Queue a job and return its id.
+
+    With a dedupe_key, a queued or running job with the same key, or one that finished within
+    DEDUPE_FINISHED_SECONDS, is returned instead, so e.g. the PDF of an unchanged quote is
+    only rendered once.
+    """
+    now = time.time()
+    with storage.write_transaction() as cur:
+        if dedupe_key:
+            existing = cur.execute(DEDUPE_MATCH_SQL, (dedupe_key, now - DEDUPE_FINISHED_SECONDS)).fetchone()
+            if existing:
+                return existing["id"]
+        cur.execute("""
+            INSERT INTO jobs (kind, payload, dedupe_key, priority, max_attempts, created_at, run_after)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (kind, json.dumps(payload or {}), dedupe_key, priority, max_attempts, now, now))
+        return cur.lastrowid
+
+def get_job(job_id):
+    """Job status as a dict (without the result blob), or None."""
+    row = storage.query_db("""
+        SELECT id, kind, payload, dedupe_key, status, priority, attempts, max_attempts, progress,
+               message, error, result_type, worker, created_at, heartbeat_at, finished_at
+        FROM jobs WHERE id = ?
+    """, (job_id,), fetch_one=True)
+    return dict(row) if row else None
+
+def find_job(dedupe_key):
+    """Latest job submit_job would reuse for this dedupe key, or None."""
+    row = storage.query_db(DEDUPE_MATCH_SQL, (dedupe_key, time.time() - DEDUPE_FINISHED_SECONDS), fetch_one=True)
+    return get_job(row["id"]) if row else None
+
+def get_job_result(job_id):
+    """(result bytes, content type) of a finished job, or (None, None)."""
+    row = storage.query_db("SELECT result, result_type FROM jobs WHERE id = ? AND status = 'done'",
+                           (job_id,), fetch_one=True)
+    return (row["result"], row["result_type"]) if row else (None, None)
+
+def list_jobs(statuses=ACTIVE_STATUSES, limit=50):
+    placeholders = ", ".join("?" for _ in statuses)
+    rows = storage.query_db(f"""
+        SELECT id, kind, status, priority, attempts, progress, message, error, created_at
+        FROM jobs WHERE status IN ({placeholders}) ORDER BY priority DESC, id LIMIT ?
+    """, (*statuses, limit), fetch_all=True)
+    return [dict(r) for r in rows]
+
+def cancel_job(job_id):
+    """Cancel a job that has not started yet; returns True if it was cancelled."""
+    with storage.get_db_connection() as conn:
+        cur = conn.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                           (time.time(), job_id))
+        conn.commit()
+        return cur.rowcount == 1
+
+def purge_jobs(older_than_days=KEEP_FINISHED_DAYS):
+    """Delete finished, failed and cancelled jobs (and their result blobs) older than N days."""
+    cutoff = time.time() - older_than_days * 86400
+    with storage.get_db_connection() as conn:
+        cur = conn.execute("DELETE FROM jobs WHERE status NOT IN ('queued', 'running') AND finished_at < ?",
+                           (cutoff,))
+        conn.commit()
+        return cur.rowcount
+
+# ----------------------------
+# WORKER SIDE
+# ----------------------------
+def claim_job(worker):
+    """Atomically take the next runnable job for this worker; returns its row dict or None."""
+    now = time.time()
+    with storage.write_transaction() as cur:
+        # Jobs whose worker died: retry them, or fail them when out of attempts
+        stale = now - STALE_AFTER_SECONDS
+        cur.execute("""
+            UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+                   error = 'worker stopped responding', worker = NULL,
+                   finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE ? END
+            WHERE status = 'running' AND heartbeat_at < ?
+        """, (now, stale))
+        row = cur.execute("""
+            SELECT * FROM jobs WHERE status = 'queued' AND run_after <= ?
+            ORDER BY priority DESC, run_after, id LIMIT 1
+        """, (now,)).fetchone()
+        if row:
+            cur.execute("""
+                UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?,
+                       heartbeat_at = ?, progress = 0, message = NULL
+                WHERE id = ?
+            """, (worker, now, row["id"]))
+    return dict(row) if row else None
+
+# Every update from the worker side matches status = 'running' AND worker = ?, so a worker
+# whose job was handed to another one after a stale heartbeat cannot overwrite its outcome
+def report_progress(job_id, worker, progress, message=None):
+    """Record progress (0..1) for a running job; doubles as the worker heartbeat."""
+    storage.query_db("""
+        UPDATE jobs SET progress = ?, message = ?, heartbeat_at = ?
+        WHERE id = ? AND status = 'running' AND worker = ?
+    """, (max(0.0, min(1.0, progress)), message, time.time(), job_id, worker))
+
+def complete_job(job_id, worker, result=None, result_type=None):
+    """Mark the job done; False if this worker no longer owns it."""
+    with storage.write_transaction() as cur:
+        return cur.execute("""
+            UPDATE jobs SET status = 'done', progress = 1, result = ?, result_type = ?, error = NULL, finished_at = ?
+            WHERE id = ? AND status = 'running' AND worker = ?
+        """, (result, result_type, time.time(), job_id, worker)).rowcount == 1
+
+def fail_job(job_id, worker, error):
+    """Requeue with exponential backoff while attempts remain, otherwise mark failed.
+
+    Returns False if this worker no longer owns the job.
+    """
+    now = time.time()
+    with storage.write_transaction() as cur:
+        row = cur.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ? AND status = 'running' AND worker = ?",
+                          (job_id, worker)).fetchone()
+        if row is None:
+            return False
+        if row["attempts"] < row["max_attempts"]:
+            cur.execute("UPDATE jobs SET status = 'queued', error = ?, worker = NULL, run_after = ? WHERE id = ?",
+                        (error, now + RETRY_BASE_SECONDS ** row["attempts"], job_id))
+        else:
+            cur.execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                        (error, now, job_id))
+        return True
+
+def _heartbeat(job_id, worker, stop):
+    while not stop.wait(HEARTBEAT_SECONDS):
+        storage.query_db("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running' AND worker = ?",
+                         (time.time(), job_id, worker))
+
+def run_job(job, worker):
+    """Run one job claimed by `worker` through its handler and record the outcome."""
+    handler = HANDLERS.get(job["kind"])
+    if handler is None:
+        storage.query_db("""
+            UPDATE jobs SET status = 'failed', error = ?, finished_at = ?
+            WHERE id = ? AND status = 'running' AND worker = ?
+        """, (f"no handler for job kind {job['kind']!r}", time.time(), job["id"], worker))
+        return
+
+    def progress(p, m=None):
+        report_progress(job["id"], worker, p, m)
+
+    # Long steps without progress() calls (PDF layout, Excel writes) must not look like a dead worker
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job["id"], worker, stop), daemon=True,
+                     name=f"job-{job['id']}-heartbeat").start()
+    try:
+        with JOB_SECONDS.time(kind=job["kind"]), profiling.profile(f"job.{job['kind']}"):
+            if tracing.ENABLED:
+                with tracing.trace(f"job.{job['kind']}", job_id=job["id"], attempt=job["attempts"]):
+                    outcome = handler(json.loads(job["payload"]), progress)
+            else:
+                outcome = handler(json.loads(job["payload"]), progress)
+    except Exception as e:
+        stop.set()
+        if fail_job(job["id"], worker, f"{e}\n{traceback.format_exc(limit=5)}"):
+            JOBS_RUN.inc(kind=job["kind"], outcome="error")
+        else:
+            JOBS_RUN.inc(kind=job["kind"], outcome="lost")
+        return
+    stop.set()
+    result, result_type = outcome if outcome else (None, None)
+    JOBS_RUN.inc(kind=job["kind"], outcome="done" if complete_job(job["id"], worker, result, result_type) else "lost")
+
+def run_worker(poll_interval=0.5, max_jobs=None, parent_pid=None, purge_days=KEEP_FINISHED_DAYS):
+    """Claim and run jobs until max_jobs have run or the parent process goes away."""
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    done = 0
+    next_purge = time.monotonic()
+    while max_jobs is None or done < max_jobs:
+        if parent_pid and os.getppid() != parent_pid:
+            return done
+        if time.monotonic() >= next_purge:
+            purge_jobs(purge_days)
+            next_purge = time.monotonic() + PURGE_INTERVAL_SECONDS
+        job = claim_job(worker)
+        if job is None:
+            if max_jobs is not None:
+                return done
+            time.sleep(poll_interval)
+            continue
+        run_job(job, worker)
+        done += 1
+    return done
+
+def _worker_main(db_path, poll_interval, parent_pid, purge_days):
+    storage.set_db_path(db_path)
+    # Workers share the app's RIGC_METRICS_PORT, so they only export to RIGC_METRICS_FILE
+    metrics.start_exporter(port=0)
+    try:
+        run_worker(poll_interval, parent_pid=parent_pid, purge_days=purge_days)
+    except KeyboardInterrupt:
+        pass
+
+def start_workers(count, poll_interval=0.5, purge_days=KEEP_FINISHED_DAYS):
+    """Start `count` worker processes that exit together with this process."""
+    ctx = multiprocessing.get_context("spawn")
+    procs = []
+    for _ in range(count):
+        p = ctx.Process(target=_worker_main, args=(storage.DB_PATH, poll_interval, os.getpid(), purge_days),
+                        daemon=True)
+        p.start()
+        procs.append(p)
+    return procs
+
+# ----------------------------
+# HANDLERS
+# ----------------------------
+def _reprice_message(deltas):
+    return f"🔁 {len(deltas)} draft quotes repriced ({sum(d['delta'] for d in deltas):+,.2f})"
+
+@job_handler("sync_products")
+def _sync_products(payload, progress):
+    result, message = storage.sync_products_from_csv(payload.get("csv_path") or storage.PRODUCTS_CSV_PATH,
+                                                     progress=progress)
+    if result is None:
+        raise ValueError(message)
+    if payload.get("reprice_drafts") and result["price_changed"]:
+        progress(0.8, "repricing drafts")
+        result["repriced"] = storage.reprice_draft_quotes(result["price_changed"])
+        message += f"\n{_reprice_message(result['repriced'])}"
+    return json.dumps({**result, "message": message}).encode("utf-8"), "application/json"
+
+@job_handler("reprice_drafts")
+def _reprice_drafts(payload, progress):
+    deltas = storage.reprice_draft_quotes(payload.get("product_ids"))
+    return json.dumps({"repriced": deltas, "message": _reprice_message(deltas)}).encode("utf-8"), "application/json"
+
+@job_handler("render_pdf")
+def _render_pdf(payload, progress):
+    from .pdf import render_stored_quote_pdf
+
+    progress(0.1, "rendering")
+    pdf = render_stored_quote_pdf(payload["quote_id"])
+    if pdf is None:
+        raise ValueError(f"quote {payload['quote_id']} not found")
+    return pdf, "application/pdf"
+
+@job_handler("export_quotes")
+def _export_quotes(payload, progress):
+    import pandas as pd
+
+    client_id = payload.get("client_id")
+    where, params = ("WHERE q.client_id = ?", (client_id,)) if client_id else ("", ())
+    with storage.get_db_connection() as conn:
+        quotes = pd.read_sql_query(f"""
+            SELECT q.quote_id, c.company_name, q.project_name, q.date, q.status, q.total_amount, q.notes
+            FROM quotes q LEFT JOIN clients c ON c.id = q.client_id {where} ORDER BY q.date, q.quote_id
+        """, conn, params=params)
+        progress(0.4, f"{len(quotes)} quotes")
+        items = pd.read_sql_query(f"""
+            SELECT i.quote_id, i.product_name, i.quantity, i.unit_price, i.discount_type, i.discount_value,
+                   {storage.line_net_sql('i')} AS line_total
+            FROM quote_items i JOIN quotes q ON q.quote_id = i.quote_id {where} ORDER BY i.quote_id, i.id
+        """, conn, params=params)
+    progress(0.7, f"{len(items)} items")
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
+        quotes.to_excel(writer, sheet_name="Cotizaciones", index=False)
+        progress(0.8, "writing items")
+        items.to_excel(writer, sheet_name="Partidas", index=False)
+        progress(0.95, "saving workbook")
+    return buf.getvalue(), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m quote_engine.jobs", description="Run background job workers.")
+    parser.add_argument("--db", help="database path (default: RIGC_DB_PATH or rigc_app.db)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="worker processes")
+    parser.add_argument("--poll", type=float, default=0.5, help="seconds between polls when idle")
+    parser.add_argument("--drain", action="store_true", help="run queued jobs in this process, then exit")
+    parser.add_argument("--purge-days", type=int, default=KEEP_FINISHED_DAYS,
+                        help="delete finished jobs older than this (on startup, then hourly)")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        storage.set_db_path(args.db)
+    storage.init_db()
+    purged = purge_jobs(args.purge_days)
+    if purged:
+        print(f"🧹 Purged {purged} old jobs")
+    if args.drain:
+        print(f"✅ Ran {run_worker(max_jobs=sys.maxsize, purge_days=args.purge_days)} jobs")
+        return 0
+    procs = start_workers(args.workers, args.poll, args.purge_days)
+    print(f"✅ {len(procs)} workers running on {storage.DB_PATH}")
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.terminate()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""The line items of a quote being edited, kept by column with running totals.
+
+    lines = QuoteLines(items, storage.get_pricing_rules())
+    lines.apply_editor_changes(st.session_state["products_editor"])   # only the changed rows
+    totals = lines.totals(included_charges)                          # no pass over the lines
+
+Every line's gross, tier discount, total discount and net amount are computed when the line
+is added or changed, and the quote aggregates are adjusted by the difference, so editing one
+line of a 3,000-line quote reprices one line. totals() returns what calculate_quote() would.
+
+Lines live in preallocated NumPy arrays (8 bytes per number, 1 per discount type) instead of
+one dict per line; product names are interned, so sessions quoting the same catalog share
+the strings. to_frame() wraps the numeric arrays without copying them.
+"""
+import sys
+
+import numpy as np
+
+from .pricing import DEFAULT_RULES, VECTORIZE_MIN_LINES, price_line_arrays, price_lines, quote_totals
+
+FIELDS = ("product_name", "quantity", "unit_price", "discount_type", "discount_value", "auto_imported")
+DISCOUNT_TYPES = ("none", "percentage", "fixed")
+_DISCOUNT_CODES = {name: code for code, name in enumerate(DISCOUNT_TYPES)}
+_NUMBER_COLUMNS = ("_quantity", "_unit_price", "_discount_value", "_gross", "_tier", "_discount", "_net")
+_MIN_CAPACITY = 16
+
+def _number(value):
+    """float(value), with blanks (None, NaN, "") as 0 like calculate_quote treats them."""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return number if number == number else 0.0
+
+def _normalize(item):
+    discount_type = item.get("discount_type") or "none"
+    return {
+        "product_name": sys.intern(str(item.get("product_name") or "")),
+        "quantity": _number(item.get("quantity")),
+        "unit_price": _number(item.get("unit_price")),
+        "discount_type": discount_type if discount_type in _DISCOUNT_CODES else "none",
+        "discount_value": _number(item.get("discount_value")),
+        "auto_imported": bool(item.get("auto_imported", False)),
+    }
+
+class QuoteLines:
+    """Array columns of line fields plus per-line amounts and their sums."""
+
+    __slots__ = ("rules", "_size", "_names", "_quantity", "_unit_price", "_discount_code", "_discount_value",
+                 "_auto_imported", "_gross", "_tier", "_discount", "_net",
+                 "items_total", "tier_discounts", "total_discounts")
+
+    def __init__(self, items=(), rules=None):
+        self.rules = rules or DEFAULT_RULES
+        self._clear()
+        self.extend(items)
+
+    def _clear(self, capacity=0):
+        self._size = 0
+        self._names = np.empty(capacity, dtype=object)
+        self._discount_code = np.zeros(capacity, dtype=np.int8)
+        self._auto_imported = np.zeros(capacity, dtype=bool)
+        for name in _NUMBER_COLUMNS:
+            setattr(self, name, np.zeros(capacity))
+        self.items_total = self.tier_discounts = self.total_discounts = 0.0
+
+    def _arrays(self):
+        return [self._names, self._discount_code, self._auto_imported] + [getattr(self, n) for n in _NUMBER_COLUMNS]
+
+    def _reserve(self, count):
+        """Grow the arrays (doubling) so `count` more lines fit."""
+        capacity = len(self._gross)
+        if self._size + count <= capacity:
+            return
+        capacity = max(_MIN_CAPACITY, capacity * 2, self._size + count)
+        for name in ("_names", "_discount_code", "_auto_imported") + _NUMBER_COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype) if old.dtype != object else np.empty(capacity, dtype=object)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+    def row(self, index):
+        if not 0 <= index < self._size:
+            raise IndexError(index)
+        return {
+            "product_name": self._names[index],
+            "quantity": float(self._quantity[index]),
+            "unit_price": float(self._unit_price[index]),
+            "discount_type": DISCOUNT_TYPES[self._discount_code[index]],
+            "discount_value": float(self._discount_value[index]),
+            "auto_imported": bool(self._auto_imported[index]),
+        }
+
+    def to_items(self):
+        """The lines as save_quote_to_db / calculate_quote item dicts."""
+        return [self.row(i) for i in range(self._size)]
+
+    def to_frame(self):
+        """DataFrame for st.data_editor: the fields plus discount_amount and subtotal.
+
+        The numeric columns are views of the arrays, not copies; treat the frame as read-only.
+        """
+        import pandas as pd
+
+        n = self._size
+        return pd.DataFrame({
+            "product_name": self._names[:n],
+            "quantity": self._quantity[:n],
+            "unit_price": self._unit_price[:n],
+            "discount_type": pd.Categorical.from_codes(self._discount_code[:n], DISCOUNT_TYPES),
+            "discount_value": self._discount_value[:n],
+            "auto_imported": self._auto_imported[:n],
+            "discount_amount": self._discount[:n],
+            "subtotal": self._net[:n],
+        }, copy=False)
+
+    def _add_amounts(self, gross, tier, discount, sign=1):
+        self.items_total += sign * gross
+        self.tier_discounts += sign * tier
+        self.total_discounts += sign * discount
+
+    def extend(self, items):
+        rows = [_normalize(item) for item in items]
+        if not rows:
+            return
+        start, count = self._size, len(rows)
+        self._reserve(count)
+        end = start + count
+        self._names[start:end] = [row["product_name"] for row in rows]
+        self._quantity[start:end] = [row["quantity"] for row in rows]
+        self._unit_price[start:end] = [row["unit_price"] for row in rows]
+        self._discount_code[start:end] = [_DISCOUNT_CODES[row["discount_type"]] for row in rows]
+        self._discount_value[start:end] = [row["discount_value"] for row in rows]
+        self._auto_imported[start:end] = [row["auto_imported"] for row in rows]
+        if count >= VECTORIZE_MIN_LINES:
+            gross, tier, discount, net = price_line_arrays(rows, self.rules)
+        else:
+            gross, tier, discount, net = zip(*price_lines(rows, self.rules))
+        self._gross[start:end], self._tier[start:end] = gross, tier
+        self._discount[start:end], self._net[start:end] = discount, net
+        self._size = end
+        self._add_amounts(float(np.sum(gross)), float(np.sum(tier)), float(np.sum(discount)))
+
+    def append(self, item):
+        self.extend([item])
+
+    def update(self, index, changes):
+        """Change some fields of one line and reprice only that line."""
+        row = _normalize({**self.row(index), **{k: v for k, v in changes.items() if k in FIELDS}})
+        self._names[index] = row["product_name"]
+        self._quantity[index] = row["quantity"]
+        self._unit_price[index] = row["unit_price"]
+        self._discount_code[index] = _DISCOUNT_CODES[row["discount_type"]]
+        self._discount_value[index] = row["discount_value"]
+        self._auto_imported[index] = row["auto_imported"]
+        self._add_amounts(self._gross[index], self._tier[index], self._discount[index], -1)
+        gross, tier, discount, net = price_lines([row], self.rules)[0]
+        self._gross[index], self._tier[index], self._discount[index], self._net[index] = gross, tier, discount, net
+        self._add_amounts(gross, tier, discount)
+
+    def delete(self, indexes):
+        drop = sorted({i for i in indexes if 0 <= i < self._size})
+        if not drop:
+            return
+        self._add_amounts(float(self._gross[drop].sum()), float(self._tier[drop].sum()),
+                          float(self._discount[drop].sum()), -1)
+        keep = np.ones(self._size, dtype=bool)
+        keep[drop] = False
+        size = self._size - len(drop)
+        for array in self._arrays():
+            array[:size] = array[:self._size][keep]
+        self._names[size:self._size] = None
+        self._size = size
+
+    def apply_editor_changes(self, state):
+        """Apply st.data_editor's change state (edited_rows, deleted_rows, added_rows).
+
+        Row positions refer to the frame the editor was given, so edits go first, then
+        deletions, then the added rows are appended, as the editor itself applies them.
+        """
+        for index, changes in (state.get("edited_rows") or {}).items():
+            self.update(int(index), changes)
+        self.delete(int(index) for index in state.get("deleted_rows") or ())
+        self.extend(row for row in state.get("added_rows") or () if any(v is not None for v in row.values()))
+
+    def set_rules(self, rules):
+        """Reprice every line when the pricing rules changed (e.g. after the cache reloaded)."""
+        rules = rules or DEFAULT_RULES
+        if rules is self.rules:
+            return
+        self.rules = rules
+        items = self.to_items()
+        self._clear(len(self._gross))
+        self.extend(items)
+
+    def totals(self, included_charges):
+        return quote_totals(self.items_total, self.tier_discounts, self.total_discounts, included_charges, self.rules)
+
+    def memory_usage(self):
+        """Bytes held: array buffers (allocated capacity) and the distinct product-name strings,
+        which interning shares with every other session quoting the same products."""
+        names = {id(name): name for name in self._names[:self._size]}
+        return {
+            "lines": self._size,
+            "capacity": len(self._gross),
+            "arrays": sum(array.nbytes for array in self._arrays()),
+            "names": sum(sys.getsizeof(name) for name in names.values()),
+        }
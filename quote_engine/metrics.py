@@ -0,0 +1,289 @@
+"""In-process metrics (counters, gauges, histograms) in the Prometheus text format.
+
+    QUOTES_SAVED = metrics.counter("rigc_quotes_saved_total", "Quotes saved.", ["source"])
+    QUOTES_SAVED.inc(source="form")
+    with metrics.histogram("rigc_pdf_render_seconds", "PDF render time.").time():
+        ...
+
+storage, pricing and pdf record quote saves, catalog syncs, lines priced and PDF render
+times; SQL latency per statement kind and cache hit ratios (register_cache()) are read at
+scrape time. Each process has its own registry; start_exporter() publishes it as configured:
+    RIGC_METRICS_PORT=9464      serve GET /metrics on 127.0.0.1 (the service also has /metrics)
+    RIGC_METRICS_FILE=path      rewrite the file every RIGC_METRICS_INTERVAL seconds (default
+                                15), e.g. for node_exporter's textfile collector; "{pid}" in the
+                                path is replaced by the process id
+"""
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PORT = int(os.environ.get("RIGC_METRICS_PORT", "0") or 0)
+METRICS_FILE = os.environ.get("RIGC_METRICS_FILE", "")
+INTERVAL_SECONDS = float(os.environ.get("RIGC_METRICS_INTERVAL", "15"))
+# Histogram upper bounds in seconds; +Inf is implicit
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def samples(self):
+        """[(name suffix, label values, extra label pairs, value)] for the exposition."""
+        with self._lock:
+            return [("", key, (), value) for key, value in sorted(self._values.items())]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("counters only go up")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts = entry[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the enclosed block, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            entries = sorted((key, list(e[0]), e[1], e[2]) for key, e in self._values.items())
+        return [sample for key, counts, total, count in entries
+                for sample in histogram_samples(key, self.buckets, counts, total, count)]
+
+def histogram_samples(key, buckets, counts, total, count):
+    """Exposition samples for per-bucket (non-cumulative) counts; the last count is above the
+    highest bound."""
+    samples, cumulative = [], 0
+    for bound, n in zip(list(buckets) + [math.inf], counts):
+        cumulative += n
+        samples.append(("_bucket", key, (("le", _format_value(float(bound))),), cumulative))
+    samples.append(("_sum", key, (), total))
+    samples.append(("_count", key, (), count))
+    return samples
+
+class Registry:
+    """Named metrics plus collectors: callables returning extra (metric, samples) at scrape time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def _get_or_create(self, cls, name, help_text, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"metric {name} is already registered as a different {metric.kind}")
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._get_or_create(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def register_collector(self, collect):
+        """collect() returns [(name, kind, help, labelnames, samples)] in Metric.samples() form."""
+        with self._lock:
+            if collect not in self._collectors:
+                self._collectors.append(collect)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        families = [(m.name, m.kind, m.help, m.labelnames, m.samples()) for m in metrics]
+        for collect in collectors:
+            families += collect()
+        lines = []
+        for name, kind, help_text, labelnames, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, key, extra, value in samples:
+                lines.append(f"{name}{suffix}{_format_labels(labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+register_collector = REGISTRY.register_collector
+render = REGISTRY.render
+
+def _process_metrics():
+    uptime = time.time() - _START_TIME
+    return [("rigc_process_start_time_seconds", "gauge", "Start time of the process (unix epoch).", (),
+             [("", (), (), _START_TIME)]),
+            ("rigc_process_uptime_seconds", "gauge", "Seconds since the process started.", (),
+             [("", (), (), uptime)])]
+
+_START_TIME = time.time()
+register_collector(_process_metrics)
+
+_caches = {}
+
+def register_cache(name, info):
+    """Report a cache's hit ratio; info() returns (hits, misses) so far."""
+    _caches[name] = info
+
+def _cache_metrics():
+    counts = {name: info() for name, info in list(_caches.items())}
+    requests = [("", (name, result), (), n) for name, (hits, misses) in sorted(counts.items())
+                for result, n in (("hit", hits), ("miss", misses))]
+    ratios = [("", (name,), (), hits / (hits + misses)) for name, (hits, misses) in sorted(counts.items())
+              if hits + misses]
+    return [("rigc_cache_requests_total", "counter", "Cache lookups by result.", ("cache", "result"), requests),
+            ("rigc_cache_hit_ratio", "gauge", "Hits over lookups since the process started.", ("cache",), ratios)]
+
+register_collector(_cache_metrics)
+
+# ----------------------------
+# EXPORTERS
+# ----------------------------
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0].rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port=PORT, host="127.0.0.1"):
+    """Serve /metrics from a daemon thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="rigc-metrics-http", daemon=True).start()
+    return server
+
+def write_file(path=None):
+    """Write the current metrics to path atomically (scrapers never see a partial file)."""
+    path = (path or METRICS_FILE).replace("{pid}", str(os.getpid()))
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render())
+    os.replace(tmp, path)
+    return path
+
+def _file_loop(path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_file(path)
+        except OSError:
+            pass
+
+_exporter_lock = threading.Lock()
+_exporter = {}
+
+def start_exporter(port=None, path=None, interval=None):
+    """Start the HTTP endpoint and/or file writer configured by the arguments or environment.
+
+    Safe to call more than once per process; an endpoint whose port is taken is skipped (returns
+    what is running).
+    """
+    port = PORT if port is None else port
+    path = METRICS_FILE if path is None else path
+    with _exporter_lock:
+        if port and "server" not in _exporter:
+            try:
+                _exporter["server"] = serve(port)
+            except OSError as e:
+                print(f"⚠️ Metrics port {port} unavailable: {e}", file=sys.stderr)
+        if path and "file" not in _exporter:
+            thread = threading.Thread(target=_file_loop, args=(path, interval or INTERVAL_SECONDS),
+                                      name="rigc-metrics-file", daemon=True)
+            thread.start()
+            _exporter["file"] = thread
+        return dict(_exporter)
@@ -0,0 +1,251 @@
+"""Merge a legacy calculator.db (the old database.py layer) into the main database.
+
+    python -m quote_engine.migrate_legacy calculator.db --db rigc_app.db --chunk-size 1000
+
+Clients, calculations and quotations are read in id order, one chunk at a time, so memory
+stays bounded by the chunk size (plus a hash index of client keys). Each chunk is written in
+one transaction with executemany, together with its old-id -> new-id mappings and the
+checkpoint of the last legacy id copied, so an interrupted run resumes where it stopped and
+running it again copies nothing twice.
+
+Clients are deduplicated against the main database and each other: same tax id (ignoring
+punctuation), or, for clients without a tax id on one side, same company name (ignoring case
+and spacing). Calculations and quotations follow their client's new id; quotations become
+quotes linked to the new calculation, keeping their number unless it is already taken.
+Legacy statuses map onto the app's two: invoiced or paid ones become Invoiced, anything else
+(draft, pending, sent, ...) Draft.
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+from datetime import datetime
+
+from . import storage
+
+CHUNK_SIZE = 1000
+TABLES = ("clients", "calculations", "quotations")
+CLIENT_FIELDS = ("company_name", "contact_name", "email", "phone", "address", "tax_id", "notes")
+INVOICED_STATUSES = {"invoiced", "invoice", "factura", "facturada", "facturado", "paid", "pagada", "pagado"}
+
+def _ensure_tables(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS legacy_checkpoints (
+        source TEXT NOT NULL,
+        table_name TEXT NOT NULL,
+        last_id INTEGER NOT NULL,
+        copied INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT NOT NULL,
+        PRIMARY KEY (source, table_name)
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS legacy_id_map (
+        source TEXT NOT NULL,
+        table_name TEXT NOT NULL,
+        old_id INTEGER NOT NULL,
+        new_id INTEGER NOT NULL,
+        PRIMARY KEY (source, table_name, old_id)
+    )
+    """)
+
+def _tax_key(tax_id):
+    return re.sub(r"\W", "", str(tax_id or "")).upper()
+
+def _name_key(company_name):
+    return " ".join(str(company_name or "").casefold().split())
+
+class ClientIndex:
+    """Hash index of the main database's clients by tax id and by company name."""
+
+    def __init__(self, rows=()):
+        self.by_tax = {}
+        self.by_name = {}
+        for client_id, company_name, tax_id in rows:
+            self.add(client_id, company_name, tax_id)
+
+    def add(self, client_id, company_name, tax_id):
+        tax = _tax_key(tax_id)
+        if tax:
+            self.by_tax.setdefault(tax, client_id)
+        self.by_name.setdefault(_name_key(company_name), (client_id, bool(tax)))
+
+    def find(self, company_name, tax_id):
+        tax = _tax_key(tax_id)
+        if tax and tax in self.by_tax:
+            return self.by_tax[tax]
+        match = self.by_name.get(_name_key(company_name))
+        if match and not (tax and match[1]):
+            return match[0]
+        return None
+
+def _checkpoint(cur, source, table):
+    row = cur.execute("SELECT last_id, copied FROM legacy_checkpoints WHERE source = ? AND table_name = ?",
+                      (source, table)).fetchone()
+    return (row[0], row[1]) if row else (0, 0)
+
+def _save_checkpoint(cur, source, table, last_id, copied):
+    cur.execute("""
+        INSERT INTO legacy_checkpoints (source, table_name, last_id, copied, updated_at) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (source, table_name) DO UPDATE SET
+            last_id = excluded.last_id, copied = excluded.copied, updated_at = excluded.updated_at
+    """, (source, table, last_id, copied, datetime.now().isoformat(timespec="seconds")))
+
+def _save_mappings(cur, source, table, pairs):
+    cur.executemany("INSERT OR REPLACE INTO legacy_id_map (source, table_name, old_id, new_id) VALUES (?, ?, ?, ?)",
+                    [(source, table, old, new) for old, new in pairs])
+
+def _mapped_ids(cur, source, table, old_ids):
+    """{old_id: new_id} for the given legacy ids, one indexed lookup per chunk."""
+    rows = cur.execute("""
+        SELECT old_id, new_id FROM legacy_id_map
+        WHERE source = ? AND table_name = ? AND old_id IN (SELECT value FROM json_each(?))
+    """, (source, table, json.dumps(sorted({i for i in old_ids if i is not None})))).fetchall()
+    return dict(rows)
+
+def _quote_status(status):
+    return "Invoiced" if str(status or "").strip().lower() in INVOICED_STATUSES else "Draft"
+
+def _chunks(legacy, table, after, chunk_size):
+    """Legacy rows with id > after, in id order, chunk_size at a time (keyset pagination)."""
+    while True:
+        rows = legacy.execute(f"SELECT * FROM {table} WHERE id > ? ORDER BY id LIMIT ?",
+                              (after, chunk_size)).fetchall()
+        if not rows:
+            return
+        yield rows
+        after = rows[-1]["id"]
+
+# ----------------------------
+# PER-TABLE COPIES
+# ----------------------------
+def _copy_clients(cur, source, rows, index):
+    pairs, new_rows, new_old_ids = [], [], []
+    pending = ClientIndex()  # clients new in this chunk, by position in new_rows
+    for row in rows:
+        client = {f: row[f] for f in CLIENT_FIELDS if f in row.keys()}
+        existing = index.find(client.get("company_name"), client.get("tax_id"))
+        if existing is not None:
+            pairs.append((row["id"], existing))
+            continue
+        position = pending.find(client.get("company_name"), client.get("tax_id"))
+        if position is not None:
+            new_old_ids[position].append(row["id"])
+            continue
+        pending.add(len(new_rows), client.get("company_name"), client.get("tax_id"))
+        new_rows.append(tuple(client.get(f) or "" for f in CLIENT_FIELDS))
+        new_old_ids.append([row["id"]])
+    new_ids = storage._insert_returning_ids(cur, "clients", f"""
+        INSERT INTO clients ({", ".join(CLIENT_FIELDS)}) VALUES ({", ".join("?" * len(CLIENT_FIELDS))})
+    """, new_rows) if new_rows else []
+    for new_id, values, old_ids in zip(new_ids, new_rows, new_old_ids):
+        index.add(new_id, values[0], values[5])
+        pairs += [(old_id, new_id) for old_id in old_ids]
+    _save_mappings(cur, source, "clients", pairs)
+    return len(new_rows), len(rows) - len(new_rows)
+
+def _copy_calculations(cur, source, rows):
+    clients = _mapped_ids(cur, source, "clients", [row["client_id"] for row in rows])
+    kept = [row for row in rows if row["client_id"] in clients]
+    created_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    values = [storage._calculation_row({**dict(row), "client_id": clients[row["client_id"]]}, created_date)
+              for row in kept]
+    new_ids = storage._insert_calculations(cur, values) if values else []
+    _save_mappings(cur, source, "calculations", [(row["id"], new_id) for row, new_id in zip(kept, new_ids)])
+    return len(kept), len(rows) - len(kept)
+
+def _copy_quotations(cur, source, rows):
+    clients = _mapped_ids(cur, source, "clients", [row["client_id"] for row in rows])
+    calculations = _mapped_ids(cur, source, "calculations", [row["calculation_id"] for row in rows])
+    kept = [row for row in rows if row["client_id"] in clients]
+    numbers = [str(row["quote_number"] or "").strip() or f"LEG-{row['id']}" for row in kept]
+    taken = {r[0] for r in cur.execute("SELECT quote_id FROM quotes WHERE quote_id IN (SELECT value FROM json_each(?))",
+                                       (json.dumps(numbers),))}
+    values, seen = [], set()
+    for row, number in zip(kept, numbers):
+        if number in taken or number in seen:
+            number = f"{number}-L{row['id']}"
+        seen.add(number)
+        values.append((number, clients[row["client_id"]], row["quote_date"] or datetime.now().strftime("%Y-%m-%d"),
+                       row["total_amount"] or 0, _quote_status(row["status"]), row["notes"] or "",
+                       str({}), calculations.get(row["calculation_id"]), row["valid_until"],
+                       calculations.get(row["calculation_id"])))
+    new_ids = storage._insert_returning_ids(cur, "quotes", """
+        INSERT INTO quotes (quote_id, client_id, date, total_amount, status, notes, included_charges,
+                            calculation_id, valid_until, project_name)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, (SELECT project_name FROM calculations WHERE id = ?))
+    """, values) if values else []
+    if new_ids:
+        storage._apply_rollup_where(cur, "q.id BETWEEN ? AND ?", (new_ids[0], new_ids[-1]), 1)
+    _save_mappings(cur, source, "quotations", [(row["id"], new_id) for row, new_id in zip(kept, new_ids)])
+    return len(kept), len(rows) - len(kept)
+
+# ----------------------------
+# MIGRATION
+# ----------------------------
+def migrate(legacy_path, chunk_size=CHUNK_SIZE, progress=None):
+    """Copy what the checkpoints say is still missing; returns {table: {copied, merged|skipped}}.
+
+    progress(table, rows done this run) is called after every committed chunk.
+    """
+    source = os.path.abspath(legacy_path)
+    legacy = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+    legacy.row_factory = sqlite3.Row
+    try:
+        present = {r[0] for r in legacy.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        with storage.write_transaction() as cur:
+            _ensure_tables(cur)
+        with storage.get_db_connection() as conn:
+            index = ClientIndex(conn.execute("SELECT id, company_name, tax_id FROM clients"))
+        summary = {}
+        for table in TABLES:
+            other = "merged" if table == "clients" else "skipped"
+            counts = summary[table] = {"copied": 0, other: 0}
+            if table not in present:
+                continue
+            with storage.get_db_connection() as conn:
+                after, copied = _checkpoint(conn.cursor(), source, table)
+            for rows in _chunks(legacy, table, after, chunk_size):
+                with storage.write_transaction() as cur:
+                    if table == "clients":
+                        added, unmatched = _copy_clients(cur, source, rows, index)
+                    elif table == "calculations":
+                        added, unmatched = _copy_calculations(cur, source, rows)
+                    else:
+                        added, unmatched = _copy_quotations(cur, source, rows)
+                    copied += added
+                    _save_checkpoint(cur, source, table, rows[-1]["id"], copied)
+                counts["copied"] += added
+                counts[other] += unmatched
+                if progress:
+                    progress(table, counts["copied"] + counts[other])
+        return summary
+    finally:
+        legacy.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m quote_engine.migrate_legacy",
+                                     description="Merge a legacy calculator.db into the main database.")
+    parser.add_argument("legacy", nargs="?", default="calculator.db", help="legacy database (default: calculator.db)")
+    parser.add_argument("--db", help="database path (default: RIGC_DB_PATH or rigc_app.db)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="legacy rows per transaction")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.legacy):
+        print(f"⚠️ {args.legacy} not found", file=sys.stderr)
+        return 1
+    if args.db:
+        storage.set_db_path(args.db)
+    storage.init_db()
+    summary = migrate(args.legacy, args.chunk_size,
+                      progress=lambda table, done: print(f"… {table}: {done} rows", file=sys.stderr))
+    print(f"✅ clients: {summary['clients']['copied']} added, {summary['clients']['merged']} merged into existing"
+          f" · calculations: {summary['calculations']['copied']} copied"
+          f" · quotations: {summary['quotations']['copied']} copied"
+          f" ({summary['calculations']['skipped'] + summary['quotations']['skipped']} without a client skipped)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
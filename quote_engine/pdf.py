@@ -0,0 +1,281 @@
+"""FPDF layouts for quotes and invoices."""
+from fpdf import FPDF
+
+from . import assets, metrics, storage, tracing
+
+PDF_RENDER_SECONDS = metrics.histogram("rigc_pdf_render_seconds", "Time to build a quote or invoice PDF.",
+                                       ["document"], buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+
+class QuotePDF(FPDF):
+    def draw_logo(self):
+        """Place the shared, pre-parsed logo in the header; returns the x where the header text starts."""
+        info = assets.get("logo.pdf")
+        if info is None:
+            return 10
+        if "logo.png" not in self.images:
+            # fpdf drops the image data from its dict once written, so each document gets a copy
+            self.images["logo.png"] = dict(info, i=len(self.images) + 1)
+        self.image("logo.png", 10, 8, 25)
+        return 40
+
+    def header(self):
+        self.set_fill_color(41, 128, 185)
+        self.rect(0, 0, 210, 40, 'F')
+        logo_offset = self.draw_logo()
+        self.set_text_color(255, 255, 255)
+        self.set_font("Helvetica", "", 4)
+        self.set_xy(logo_offset, 12)
+        lines = [
+            "Parque Industrial Disdo",
+            "Calle Central No. 1, Hato Nuevo Palave",
+            "Santo Domingo Oeste",
+            "Tel: 829-439-8476 | RNC: 131-71683-2"
+        ]
+        for line in lines:
+            self.cell(0, 2, line, 0, 1, "R")
+        self.set_font("Helvetica", "B", 16)
+        self.set_xy(logo_offset, 28)
+        self.cell(0, 8, "COTIZACION", 0, 1, "R")
+        self.set_text_color(0, 0, 0)
+        self.ln(10)
+
+    def footer(self):
+        self.set_y(-50)
+
+        col_width = 85
+        left_x = 20
+        right_x = 115
+
+        line_width = col_width - 20
+
+        # ---------- LEFT SIGNATURE (AUTHORIZED) ----------
+        left_text_x = left_x + 10
+
+        self.set_font("Helvetica", "B", 10)
+        self.set_xy(left_text_x, -45)
+        self.line(
+            left_text_x,
+            self.get_y(),
+            left_text_x + line_width,
+            self.get_y()
+        )
+
+        self.set_xy(left_text_x, -40)
+        self.set_font("Helvetica", "", 8)
+        self.cell(line_width, 4, "Autorizado Por:", 0, 0, "C")
+
+        self.set_xy(left_text_x, -36)
+        self.cell(line_width, 4, "Karmary Mata", 0, 0, "C")
+
+
+    # ---------- RIGHT SIGNATURE (CLIENT) ----------
+        right_text_x = right_x + 10
+
+        self.set_xy(right_text_x, -45)
+        self.line(
+            right_text_x,
+            self.get_y(),
+            right_text_x + line_width,
+            self.get_y()
+        )
+
+        self.set_xy(right_text_x, -40)
+        self.cell(line_width, 4, "Firma Cliente", 0, 1, "C")
+
+        # ---------- FOOTER INFO ----------
+        self.set_y(-25)
+        self.set_font("Helvetica", "I", 7)
+        self.set_text_color(128, 128, 128)
+
+        self.cell(
+            0,
+            4,
+            "Parque Industrial Disdo, Calle Central No. 1, Hato Nuevo Palave",
+            0,
+            1,
+            "C"
+        )
+        self.cell(
+            0,
+            4,
+            "Santo Domingo Oeste | Tel: 829-439-8476 | RNC: 131-71683-2",
+            0,
+            1,
+            "C"
+        )
+
+        self.set_y(-15)
+        self.cell(0, 4, f"Pagina {self.page_no()}", 0, 0, "C")
+
+
+    def quote_info(self, quote_data, client_data):
+        self.set_xy(10, 55)
+        self.set_fill_color(240, 240, 240)
+        self.set_font("Helvetica", "B", 11)
+        self.cell(90, 8, "DATOS PEDIDO", 0, 1, "L", True)
+        self.set_font("Helvetica", "", 9)
+        for label, key in [("Cotizacion #:", 'quote_id'), ("Fecha:", 'date'), ("Proyecto:", 'project_name')]:
+            self.set_x(10)
+            self.cell(40, 6, label, 0, 0, "L")
+            self.set_font("Helvetica", "B", 9)
+            self.cell(50, 6, str(quote_data.get(key, 'N/A')), 0, 1, "L")
+            self.set_font("Helvetica", "", 9)
+        self.set_xy(110, 55)
+        self.set_font("Helvetica", "B", 11)
+        self.set_fill_color(240, 240, 240)
+        self.cell(90, 8, "CLIENTE", 0, 1, "L", True)
+        self.set_font("Helvetica", "", 9)
+        for label, key in [("Empresa:", 'company_name'), ("Contacto:", 'contact_name'),
+                           ("RNC/Cedula:", 'tax_id'), ("Email:", 'email'), ("Telefono:", 'phone')]:
+            if client_data.get(key):
+                self.set_x(110)
+                self.cell(40, 6, label, 0, 0, "L")
+                self.set_font("Helvetica", "B", 9)
+                if key == 'company_name':
+                    self.multi_cell(50, 6, str(client_data[key]), 0, "L")
+                else:
+                    self.cell(50, 6, str(client_data[key]), 0, 1, "L")
+                self.set_font("Helvetica", "", 9)
+        self.ln(10)
+
+    def items_table(self, items_list):
+        self.set_fill_color(52, 152, 219)
+        self.set_text_color(255, 255, 255)
+        self.set_font("Helvetica", "B", 10)
+        for text, width in [("DESCRIPCION", 90), ("CANTIDAD", 30), ("PRECIO UNIT.", 35), ("TOTAL", 35)]:
+            self.cell(width, 9, text, 1, 0, "C" if width < 90 else "L", True)
+        self.ln()
+        self.set_text_color(0, 0, 0)
+        self.set_font("Helvetica", "", 9)
+        fill = False
+        for item in items_list:
+            desc = self._clean_text(str(item["product_name"]))
+            self.set_fill_color(245, 245, 245) if fill else self.set_fill_color(255, 255, 255)
+            self.cell(90, 6, desc[:50], 1, 0, "L", fill)
+            self.cell(30, 6, f"{item['quantity']:,.2f}", 1, 0, "C", fill)
+            self.cell(35, 6, f"${item['unit_price']:,.2f}", 1, 0, "R", fill)
+            total = item["quantity"] * item["unit_price"]
+            self.cell(35, 6, f"${total:,.2f}", 1, 1, "R", fill)
+            fill = not fill
+        self.ln(5)
+
+    def cost_summary(self, totals, included_charges):
+        self.set_draw_color(52, 152, 219)
+        self.set_line_width(0.5)
+        self.set_font("Helvetica", "B", 10)
+        self.set_fill_color(240, 248, 255)
+        self.cell(0, 8, "RESUMEN FINANCIERO", 1, 1, "L", True)
+        self.set_font("Helvetica", "", 9)
+        self.set_line_width(0.2)
+        self.cell(130, 6, "Subtotal de Items:", 1, 0, "L")
+        self.cell(60, 6, f"${totals['items_total']:,.2f}", 1, 1, "R")
+        if totals.get('total_discounts', 0) > 0:
+            self.set_text_color(220, 53, 69)
+            self.cell(130, 6, "Descuentos Aplicados:", 1, 0, "L")
+            self.cell(60, 6, f"-${totals['total_discounts']:,.2f}", 1, 1, "R")
+            if totals.get('tier_discounts', 0) > 0:
+                self.cell(130, 6, "   Incluye descuentos por volumen:", 1, 0, "L")
+                self.cell(60, 6, f"-${totals['tier_discounts']:,.2f}", 1, 1, "R")
+            self.set_text_color(0, 0, 0)
+        self.set_font("Helvetica", "B", 9)
+        self.cell(130, 6, "Total Despues de Descuentos:", 1, 0, "L")
+        self.cell(60, 6, f"${totals['items_after_discount']:,.2f}", 1, 1, "R")
+        self.set_font("Helvetica", "", 9)
+        for charge in totals['charges']:
+            self.cell(130, 6, self._clean_text(charge['label']) + ":", 1, 0, "L")
+            self.cell(60, 6, f"${charge['amount']:,.2f}", 1, 1, "R")
+        self.set_font("Helvetica", "B", 10)
+        self.set_fill_color(230, 240, 250)
+        self.cell(130, 7, "SUBTOTAL GENERAL:", 1, 0, "L", True)
+        self.cell(60, 7, f"${totals['subtotal_general']:,.2f}", 1, 1, "R", True)
+        self.set_font("Helvetica", "", 9)
+        for tax in totals['taxes']:
+            self.cell(130, 6, self._clean_text(tax['label']) + ":", 1, 0, "L")
+            self.cell(60, 6, f"${tax['amount']:,.2f}", 1, 1, "R")
+        self.set_font("Helvetica", "B", 12)
+        self.set_fill_color(52, 152, 219)
+        self.set_text_color(255, 255, 255)
+        self.cell(130, 10, "TOTAL GENERAL:", 1, 0, "L", True)
+        self.cell(60, 10, f"${totals['grand_total']:,.2f}", 1, 1, "R", True)
+        self.set_text_color(0, 0, 0)
+
+    def notes_section(self, notes):
+        if notes and notes.strip():
+            self.ln(5)
+
+            # Section title
+            self.set_font("Helvetica", "B", 8.5)
+            self.set_text_color(40, 40, 40)
+            self.cell(0, 5, "NOTAS Y CONDICIONES", 0, 1, "L")
+
+            # Notes text (bold but compact)
+            self.set_font("Helvetica", "B", 6.5)
+            self.set_text_color(80, 80, 80)
+            self.multi_cell(
+                0,
+                3.6,
+                self._clean_text(notes),
+                0,
+                "L"
+            )
+
+        self.set_text_color(0, 0, 0)
+
+
+    def _clean_text(self, text):
+        replacements = {
+            "\u2022": "-", "\u2013": "-", "\u2014": "--", "\u2018": "'",
+            "\u2019": "'", "\u201c": '"', "\u201d": '"', "\u00a0": " "
+        }
+        for old, new in replacements.items():
+            text = text.replace(old, new)
+        return text.encode('latin1', errors='replace').decode('latin1')
+
+class InvoicePDF(QuotePDF):
+    def header(self):
+        self.set_fill_color(231, 76, 60)
+        self.rect(0, 0, 210, 40, 'F')
+        logo_offset = self.draw_logo()
+        self.set_text_color(255, 255, 255)
+        self.set_font("Helvetica", "", 4)
+        self.set_xy(logo_offset, 12)
+        lines = [
+            "Parque Industrial Disdo",
+            "Calle Central No. 1, Hato Nuevo Palave",
+            "Santo Domingo Oeste",
+            "Tel: 829-439-8476 | RNC: 131-71683-2"
+        ]
+        for line in lines:
+            self.cell(0, 2, line, 0, 1, "R")
+        self.set_font("Helvetica", "B", 16)
+        self.set_xy(logo_offset, 28)
+        self.cell(0, 8, "FACTURA", 0, 1, "R")
+        self.set_text_color(0, 0, 0)
+        self.ln(10)
+
+def render_quote_pdf(quote_data, client_data, items, totals, included_charges, invoice=False):
+    """Build a quote (or invoice) PDF and return its bytes."""
+    timer = PDF_RENDER_SECONDS.time(document="invoice" if invoice else "quote")
+    with timer, tracing.span("render_quote_pdf", quote_id=quote_data.get('quote_id'), items=len(items)):
+        pdf = InvoicePDF() if invoice else QuotePDF()
+        with tracing.span("pdf.layout"):
+            pdf.add_page()
+            pdf.quote_info(quote_data, client_data)
+            pdf.items_table(items)
+            pdf.cost_summary(totals, included_charges)
+            if quote_data.get('notes'):
+                pdf.notes_section(quote_data['notes'])
+        with tracing.span("pdf.output"):
+            raw = pdf.output(dest="S")
+        return raw.encode("latin-1") if isinstance(raw, str) else bytes(raw)
+
+def render_stored_quote_pdf(quote_id):
+    """Load a saved quote and render it (as an invoice when Invoiced); None if it does not exist."""
+    quote_data, items = storage.get_quote_by_id(quote_id)
+    if not quote_data:
+        return None
+    client_data = storage.get_client_by_id(quote_data["client_id"]) or {}
+    charges = storage.parse_included_charges(quote_data["included_charges"])
+    totals = storage.get_quote_totals(quote_data, items)
+    return render_quote_pdf(quote_data, client_data, items, totals, charges,
+                            invoice=quote_data["status"] == "Invoiced")
@@ -0,0 +1,183 @@
+"""Line discounts, quantity break tiers, surcharges and taxes for a quote.
+
+Rates, tiers and client price lists come from a PricingRules object; storage.get_pricing_rules()
+loads the configured ones. Without one, DEFAULT_RULES applies the original fixed rates.
+"""
+import bisect
+
+from . import metrics
+
+DEFAULT_SURCHARGES = [
+    ("supervision", "Supervision Tecnica", 0.10),
+    ("admin", "Gastos Administrativos", 0.04),
+    ("insurance", "Seguro de Riesgo", 0.01),
+    ("transport", "Transporte", 0.03),
+    ("contingency", "Imprevisto", 0.03),
+]
+DEFAULT_TAXES = [("itbis", "ITBIS", 0.18)]
+# Quotes with at least this many lines are priced with NumPy instead of a Python loop
+VECTORIZE_MIN_LINES = 200
+
+LINES_PRICED = metrics.counter("rigc_priced_lines_total", "Quote lines priced, by code path.", ["path"])
+
+def calculate_item_discount(unit_price, quantity, discount_type, discount_value):
+    subtotal = unit_price * quantity
+    if discount_type == "percentage":
+        return subtotal * (discount_value / 100)
+    elif discount_type == "fixed":
+        return discount_value
+    return 0
+
+def rate_label(label, rate):
+    """'Transporte (3%)' style label for a surcharge or tax."""
+    return f"{label} ({rate * 100:g}%)"
+
+class PricingRules:
+    """Compiled pricing rules.
+
+    surcharges / taxes: [(key, label, rate)] in display order; surcharges apply to the items
+    total after discounts when the quote includes their key, taxes apply to the subtotal.
+    tiers: {product name or None: [(min_quantity, discount_pct)]}; None holds the tiers for
+    products without their own. client_prices: {client_id: {product name: unit_price}}.
+    """
+
+    def __init__(self, surcharges=DEFAULT_SURCHARGES, taxes=DEFAULT_TAXES, tiers=None, client_prices=None):
+        self.surcharges = [(key, label, float(rate)) for key, label, rate in surcharges]
+        self.taxes = [(key, label, float(rate)) for key, label, rate in taxes]
+        self.client_prices = client_prices or {}
+        # Each tier table is a pair of sorted breakpoints and the discount % from each breakpoint on
+        self.tier_tables = []
+        self.tier_index = {}
+        for product, rows in (tiers or {}).items():
+            rows = sorted((float(q), float(pct)) for q, pct in rows)
+            self.tier_index[product] = len(self.tier_tables)
+            self.tier_tables.append((tuple(q for q, _ in rows), tuple(pct for _, pct in rows)))
+        self.default_tier = self.tier_index.pop(None, None)
+
+    @property
+    def surcharge_keys(self):
+        return [key for key, _, _ in self.surcharges]
+
+    def unit_price(self, product_name, client_id, catalog_price):
+        """Price to quote a product at for a client: their price list first, then the catalog."""
+        return self.client_prices.get(client_id, {}).get(product_name, catalog_price)
+
+    def tier_pct(self, product_name, quantity):
+        table = self.tier_index.get(product_name, self.default_tier)
+        if table is None:
+            return 0.0
+        breaks, pcts = self.tier_tables[table]
+        i = bisect.bisect_right(breaks, quantity) - 1
+        return pcts[i] if i >= 0 else 0.0
+
+    def tier_pcts(self, names, quantities):
+        """tier_pct for many lines at once; quantities is a NumPy array."""
+        import numpy as np
+
+        pcts = np.zeros(len(quantities))
+        default = -1 if self.default_tier is None else self.default_tier
+        tables = np.fromiter((self.tier_index.get(n, default) for n in names), dtype=np.int64, count=len(names))
+        for table in np.unique(tables):
+            if table < 0:
+                continue
+            mask = tables == table
+            breaks, table_pcts = self.tier_tables[table]
+            i = np.searchsorted(np.asarray(breaks), quantities[mask], side="right") - 1
+            pcts[mask] = np.where(i >= 0, np.asarray(table_pcts)[np.maximum(i, 0)], 0.0)
+        return pcts
+
+DEFAULT_RULES = PricingRules()
+
+def _line_values(p):
+    return (float(p.get('quantity') or 0), float(p.get('unit_price') or 0),
+            p.get('discount_type') or 'none', float(p.get('discount_value') or 0))
+
+def price_lines(products, rules=None):
+    """Per-line (gross, tier discount, discount incl. tier, net) tuples.
+
+    The tier discount comes off the list price first; the line's own percentage or fixed
+    discount then applies to what is left.
+    """
+    rules = rules or DEFAULT_RULES
+    if len(products) >= VECTORIZE_MIN_LINES:
+        return list(zip(*_price_lines_np(products, rules)))
+    LINES_PRICED.inc(len(products), path="python")
+    lines = []
+    for p in products:
+        quantity, unit_price, discount_type, discount_value = _line_values(p)
+        gross = quantity * unit_price
+        tier_pct = rules.tier_pct(p.get('product_name'), quantity)
+        tier = gross * tier_pct / 100
+        discount = tier + calculate_item_discount(unit_price * (1 - tier_pct / 100), quantity,
+                                                  discount_type, discount_value)
+        lines.append((gross, tier, discount, gross - discount))
+    return lines
+
+_DISCOUNT_CODES = {"percentage": 1, "fixed": 2}
+
+def _price_lines_np(products, rules):
+    import numpy as np
+
+    n = len(products)
+    LINES_PRICED.inc(n, path="numpy")
+    quantity = np.fromiter((p.get('quantity') or 0 for p in products), dtype=float, count=n)
+    unit_price = np.fromiter((p.get('unit_price') or 0 for p in products), dtype=float, count=n)
+    discount_value = np.fromiter((p.get('discount_value') or 0 for p in products), dtype=float, count=n)
+    discount_code = np.fromiter((_DISCOUNT_CODES.get(p.get('discount_type'), 0) for p in products),
+                                dtype=np.int8, count=n)
+    gross = quantity * unit_price
+    if rules.tier_tables:
+        tier = gross * rules.tier_pcts([p.get('product_name') for p in products], quantity) / 100
+    else:
+        tier = np.zeros(n)
+    own = np.where(discount_code == 1, (gross - tier) * discount_value / 100,
+                   np.where(discount_code == 2, discount_value, 0.0))
+    discount = tier + own
+    return gross, tier, discount, gross - discount
+
+def price_line_arrays(products, rules=None):
+    """price_lines() as four NumPy arrays (gross, tier, discount, net), vectorized at any size."""
+    return _price_lines_np(products, rules or DEFAULT_RULES)
+
+def calculate_quote(products, included_charges, rules=None):
+    rules = rules or DEFAULT_RULES
+    if len(products) >= VECTORIZE_MIN_LINES:
+        gross, tier, discount, _ = _price_lines_np(products, rules)
+        items_total, tier_discounts, total_discounts = float(gross.sum()), float(tier.sum()), float(discount.sum())
+    else:
+        lines = price_lines(products, rules)
+        items_total = sum(line[0] for line in lines)
+        tier_discounts = sum(line[1] for line in lines)
+        total_discounts = sum(line[2] for line in lines)
+    return quote_totals(items_total, tier_discounts, total_discounts, included_charges, rules)
+
+def quote_totals(items_total, tier_discounts, total_discounts, included_charges, rules=None):
+    """calculate_quote's result from the line aggregates, for callers that keep them up to date."""
+    rules = rules or DEFAULT_RULES
+    items_after_discount = items_total - total_discounts
+    totals = {
+        'items_total': items_total,
+        'tier_discounts': tier_discounts,
+        'total_discounts': total_discounts,
+        'items_after_discount': items_after_discount,
+        'charges': [],
+        'taxes': [],
+    }
+    subtotal = items_after_discount
+    for key, label, rate in rules.surcharges:
+        amount = items_after_discount * rate if included_charges.get(key) else 0.0
+        totals[key] = amount
+        if included_charges.get(key):
+            totals['charges'].append({'key': key, 'label': rate_label(label, rate), 'amount': amount})
+        subtotal += amount
+    tax_total = 0.0
+    for key, label, rate in rules.taxes:
+        amount = subtotal * rate
+        totals[key] = amount
+        totals['taxes'].append({'key': key, 'label': rate_label(label, rate), 'amount': amount})
+        tax_total += amount
+    totals['subtotal_general'] = subtotal
+    # 'itbis' is the total of all taxes, as the single ITBIS line always was
+    totals['itbis'] = tax_total
+    totals['grand_total'] = subtotal + tax_total
+    return totals
@@ -0,0 +1,227 @@
+"""Opt-in profiling of app reruns, background jobs and CLI commands.
+
+    RIGC_PROFILE=sample streamlit run industrial_calculator_enhanced.py
+    python -m quote_engine.profiling --mode sample -m quote_engine.batch tender.xlsx --dry-run
+
+Code wrapped in profile(name) is profiled and aggregated per name over the life of the
+process; every RIGC_PROFILE_FLUSH_EVERY sections (and at exit) the totals are written to
+RIGC_PROFILE_DIR as <name>-<pid>.*:
+
+    sample    a thread samples the profiled threads' stacks every RIGC_PROFILE_INTERVAL_MS;
+              writes .collapsed (one "frame;frame;frame count" line per stack, the input of
+              flamegraph.pl, speedscope or inferno) and .top.txt (self / inclusive hotspots)
+    cprofile  deterministic cProfile; writes .pstats and .top.txt. Only one thread is
+              profiled at a time; concurrent sections run unprofiled.
+"""
+import argparse
+import atexit
+import collections
+import cProfile
+import io
+import os
+import pstats
+import runpy
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+MODE = os.environ.get("RIGC_PROFILE", "").lower()
+PROFILE_DIR = os.environ.get("RIGC_PROFILE_DIR", "profiles")
+INTERVAL_MS = float(os.environ.get("RIGC_PROFILE_INTERVAL_MS", "5"))
+FLUSH_EVERY = int(os.environ.get("RIGC_PROFILE_FLUSH_EVERY", "20"))
+TOP_N = 40
+MODES = ("sample", "cprofile")
+
+def configure(mode=None, out=None, interval_ms=None):
+    """Change the settings for sections started from now on."""
+    global MODE, PROFILE_DIR, INTERVAL_MS
+    if mode is not None:
+        MODE = mode
+    if out is not None:
+        PROFILE_DIR = out
+    if interval_ms is not None:
+        INTERVAL_MS = float(interval_ms)
+
+def _frame_label(code):
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class SampleAggregate:
+    """Collapsed stacks for one section name: {(root, ..., leaf): samples}."""
+
+    def __init__(self):
+        self.stacks = collections.Counter()
+        self.sections = 0
+
+    def add(self, frame):
+        stack = []
+        while frame is not None:
+            stack.append(_frame_label(frame.f_code))
+            frame = frame.f_back
+        self.stacks[tuple(reversed(stack))] += 1
+
+    def hotspots(self, limit=TOP_N):
+        """[(function, self samples, inclusive samples)], most self time first."""
+        own, inclusive = collections.Counter(), collections.Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack):
+                inclusive[label] += count
+        return [(label, own[label], inclusive[label])
+                for label in sorted(inclusive, key=lambda l: (own[l], inclusive[l]), reverse=True)[:limit]]
+
+    def write(self, base):
+        with open(base + ".collapsed", "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+        total = sum(self.stacks.values()) or 1
+        with open(base + ".top.txt", "w", encoding="utf-8") as f:
+            f.write(f"{total} samples every {INTERVAL_MS:g} ms over {self.sections} sections\n")
+            f.write(f"{'self %':>7} {'incl %':>7}  function\n")
+            for label, own, inclusive in self.hotspots():
+                f.write(f"{own / total:7.1%} {inclusive / total:7.1%}  {label}\n")
+
+class CProfileAggregate:
+    def __init__(self):
+        self.stats = None
+        self.sections = 0
+
+    def add(self, profiler):
+        if self.stats is None:
+            self.stats = pstats.Stats(profiler)
+        else:
+            self.stats.add(profiler)
+
+    def write(self, base):
+        if self.stats is None:
+            return
+        self.stats.dump_stats(base + ".pstats")
+        out = io.StringIO()
+        pstats.Stats(base + ".pstats", stream=out).sort_stats("cumulative").print_stats(TOP_N)
+        with open(base + ".top.txt", "w", encoding="utf-8") as f:
+            f.write(f"{self.sections} sections\n")
+            f.write(out.getvalue())
+
+class _Sampler:
+    """One daemon thread sampling every thread currently inside a profile() section."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = {}  # thread id -> SampleAggregate
+        self.thread = None
+
+    def register(self, thread_id, aggregate):
+        with self.lock:
+            self.active[thread_id] = aggregate
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="rigc-profiler", daemon=True)
+                self.thread.start()
+
+    def unregister(self, thread_id):
+        with self.lock:
+            self.active.pop(thread_id, None)
+
+    def _run(self):
+        interval = INTERVAL_MS / 1000
+        while True:
+            time.sleep(interval)
+            with self.lock:
+                if not self.active:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, aggregate in self.active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        aggregate.add(frame)
+
+_sampler = _Sampler()
+_cprofile_lock = threading.Lock()
+_aggregates = {}
+_aggregates_lock = threading.Lock()
+
+def _aggregate(name):
+    with _aggregates_lock:
+        if name not in _aggregates:
+            _aggregates[name] = SampleAggregate() if MODE == "sample" else CProfileAggregate()
+        return _aggregates[name]
+
+@contextmanager
+def profile(name):
+    """Profile the enclosed code under `name` when RIGC_PROFILE is set; a no-op otherwise."""
+    if MODE not in MODES:
+        yield
+        return
+    aggregate = _aggregate(name)
+    try:
+        if MODE == "sample":
+            thread_id = threading.get_ident()
+            _sampler.register(thread_id, aggregate)
+            try:
+                yield
+            finally:
+                _sampler.unregister(thread_id)
+        elif _cprofile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                try:
+                    yield
+                finally:
+                    profiler.disable()
+                    aggregate.add(profiler)
+            finally:
+                _cprofile_lock.release()
+        else:
+            yield
+    finally:
+        # Counted even when the section ends in an exception, e.g. Streamlit's st.rerun()
+        with _aggregates_lock:
+            aggregate.sections += 1
+            due = FLUSH_EVERY and aggregate.sections % FLUSH_EVERY == 0
+        if due:
+            flush(name)
+
+def flush(name=None):
+    """Write the aggregated profiles (all names by default); returns the file base paths."""
+    with _aggregates_lock:
+        items = [(n, a) for n, a in _aggregates.items() if name is None or n == name]
+    if not items:
+        return []
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    bases = []
+    for n, aggregate in items:
+        base = os.path.join(PROFILE_DIR, f"{n}-{os.getpid()}")
+        aggregate.write(base)
+        bases.append(base)
+    return bases
+
+atexit.register(flush)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m quote_engine.profiling",
+                                     description="Run a module (like python -m) under the profiler.")
+    parser.add_argument("--mode", choices=MODES, default=MODE if MODE in MODES else "sample")
+    parser.add_argument("--out", default=PROFILE_DIR, help="directory for the profile files")
+    parser.add_argument("--interval-ms", type=float, default=INTERVAL_MS, help="sampling interval")
+    parser.add_argument("-m", dest="module", required=True,
+                        help="module to run, e.g. quote_engine.batch; everything after it is passed to the module")
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # Split like python -m: options before the module are ours, the rest belongs to it
+    split = argv.index("-m") + 2 if "-m" in argv else len(argv)
+    args = parser.parse_args(argv[:split])
+
+    configure(args.mode, args.out, args.interval_ms)
+    sys.argv = [args.module] + argv[split:]
+    name = args.module.rsplit(".", 1)[-1]
+    code = 0
+    try:
+        with profile(name):
+            runpy.run_module(args.module, run_name="__main__", alter_sys=True)
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    for base in flush(name):
+        print(f"🔥 Profile written to {base}.*", file=sys.stderr)
+    return code
+
+if __name__ == "__main__":
+    sys.exit(main())
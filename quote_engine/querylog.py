@@ -0,0 +1,296 @@
+"""Statement timing for every SQLite call made through storage.get_db_connection().
+
+Connections are InstrumentedConnection objects whose cursors time each statement (execute
+plus fetching its rows) and record it under a fingerprint (the SQL with literals and
+IN-lists collapsed) together with its row count and call site. Per-fingerprint counters and
+latency histograms are kept in memory (stats()); when a log path is set, statements slower
+than the threshold are appended to it as JSON lines. Inside a tracing.trace() each statement is also
+recorded as an "sql" span, and the stats are exported as a latency histogram per statement
+kind (rigc_db_query_duration_seconds) by quote_engine.metrics.
+
+Settings come from the environment and can be changed with configure():
+    RIGC_QUERY_STATS=0          plain sqlite3 connections, no instrumentation
+    RIGC_SLOW_QUERY_MS=250      slow-query threshold in milliseconds
+    RIGC_SLOW_QUERY_LOG=path    slow-query log file (default: unset, no log is written)
+    RIGC_QUERY_EXPLAIN=1        capture EXPLAIN QUERY PLAN once per fingerprint and flag
+                                statements that scan a whole table
+
+    python -m quote_engine.querylog slow_queries.jsonl    # summarize a slow-query log
+"""
+import argparse
+import functools
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+from . import metrics, tracing
+
+ENABLED = os.environ.get("RIGC_QUERY_STATS", "1") != "0"
+SLOW_QUERY_MS = float(os.environ.get("RIGC_SLOW_QUERY_MS", "250"))
+SLOW_QUERY_LOG = os.environ.get("RIGC_SLOW_QUERY_LOG", "")
+EXPLAIN = os.environ.get("RIGC_QUERY_EXPLAIN", "0") == "1"
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is unbounded
+BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)
+# Helpers whose caller is the interesting call site
+TRANSPARENT_CALLERS = {"query_db", "_begin_immediate", "_commit"}
+_SKIP_MODULES = ("quote_engine.querylog", "sqlite3", "contextlib", "pandas")
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+_lock = threading.Lock()
+_stats = {}
+
+def configure(enabled=None, slow_ms=None, log_path=None, explain=None):
+    """Change settings for connections opened from now on (log_path="" disables the log)."""
+    global ENABLED, SLOW_QUERY_MS, SLOW_QUERY_LOG, EXPLAIN
+    if enabled is not None:
+        ENABLED = enabled
+    if slow_ms is not None:
+        SLOW_QUERY_MS = float(slow_ms)
+    if log_path is not None:
+        SLOW_QUERY_LOG = log_path
+    if explain is not None:
+        EXPLAIN = explain
+
+def connection_class():
+    """The factory storage passes to sqlite3.connect()."""
+    return InstrumentedConnection if ENABLED else sqlite3.Connection
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """Normalized statement text: literals become ?, lists of placeholders become (...)."""
+    text = _SPACE.sub(" ", _NUMBER.sub("?", _STRING.sub("?", sql))).strip()
+    return _IN_LIST.sub("(...)", text)
+
+def _call_site():
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if not module.startswith(_SKIP_MODULES) and frame.f_code.co_name not in TRANSPARENT_CALLERS:
+            code = frame.f_code
+            return f"{module}.{getattr(code, 'co_qualname', code.co_name)}:{frame.f_lineno}"
+        frame = frame.f_back
+    return "?"
+
+def _explain(conn, sql, params):
+    """(plan lines, whether any step scans a whole table) or (None, False)."""
+    if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return None, False
+    try:
+        rows = sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    except (sqlite3.Error, ValueError):
+        return None, False
+    plan = [row[-1] for row in rows]
+    full_scan = any(step.startswith("SCAN ") and " INDEX " not in step for step in plan)
+    return plan, full_scan
+
+def _new_entry(key):
+    return {"fingerprint": key, "calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0,
+            "histogram": [0] * (len(BUCKETS_MS) + 1), "sites": {}, "plan": None, "full_scan": False}
+
+def _observe(sql, elapsed, rows, site, plan=None, started=None, trace_at=None):
+    key = fingerprint(sql)
+    ms = elapsed * 1000
+    if trace_at is not None:
+        tracing.record("sql", started, elapsed, trace_at, sql=key, rows=rows, site=site)
+    with _lock:
+        entry = _stats.get(key) or _stats.setdefault(key, _new_entry(key))
+        entry["calls"] += 1
+        entry["total_ms"] += ms
+        entry["max_ms"] = max(entry["max_ms"], ms)
+        entry["rows"] += max(rows, 0)
+        bucket = next((i for i, bound in enumerate(BUCKETS_MS) if ms <= bound), len(BUCKETS_MS))
+        entry["histogram"][bucket] += 1
+        entry["sites"][site] = entry["sites"].get(site, 0) + 1
+        if plan is not None:
+            entry["plan"], entry["full_scan"] = plan
+    if ms >= SLOW_QUERY_MS and SLOW_QUERY_LOG:
+        record = {"ts": datetime.now().isoformat(timespec="milliseconds"), "fingerprint": key,
+                  "sql": sql.strip(), "duration_ms": round(ms, 3), "rows": rows, "site": site,
+                  "plan": entry["plan"], "full_scan": entry["full_scan"]}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with _lock, open(SLOW_QUERY_LOG, "a", encoding="utf-8") as f:
+            f.write(line)
+
+def _needs_plan(sql):
+    if not EXPLAIN:
+        return False
+    entry = _stats.get(fingerprint(sql))
+    return entry is None or entry["plan"] is None
+
+def stats(limit=None):
+    """Per-fingerprint counters, slowest total first; histogram keys are bucket upper bounds."""
+    with _lock:
+        entries = [dict(e, sites=dict(e["sites"]), histogram=list(e["histogram"])) for e in _stats.values()]
+    entries.sort(key=lambda e: e["total_ms"], reverse=True)
+    for e in entries:
+        e["mean_ms"] = e["total_ms"] / e["calls"]
+        e["histogram"] = dict(zip([str(b) for b in BUCKETS_MS] + ["inf"], e["histogram"]))
+    return entries[:limit] if limit else entries
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+def _query_metrics():
+    kinds = {}
+    with _lock:
+        for e in _stats.values():
+            kind = e["fingerprint"].split(" ", 1)[0].upper()
+            agg = kinds.setdefault(kind, [[0] * (len(BUCKETS_MS) + 1), 0.0, 0])
+            agg[0] = [a + b for a, b in zip(agg[0], e["histogram"])]
+            agg[1] += e["total_ms"] / 1000
+            agg[2] += e["calls"]
+    bounds = [b / 1000 for b in BUCKETS_MS]
+    samples = [sample for kind, (counts, total, calls) in sorted(kinds.items())
+               for sample in metrics.histogram_samples((kind,), bounds, counts, total, calls)]
+    return [("rigc_db_query_duration_seconds", "histogram", "SQLite statement latency by statement kind.",
+             ("statement",), samples)]
+
+metrics.register_collector(_query_metrics)
+metrics.register_cache("sql_fingerprint", lambda: fingerprint.cache_info()[:2])
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times each statement until its rows are consumed or it runs another."""
+
+    _pending = None
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending:
+            sql, elapsed, rows, site, plan, started, trace_at = pending
+            if rows == 0 and self.rowcount > 0:
+                rows = self.rowcount
+            _observe(sql, elapsed, rows, site, plan, started, trace_at)
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            if self._pending:
+                self._pending[1] += time.perf_counter() - start
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        site = _call_site()
+        plan = _explain(self.connection, sql, parameters) if _needs_plan(sql) else None
+        start = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        finally:
+            self._pending = [sql, time.perf_counter() - start, 0, site, plan, start, tracing.position()]
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        site = _call_site()
+        start = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        finally:
+            self._pending = [sql, time.perf_counter() - start, 0, site, None, start, tracing.position()]
+        self._finish()
+        return self
+
+    def executescript(self, sql_script):
+        self._finish()
+        return super().executescript(sql_script)
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        elif self._pending:
+            self._pending[2] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, self.arraysize if size is None else size)
+        if self._pending:
+            self._pending[2] += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        if self._pending:
+            self._pending[2] += len(rows)
+        self._finish()
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        if self._pending:
+            self._pending[2] += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors, including those behind execute(), are InstrumentedCursors."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def summarize_log(path):
+    """Aggregate a slow-query log by fingerprint, slowest total first."""
+    summary = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            r = json.loads(line)
+            s = summary.setdefault(r["fingerprint"], {"fingerprint": r["fingerprint"], "calls": 0, "total_ms": 0.0,
+                                                      "max_ms": 0.0, "sites": set(), "full_scan": False})
+            s["calls"] += 1
+            s["total_ms"] += r["duration_ms"]
+            s["max_ms"] = max(s["max_ms"], r["duration_ms"])
+            s["sites"].add(r["site"])
+            s["full_scan"] = s["full_scan"] or bool(r.get("full_scan"))
+    return sorted(summary.values(), key=lambda s: s["total_ms"], reverse=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m quote_engine.querylog", description="Summarize a slow-query log.")
+    parser.add_argument("log", nargs="?", default=SLOW_QUERY_LOG or "slow_queries.jsonl",
+                        help="slow-query log (default: RIGC_SLOW_QUERY_LOG or slow_queries.jsonl)")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.log):
+        print(f"⚠️ {args.log} not found", file=sys.stderr)
+        return 1
+    for s in summarize_log(args.log)[:args.top]:
+        flag = "🔍 SCAN " if s["full_scan"] else ""
+        print(f"{s['total_ms']:10.1f} ms  {s['calls']:5d}x  max {s['max_ms']:8.1f} ms  {flag}{s['fingerprint'][:120]}")
+        print(f"{'':33}{', '.join(sorted(s['sites']))[:120]}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""Local HTTP quoting service (plain ASGI, no framework).
+
+    python -m quote_engine.service --port 8502 --pdf-workers 4
+
+Endpoints (JSON in and out; request bodies use the batch.py quote format):
+    GET  /health                     service status and PDF queue depth
+    GET  /metrics                    Prometheus metrics of the service process
+    POST /quotes/price               price a quote without saving it
+    POST /quotes                     validate, price and save a quote
+    GET  /quotes/{quote_id}          a saved quote with its items and totals
+    GET  /quotes/{quote_id}/pdf      the quote (or invoice) PDF
+
+PDFs are rendered in a bounded process pool. When more than --max-pending renders are
+queued the service answers 503 with Retry-After instead of queueing without limit.
+"""
+import argparse
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import unquote
+
+from . import metrics, storage
+from .batch import client_index, validate_request
+
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+PDF_PENDING = metrics.gauge("rigc_service_pdf_pending", "PDF renders queued or running in the pool.")
+PDF_SECONDS = metrics.histogram("rigc_service_pdf_seconds", "PDF request time including the pool queue.",
+                                buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or []
+
+def _render_pdf(quote_id):
+    from .pdf import render_stored_quote_pdf
+
+    return render_stored_quote_pdf(quote_id)
+
+class QuoteService:
+    """ASGI application; one instance owns the PDF pool and its backpressure counter."""
+
+    def __init__(self, pdf_workers=None, max_pending=None):
+        self.pdf_workers = pdf_workers or os.cpu_count() or 2
+        self.max_pending = max_pending or self.pdf_workers * 4
+        self.pending = 0
+        self.pool = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await asyncio.to_thread(storage.init_db)
+                self.pool = ProcessPoolExecutor(max_workers=self.pdf_workers,
+                                                initializer=storage.set_db_path, initargs=(storage.DB_PATH,))
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.pool:
+                    self.pool.shutdown(wait=True, cancel_futures=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        method, path = scope["method"], scope["path"].rstrip("/")
+        try:
+            body = await self._read_body(receive) if method in ("POST", "PUT") else b""
+            status, headers, payload = await self._route(method, path, body)
+        except HTTPError as e:
+            status, headers = e.status, e.headers
+            payload = {"error": e.message}
+        except Exception as e:
+            status, headers, payload = 500, [], {"error": str(e)}
+        if isinstance(payload, str):
+            content_type = metrics.CONTENT_TYPE.encode()
+            payload = payload.encode("utf-8")
+        elif isinstance(payload, bytes):
+            content_type = b"application/pdf"
+        else:
+            content_type = b"application/json"
+            payload = json.dumps(payload, default=str).encode("utf-8")
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", content_type),
+                                (b"content-length", str(len(payload)).encode())] + headers})
+        await send({"type": "http.response.body", "body": payload})
+
+    async def _read_body(self, receive):
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                raise HTTPError(413, "request body too large")
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+    async def _route(self, method, path, body):
+        parts = [unquote(p) for p in path.split("/") if p]
+        if parts == ["health"] and method == "GET":
+            return 200, [], {"status": "ok", "pdf_pending": self.pending, "pdf_max_pending": self.max_pending}
+        if parts == ["metrics"] and method == "GET":
+            return 200, [], metrics.render()
+        if parts == ["quotes", "price"] and method == "POST":
+            return 200, [], await self.price(self._json(body))
+        if parts == ["quotes"] and method == "POST":
+            return 201, [], await self.save(self._json(body))
+        if len(parts) == 2 and parts[0] == "quotes" and method == "GET":
+            return 200, [], await self.get(parts[1])
+        if len(parts) == 3 and parts[0] == "quotes" and parts[2] == "pdf" and method == "GET":
+            pdf = await self.pdf(parts[1])
+            return 200, [(b"content-disposition", f'inline; filename="{parts[1]}.pdf"'.encode())], pdf
+        raise HTTPError(404, f"no route for {method} {path or '/'}")
+
+    @staticmethod
+    def _json(body):
+        try:
+            return json.loads(body or b"{}")
+        except ValueError:
+            raise HTTPError(400, "body is not valid JSON")
+
+    async def _validate(self, request):
+        def check():
+            clients_by_name, client_ids = client_index(storage.get_all_clients())
+            catalog = {p["name"].strip().lower(): p["unit_price"] for p in storage.get_products_for_dropdown()}
+            return validate_request(request, clients_by_name, catalog, client_ids, storage.get_pricing_rules())
+
+        quote, errors = await asyncio.to_thread(check)
+        if errors:
+            raise HTTPError(422, "; ".join(errors))
+        return quote
+
+    async def price(self, request):
+        # Priced once, by validate_request, in the worker thread that also loads the rules
+        quote = await self._validate(request)
+        return {"items": quote["items"], "included_charges": quote["included_charges"], "totals": quote["totals"]}
+
+    async def save(self, request):
+        quote = await self._validate(request)
+        quote_id = await asyncio.to_thread(
+            storage.save_quote_to_db, quote["client_id"], quote["project_name"], quote["items"],
+            quote["total"], quote["notes"], quote["included_charges"], totals=quote["totals"])
+        return {"quote_id": quote_id, "total": quote["total"]}
+
+    async def get(self, quote_id):
+        def load():
+            quote_data, items = storage.get_quote_by_id(quote_id)
+            return quote_data, items, quote_data and storage.get_quote_totals(quote_data, items)
+
+        quote_data, items, totals = await asyncio.to_thread(load)
+        if not quote_data:
+            raise HTTPError(404, f"quote {quote_id} not found")
+        return {"quote": quote_data, "items": items, "totals": totals}
+
+    async def pdf(self, quote_id):
+        if self.pending >= self.max_pending:
+            raise HTTPError(503, "PDF queue is full, retry shortly", [(b"retry-after", b"1")])
+        self.pending += 1
+        PDF_PENDING.inc()
+        try:
+            with PDF_SECONDS.time():
+                pdf = await asyncio.get_running_loop().run_in_executor(self.pool, _render_pdf, quote_id)
+        finally:
+            self.pending -= 1
+            PDF_PENDING.dec()
+        if pdf is None:
+            raise HTTPError(404, f"quote {quote_id} not found")
+        return pdf
+
+app = QuoteService()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m quote_engine.service", description="Local quoting service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--db", help="database path (default: RIGC_DB_PATH or rigc_app.db)")
+    parser.add_argument("--pdf-workers", type=int, default=None, help="PDF processes (default: CPU count)")
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="queued PDF renders before answering 503 (default: 4 per worker)")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    if args.db:
+        storage.set_db_path(args.db)
+    uvicorn.run(QuoteService(args.pdf_workers, args.max_pending), host=args.host, port=args.port,
+                lifespan="on", access_log=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1578 @@
+"""SQLite storage for clients, products, quotes, warehouse calculations, quote history and
+report rollups.
+
+Nothing touches the database at import time; call init_db() once per process.
+"""
+import ast
+import contextvars
+import difflib
+import json
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from . import metrics, querylog, tracing
+from .pricing import DEFAULT_SURCHARGES, DEFAULT_TAXES, PricingRules, calculate_quote
+
+DB_PATH = os.environ.get("RIGC_DB_PATH", "rigc_app.db")
+PRODUCTS_CSV_PATH = os.environ.get("RIGC_PRODUCTS_CSV", "products.csv")
+
+# Quote history: every Nth version is stored in full, the rest as compressed deltas
+HISTORY_CHECKPOINT_INTERVAL = 10
+HISTORY_KEEP_VERSIONS = 50
+HISTORY_MAX_AGE_DAYS = 365
+# Versions a quote may go past HISTORY_KEEP_VERSIONS before a save compacts it, so the re-encode
+# of the kept versions runs once per HISTORY_COMPACT_SLACK saves instead of on every save
+HISTORY_COMPACT_SLACK = 25
+HISTORY_ITEM_FIELDS = ("product_name", "quantity", "unit_price", "discount_type", "discount_value", "auto_imported",
+                       "tier_pct")
+HISTORY_DIFF_FIELDS = ("quantity", "unit_price", "discount_type", "discount_value")
+HISTORY_QUOTE_FIELDS = ("project_name", "notes", "included_charges", "total_amount", "status")
+
+# Prices already in the catalog when price history was introduced are dated here
+PRICE_HISTORY_START = "1970-01-01T00:00:00"
+# Seconds another process's pricing-rule edits may take to show up in this one
+PRICING_RULES_TTL_SECONDS = 30
+
+# Writes: seconds SQLite waits for a lock, then retries of the whole transaction with jittered backoff
+BUSY_TIMEOUT_SECONDS = 5
+WRITE_RETRIES = 3
+WRITE_RETRY_BASE_SECONDS = 0.05
+WRITE_BATCH_MAX = 64
+
+QUOTES_SAVED = metrics.counter("rigc_quotes_saved_total", "Quotes written to the database.", ["mode"])
+CATALOG_SYNC_SECONDS = metrics.histogram("rigc_catalog_sync_seconds", "Duration of catalog CSV syncs.",
+                                         buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+CATALOG_SYNC_PRODUCTS = metrics.counter("rigc_catalog_sync_products_total", "Catalog rows synced from CSV.",
+                                        ["result"])
+
+# ----------------------------
+# DATABASE SETUP
+# ----------------------------
+def set_db_path(db_path):
+    """Point this process at another database, e.g. from a worker pool initializer."""
+    global DB_PATH
+    DB_PATH = db_path
+
+def get_db_connection():
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False,
+                           factory=querylog.connection_class())
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def init_db():
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        # WAL lets readers carry on while a write transaction is open
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS clients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            company_name TEXT NOT NULL,
+            contact_name TEXT,
+            email TEXT,
+            phone TEXT,
+            address TEXT,
+            tax_id TEXT,
+            notes TEXT
+        )
+        """)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            description TEXT,
+            unit_price REAL NOT NULL
+        )
+        """)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS quotes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            quote_id TEXT UNIQUE NOT NULL,
+            client_id INTEGER NOT NULL,
+            project_name TEXT,
+            date TEXT NOT NULL,
+            total_amount REAL NOT NULL,
+            status TEXT NOT NULL DEFAULT 'Draft',
+            notes TEXT,
+            included_charges TEXT,
+            FOREIGN KEY (client_id) REFERENCES clients(id)
+        )
+        """)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS quote_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            quote_id TEXT NOT NULL,
+            product_name TEXT NOT NULL,
+            quantity REAL NOT NULL,
+            unit_price REAL NOT NULL,
+            discount_type TEXT DEFAULT 'none',
+            discount_value REAL DEFAULT 0,
+            auto_imported BOOLEAN DEFAULT 0,
+            FOREIGN KEY (quote_id) REFERENCES quotes(quote_id)
+        )
+        """)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS quote_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            quote_id TEXT NOT NULL,
+            snapshot_date TEXT NOT NULL,
+            snapshot_data TEXT NOT NULL
+        )
+        """)
+        # Add missing columns if needed
+        try:
+            cur.execute("SELECT discount_type FROM quote_items LIMIT 1")
+        except sqlite3.OperationalError:
+            cur.execute("ALTER TABLE quote_items ADD COLUMN discount_type TEXT DEFAULT 'none'")
+            cur.execute("ALTER TABLE quote_items ADD COLUMN discount_value REAL DEFAULT 0")
+        try:
+            cur.execute("SELECT version FROM quote_history LIMIT 1")
+        except sqlite3.OperationalError:
+            # Legacy rows are full JSON snapshots; number them in insertion order
+            cur.execute("ALTER TABLE quote_history ADD COLUMN version INTEGER")
+            cur.execute("ALTER TABLE quote_history ADD COLUMN encoding TEXT NOT NULL DEFAULT 'json'")
+            cur.execute("ALTER TABLE quote_history ADD COLUMN item_count INTEGER")
+            cur.execute("ALTER TABLE quote_history ADD COLUMN total_amount REAL")
+            cur.execute("""
+                UPDATE quote_history SET
+                    version = (SELECT COUNT(*) FROM quote_history h
+                               WHERE h.quote_id = quote_history.quote_id AND h.id <= quote_history.id),
+                    item_count = COALESCE(json_array_length(snapshot_data, '$.data.items'),
+                                          json_array_length(snapshot_data, '$.items')),
+                    total_amount = COALESCE(json_extract(snapshot_data, '$.data.quote.total_amount'),
+                                            json_extract(snapshot_data, '$.quote_data.total_amount'))
+            """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_quote_history_version ON quote_history (quote_id, version)")
+        # Catalog links for analytics; filled lazily by analytics.resolve_product_ids
+        try:
+            cur.execute("SELECT product_id FROM quote_items LIMIT 1")
+        except sqlite3.OperationalError:
+            cur.execute("ALTER TABLE quote_items ADD COLUMN product_id INTEGER REFERENCES products(id)")
+        # Volume-tier % each line was priced with, so report nets match the quote totals
+        backfill_tiers = False
+        try:
+            cur.execute("SELECT tier_pct FROM quote_items LIMIT 1")
+        except sqlite3.OperationalError:
+            cur.execute("ALTER TABLE quote_items ADD COLUMN tier_pct REAL NOT NULL DEFAULT 0")
+            backfill_tiers = True
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS product_aliases (
+            alias TEXT PRIMARY KEY,
+            product_id INTEGER NOT NULL,
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_quote_items_quote ON quote_items (quote_id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_quote_items_product ON quote_items (product_id, product_name)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_quotes_date ON quotes (date, status)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_quotes_client ON quotes (client_id, date)")
+        # Warehouse calculations and their quotations (formerly database.py's calculator.db)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS calculations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            client_id INTEGER NOT NULL,
+            project_name TEXT,
+            warehouse_length REAL,
+            warehouse_width REAL,
+            lateral_height REAL,
+            roof_height REAL,
+            materials_json TEXT NOT NULL DEFAULT '{}',
+            total_amount REAL,
+            created_date TEXT NOT NULL,
+            FOREIGN KEY (client_id) REFERENCES clients(id)
+        )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_calculations_client ON calculations (client_id, created_date)")
+        try:
+            cur.execute("SELECT calculation_id FROM quotes LIMIT 1")
+        except sqlite3.OperationalError:
+            cur.execute("ALTER TABLE quotes ADD COLUMN calculation_id INTEGER REFERENCES calculations(id)")
+            cur.execute("ALTER TABLE quotes ADD COLUMN valid_until TEXT")
+        # Client timestamps the calculator.db layer kept (database.get_client_by_id returns them)
+        try:
+            cur.execute("SELECT created_date FROM clients LIMIT 1")
+        except sqlite3.OperationalError:
+            cur.execute("ALTER TABLE clients ADD COLUMN created_date TEXT")
+            cur.execute("ALTER TABLE clients ADD COLUMN updated_date TEXT")
+        # calculate_quote breakdown at save time (JSON), so saved quotes keep the rates they were priced with
+        try:
+            cur.execute("SELECT pricing FROM quotes LIMIT 1")
+        except sqlite3.OperationalError:
+            cur.execute("ALTER TABLE quotes ADD COLUMN pricing TEXT")
+        # Report rollups, kept in step with quotes by _apply_quote_rollup
+        rollups_exist = cur.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'report_monthly'"
+        ).fetchone()
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS report_monthly (
+            month TEXT NOT NULL,
+            status TEXT NOT NULL,
+            quote_count INTEGER NOT NULL DEFAULT 0,
+            total_value REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, status)
+        )
+        """)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS report_clients (
+            client_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            quote_count INTEGER NOT NULL DEFAULT 0,
+            total_value REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (client_id, status)
+        )
+        """)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS report_products (
+            product_name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            line_count INTEGER NOT NULL DEFAULT 0,
+            quantity REAL NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (product_name, status)
+        )
+        """)
+        if not rollups_exist:
+            _rebuild_report_rollups(cur)
+        # Background job queue (see jobs.py); times are Unix seconds
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL DEFAULT '{}',
+            dedupe_key TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            priority INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            error TEXT,
+            result BLOB,
+            result_type TEXT,
+            worker TEXT,
+            created_at REAL NOT NULL,
+            run_after REAL NOT NULL,
+            heartbeat_at REAL,
+            finished_at REAL
+        )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, priority DESC, run_after, id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (dedupe_key, status)")
+        # Append-only catalog price history; products.unit_price stays the current price
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS product_prices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            unit_price REAL NOT NULL,
+            valid_from TEXT NOT NULL,
+            source TEXT NOT NULL DEFAULT 'manual',
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_product_prices_asof ON product_prices (product_id, valid_from)")
+        cur.execute("""
+            INSERT INTO product_prices (product_id, unit_price, valid_from, source)
+            SELECT id, unit_price, ?, 'initial' FROM products p
+            WHERE NOT EXISTS (SELECT 1 FROM product_prices h WHERE h.product_id = p.id)
+        """, (PRICE_HISTORY_START,))
+        # Pricing rules (see pricing.PricingRules); seeded with the original fixed rates
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS pricing_charges (
+            key TEXT PRIMARY KEY,
+            kind TEXT NOT NULL CHECK (kind IN ('surcharge', 'tax')),
+            label TEXT NOT NULL,
+            rate REAL NOT NULL,
+            sort_order INTEGER NOT NULL DEFAULT 0
+        )
+        """)
+        cur.executemany("INSERT OR IGNORE INTO pricing_charges (key, kind, label, rate, sort_order) VALUES (?, ?, ?, ?, ?)",
+                        [(key, "surcharge", label, rate, n) for n, (key, label, rate) in enumerate(DEFAULT_SURCHARGES)]
+                        + [(key, "tax", label, rate, n) for n, (key, label, rate) in enumerate(DEFAULT_TAXES)])
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS price_tiers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER,
+            min_quantity REAL NOT NULL,
+            discount_pct REAL NOT NULL,
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        )
+        """)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS client_prices (
+            client_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            unit_price REAL NOT NULL,
+            PRIMARY KEY (client_id, product_id),
+            FOREIGN KEY (client_id) REFERENCES clients(id),
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        )
+        """)
+        if backfill_tiers:
+            _backfill_tier_pcts(cur)
+
+        conn.commit()
+    
+    # Auto-sync products from CSV if file exists
+    if os.path.exists(PRODUCTS_CSV_PATH):
+        try:
+            result, msg = sync_products_from_csv()
+            if result:
+                print(f"✅ Products auto-synced from CSV: {msg}")
+        except Exception as e:
+            print(f"⚠️ Error auto-syncing from CSV: {str(e)}")
+    else:
+        # Only insert sample products if CSV doesn't exist AND products table is empty
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT COUNT(*) FROM products")
+            if cur.fetchone()[0] == 0:
+                print("⚠️ No products.csv found. Creating sample products...")
+                samples = [
+                    ("Steel Beam IPE 200", "European standard I-beam", 125.50),
+                    ("Galvanized Sheet 2mm", "Corrosion-resistant roofing", 45.75),
+                    ("Anchor Bolts M20", "Heavy-duty foundation bolts", 8.90),
+                ]
+                cur.executemany("INSERT INTO products (name, description, unit_price) VALUES (?, ?, ?)", samples)
+                _record_prices(cur, cur.execute("SELECT id, unit_price FROM products").fetchall(), "initial")
+                conn.commit()
+                print("✅ Sample products created")
+
+
+# ----------------------------
+# DATABASE HELPERS
+# ----------------------------
+def query_db(query, params=(), fetch_one=False, fetch_all=False):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        if fetch_one:
+            return cur.fetchone()
+        elif fetch_all:
+            return cur.fetchall()
+        else:
+            conn.commit()
+
+def _is_busy(error):
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in str(error) or "busy" in str(error))
+
+def _retry_delay(attempt):
+    return WRITE_RETRY_BASE_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5)
+
+def _begin_immediate(cur):
+    for attempt in range(WRITE_RETRIES + 1):
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            return
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e) or attempt == WRITE_RETRIES:
+                raise
+            time.sleep(_retry_delay(attempt))
+
+@contextmanager
+def write_transaction():
+    """Yield a cursor inside BEGIN IMMEDIATE; commit on success, roll back on error.
+
+    For large writes (bulk inserts, CSV sync, maintenance). Small interactive writes go
+    through execute_write so concurrent sessions share commits.
+    """
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        _begin_immediate(cur)
+        yield cur
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+class _WriteChannel:
+    """One writer thread per process; operations queued meanwhile are committed together.
+
+    Each operation runs in its own savepoint, so one failing operation does not undo the
+    others in its group. If the database stays locked the whole group is retried. Operations
+    run in their submitter's context, so their statements land in the submitter's trace.
+    """
+
+    def __init__(self):
+        self.ops = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, fn):
+        if threading.current_thread() is self.thread:
+            raise RuntimeError("execute_write cannot be nested inside a write operation")
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                self.thread.start()
+        future = Future()
+        self.ops.put((fn, future, contextvars.copy_context()))
+        with tracing.span("execute_write"):
+            return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self.ops.get()]
+            while len(batch) < WRITE_BATCH_MAX:
+                try:
+                    batch.append(self.ops.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch):
+        for attempt in range(WRITE_RETRIES + 1):
+            outcomes = []
+            conn = get_db_connection()
+            try:
+                cur = conn.cursor()
+                _begin_immediate(cur)
+                for fn, _, context in batch:
+                    cur.execute("SAVEPOINT op")
+                    try:
+                        outcomes.append((True, context.run(fn, cur)))
+                    except Exception as e:
+                        cur.execute("ROLLBACK TO op")
+                        if _is_busy(e):
+                            raise
+                        outcomes.append((False, e))
+                    cur.execute("RELEASE op")
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                if _is_busy(e) and attempt < WRITE_RETRIES:
+                    time.sleep(_retry_delay(attempt))
+                    continue
+                outcomes = [(False, e)] * len(batch)
+            finally:
+                conn.close()
+            for (_, future, _), (ok, value) in zip(batch, outcomes):
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+            return
+
+_write_channel = _WriteChannel()
+
+def execute_write(fn):
+    """Run fn(cursor) as one atomic write through this process's writer and return its result.
+
+    Exceptions raised by fn are re-raised to the caller after its changes are rolled back.
+    """
+    return _write_channel.submit(fn)
+
+def allocate_quote_ids(cur, count=1):
+    """Reserve `count` consecutive COT numbers for this year using an open cursor.
+
+    Numbers are compared numerically, so COT-2026-1000 follows COT-2026-999.
+    Run inside the transaction that inserts the quotes so the block cannot be taken twice.
+    """
+    year = datetime.now().year
+    prefix = f"COT-{year}-"
+    last = cur.execute(f"""
+        SELECT MAX(CAST(substr(quote_id, {len(prefix) + 1}) AS INTEGER)) FROM quotes
+        WHERE quote_id LIKE ?
+    """, (prefix + "%",)).fetchone()[0]
+    start = (last or 0) + 1
+    return [f"{prefix}{n:03d}" for n in range(start, start + count)]
+
+def get_next_quote_id():
+    with get_db_connection() as conn:
+        return allocate_quote_ids(conn.cursor())[0]
+
+def add_client(company, contact="", email="", phone="", address="", tax_id="", notes=""):
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def op(cur):
+        cur.execute("""
+            INSERT INTO clients (company_name, contact_name, email, phone, address, tax_id, notes,
+                                 created_date, updated_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (company, contact, email, phone, address, tax_id, notes, now, now))
+        return cur.lastrowid
+    return execute_write(op)
+
+def update_client(client_id, company, contact="", email="", phone="", address="", tax_id="", notes=""):
+    execute_write(lambda cur: cur.execute("""
+        UPDATE clients SET
+            company_name = ?, contact_name = ?, email = ?, phone = ?,
+            address = ?, tax_id = ?, notes = ?, updated_date = ?
+        WHERE id = ?
+    """, (company, contact, email, phone, address, tax_id, notes,
+          datetime.now().strftime("%Y-%m-%d %H:%M:%S"), client_id)))
+
+def get_all_clients():
+    rows = query_db("SELECT * FROM clients ORDER BY company_name", fetch_all=True)
+    return [dict(row) for row in rows]
+
+def get_client_by_id(client_id):
+    row = query_db("SELECT * FROM clients WHERE id = ?", (client_id,), fetch_one=True)
+    return dict(row) if row else None
+
+def search_clients(term):
+    """Clients whose company, contact, email, phone or tax id contains `term`."""
+    pattern = f"%{term}%"
+    rows = query_db("""
+        SELECT * FROM clients
+        WHERE company_name LIKE ? OR contact_name LIKE ? OR email LIKE ? OR phone LIKE ? OR tax_id LIKE ?
+        ORDER BY company_name
+    """, (pattern,) * 5, fetch_all=True)
+    return [dict(row) for row in rows]
+
+def delete_client(client_id):
+    """Delete a client with its quotes (and their items and history), calculations and prices."""
+    def op(cur):
+        _apply_rollup_where(cur, "q.client_id = ?", (client_id,), -1)
+        for table in ("quote_items", "quote_history"):
+            cur.execute(f"DELETE FROM {table} WHERE quote_id IN (SELECT quote_id FROM quotes WHERE client_id = ?)",
+                        (client_id,))
+        cur.execute("DELETE FROM quotes WHERE client_id = ?", (client_id,))
+        cur.execute("DELETE FROM calculations WHERE client_id = ?", (client_id,))
+        cur.execute("DELETE FROM client_prices WHERE client_id = ?", (client_id,))
+        cur.execute("DELETE FROM report_clients WHERE client_id = ?", (client_id,))
+        cur.execute("DELETE FROM clients WHERE id = ?", (client_id,))
+    execute_write(op)
+
+def _quote_pricing(items, included_charges, rules):
+    """The totals breakdown stored in quotes.pricing (see get_quote_totals) and each line's
+    volume-tier % for quote_items.tier_pct."""
+    tier_pcts = [rules.tier_pct(item.get("product_name"), float(item.get("quantity") or 0)) for item in items]
+    return json.dumps(calculate_quote(items, included_charges, rules), default=float), tier_pcts
+
+def _saved_pricing(items, included_charges, totals, rules=None):
+    """_quote_pricing, or the caller's own calculate_quote result when it passed one; the lines
+    then carry their tier % as item["tier_pct"]."""
+    if totals is not None:
+        return json.dumps(totals, default=float), [item.get("tier_pct") or 0 for item in items]
+    return _quote_pricing(items, included_charges, rules or get_pricing_rules())
+
+def _insert_quote_items(cur, quote_id, items, tier_pcts=None):
+    """Insert a quote's lines; without tier_pcts each item keeps its own stored tier_pct."""
+    if tier_pcts is None:
+        tier_pcts = [item.get("tier_pct") or 0 for item in items]
+    cur.executemany("""
+        INSERT INTO quote_items (
+            quote_id, product_name, quantity, unit_price,
+            discount_type, discount_value, auto_imported, tier_pct
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(
+        quote_id,
+        item["product_name"],
+        item["quantity"],
+        item["unit_price"],
+        item.get("discount_type") or "none",
+        item.get("discount_value") or 0,
+        int(item.get("auto_imported") or 0),
+        tier_pct
+    ) for item, tier_pct in zip(items, tier_pcts)])
+
+def _insert_quote(cur, quote_id, client_id, project_name, items, total, notes, included_charges,
+                  status="Draft", date_str=None, pricing=None, tier_pcts=None):
+    cur.execute("""
+        INSERT INTO quotes (quote_id, client_id, project_name, date, total_amount, status, notes, included_charges,
+                            pricing)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (quote_id, client_id, project_name, date_str or datetime.now().strftime("%Y-%m-%d"),
+          total, status, notes, str(included_charges), pricing))
+    _insert_quote_items(cur, quote_id, items, tier_pcts)
+    _apply_quote_rollup(cur, quote_id, 1)
+
+def save_quote_to_db(client_id, project_name, items, total, notes, included_charges, status="Draft", totals=None):
+    """Insert a quote; pass totals (calculate_quote's result, with each item's tier_pct) when the
+    caller has already priced it, so it is stored as-is instead of being priced again."""
+    pricing, tier_pcts = _saved_pricing(items, included_charges, totals)
+
+    def op(cur):
+        quote_id = allocate_quote_ids(cur)[0]
+        _insert_quote(cur, quote_id, client_id, project_name, items, total, notes, included_charges, status,
+                      pricing=pricing, tier_pcts=tier_pcts)
+        return quote_id
+    quote_id = execute_write(op)
+    QUOTES_SAVED.inc(mode="single")
+    return quote_id
+
+def save_quotes_bulk(quotes):
+    """Insert many quotes in one transaction with a single block of quote numbers.
+
+    Each entry is a dict with the save_quote_to_db arguments: client_id, project_name, items,
+    total, notes, included_charges and optionally status and totals (as from
+    batch.validate_request). Returns the quote ids in order.
+    """
+    if not quotes:
+        return []
+    rules = get_pricing_rules() if any(q.get("totals") is None for q in quotes) else None
+    pricing = [_saved_pricing(q["items"], q["included_charges"], q.get("totals"), rules) for q in quotes]
+    with write_transaction() as cur:
+        quote_ids = allocate_quote_ids(cur, len(quotes))
+        date_str = datetime.now().strftime("%Y-%m-%d")
+        for quote_id, q, (priced, tier_pcts) in zip(quote_ids, quotes, pricing):
+            _insert_quote(cur, quote_id, q["client_id"], q.get("project_name", ""), q["items"], q["total"],
+                          q.get("notes", ""), q["included_charges"], q.get("status", "Draft"), date_str,
+                          priced, tier_pcts)
+    QUOTES_SAVED.inc(len(quote_ids), mode="bulk")
+    return quote_ids
+
+def _update_quote_status(cur, quote_id, status):
+    new_id = quote_id
+    _apply_quote_rollup(cur, quote_id, -1)
+    if status == "Invoiced":
+        invoice_id = quote_id.replace("COT-", "INV-")
+        existing = cur.execute("SELECT quote_id FROM quotes WHERE quote_id = ?", (invoice_id,)).fetchone()
+        if not existing:
+            cur.execute("UPDATE quote_items SET quote_id = ? WHERE quote_id = ?", (invoice_id, quote_id))
+            new_id = invoice_id
+    cur.execute("UPDATE quotes SET status = ?, quote_id = ? WHERE quote_id = ?", (status, new_id, quote_id))
+    _apply_quote_rollup(cur, new_id, 1)
+    return new_id
+
+def update_quote_status(quote_id, status):
+    return execute_write(lambda cur: _update_quote_status(cur, quote_id, status))
+
+def convert_quotes_to_invoices(quote_ids):
+    """Invoice many drafts in one transaction; returns {quote_id: invoice_id} for those converted.
+
+    Same numbering as update_quote_status (COT-… becomes INV-…, keeping the COT number if
+    that invoice number is taken). Ids that are missing or not Draft are skipped. Nothing is
+    converted if the transaction fails.
+    """
+    if not quote_ids:
+        return {}
+    with write_transaction() as cur:
+        # Temp tables live on this connection only and vanish when it closes
+        cur.execute("CREATE TEMP TABLE invoice_batch (quote_id TEXT PRIMARY KEY, invoice_id TEXT NOT NULL)")
+        cur.execute("""
+            INSERT INTO temp.invoice_batch (quote_id, invoice_id)
+            SELECT q.quote_id, CASE WHEN EXISTS (SELECT 1 FROM quotes x WHERE x.quote_id = replace(q.quote_id, 'COT-', 'INV-'))
+                                    THEN q.quote_id ELSE replace(q.quote_id, 'COT-', 'INV-') END
+            FROM quotes q WHERE q.status = 'Draft' AND q.quote_id IN (SELECT value FROM json_each(?))
+        """, (json.dumps(list(quote_ids)),))
+        _apply_rollup_where(cur, "q.quote_id IN (SELECT quote_id FROM temp.invoice_batch)", (), -1)
+        cur.execute("""
+            UPDATE quote_items SET quote_id = (SELECT invoice_id FROM temp.invoice_batch b
+                                               WHERE b.quote_id = quote_items.quote_id)
+            WHERE quote_id IN (SELECT quote_id FROM temp.invoice_batch WHERE invoice_id != quote_id)
+        """)
+        cur.execute("""
+            UPDATE quotes SET status = 'Invoiced',
+                   quote_id = (SELECT invoice_id FROM temp.invoice_batch b WHERE b.quote_id = quotes.quote_id)
+            WHERE quote_id IN (SELECT quote_id FROM temp.invoice_batch)
+        """)
+        _apply_rollup_where(cur, "q.quote_id IN (SELECT invoice_id FROM temp.invoice_batch)", (), 1)
+        converted = {r["quote_id"]: r["invoice_id"] for r in
+                     cur.execute("SELECT quote_id, invoice_id FROM temp.invoice_batch").fetchall()}
+    return converted
+
+def _snapshot_current_quote(cur, quote_id):
+    """Snapshot the stored quote with an open cursor; returns versions stored, or None if missing."""
+    current = cur.execute("SELECT * FROM quotes WHERE quote_id = ?", (quote_id,)).fetchone()
+    if not current:
+        return None
+    current_items = cur.execute("SELECT * FROM quote_items WHERE quote_id = ?", (quote_id,)).fetchall()
+    _, stored = _insert_quote_snapshot(cur, quote_id, {"quote": dict(current),
+                                                       "items": [dict(r) for r in current_items]})
+    return stored
+
+def update_quote(quote_id, project_name, items, total, notes, included_charges, snapshot=False):
+    """Replace a quote's header and items; with snapshot=True the previous state is versioned
+    in the same transaction."""
+    pricing, tier_pcts = _quote_pricing(items, included_charges, get_pricing_rules())
+
+    def op(cur):
+        stored = _snapshot_current_quote(cur, quote_id) if snapshot else None
+        _apply_quote_rollup(cur, quote_id, -1)
+        cur.execute("""UPDATE quotes SET project_name = ?, notes = ?, total_amount = ?,
+                    included_charges = ?, pricing = ? WHERE quote_id = ?""",
+                    (project_name, notes, total, str(included_charges), pricing, quote_id))
+        cur.execute("DELETE FROM quote_items WHERE quote_id = ?", (quote_id,))
+        _insert_quote_items(cur, quote_id, items, tier_pcts)
+        _apply_quote_rollup(cur, quote_id, 1)
+        return stored
+    stored = execute_write(op)
+    if stored and stored > HISTORY_KEEP_VERSIONS + HISTORY_COMPACT_SLACK:
+        compact_quote_history(quote_id=quote_id)
+
+def get_quote_by_id(quote_id):
+    quote_row = query_db("SELECT * FROM quotes WHERE quote_id = ?", (quote_id,), fetch_one=True)
+    if not quote_row:
+        return None, None
+    items_rows = query_db("SELECT * FROM quote_items WHERE quote_id = ?", (quote_id,), fetch_all=True)
+    items = [dict(row) for row in items_rows]
+    return dict(quote_row), items
+
+def get_quote_totals(quote_data, items):
+    """The calculate_quote breakdown a quote was saved with, so its documents show the rates and
+    tier discounts of the day it was priced; quotes saved before it was stored are recalculated."""
+    if quote_data.get("pricing"):
+        return json.loads(quote_data["pricing"])
+    return calculate_quote(items, parse_included_charges(quote_data["included_charges"]), get_pricing_rules())
+
+def delete_quote(quote_id):
+    def op(cur):
+        _apply_quote_rollup(cur, quote_id, -1)
+        cur.execute("DELETE FROM quote_items WHERE quote_id = ?", (quote_id,))
+        cur.execute("DELETE FROM quotes WHERE quote_id = ?", (quote_id,))
+    execute_write(op)
+
+def get_all_quotes_for_client(client_id):
+    quotes_rows = query_db(
+        "SELECT quote_id, project_name, date, total_amount, status, notes, included_charges FROM quotes WHERE client_id = ? ORDER BY date DESC",
+        (client_id,),
+        fetch_all=True
+    )
+    return [dict(row) for row in quotes_rows]
+
+def get_products_for_dropdown():
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id, name, description, unit_price FROM products ORDER BY name")
+        rows = cur.fetchall()
+        return [dict(row) for row in rows]
+
+def _record_prices(cur, rows, source):
+    """Append (product_id, unit_price) rows to the price history, valid from now."""
+    now = datetime.now().isoformat()
+    cur.executemany("INSERT INTO product_prices (product_id, unit_price, valid_from, source) VALUES (?, ?, ?, ?)",
+                    [(product_id, price, now, source) for product_id, price in rows])
+
+def add_product(name, description, unit_price):
+    def op(cur):
+        product_id = cur.execute("INSERT INTO products (name, description, unit_price) VALUES (?, ?, ?)",
+                                 (name, description, unit_price)).lastrowid
+        _record_prices(cur, [(product_id, unit_price)], "manual")
+        return product_id
+    try:
+        return execute_write(op)
+    except sqlite3.IntegrityError:
+        return None
+
+def update_product(product_id, name, description, unit_price):
+    def op(cur):
+        old = cur.execute("SELECT unit_price FROM products WHERE id = ?", (product_id,)).fetchone()
+        cur.execute("UPDATE products SET name = ?, description = ?, unit_price = ? WHERE id = ?",
+                    (name, description, unit_price, product_id))
+        if old and old["unit_price"] != unit_price:
+            _record_prices(cur, [(product_id, unit_price)], "manual")
+    try:
+        execute_write(op)
+        return True
+    except sqlite3.IntegrityError:
+        return False
+
+def delete_product(product_id):
+    execute_write(lambda cur: cur.execute("DELETE FROM products WHERE id = ?", (product_id,)))
+
+def sync_products_from_csv(csv_file_path=PRODUCTS_CSV_PATH, progress=None):
+    """Upsert the catalog from a CSV; progress, if given, is called with (fraction, message)."""
+    if not os.path.exists(csv_file_path):
+        return None, "CSV file not found"
+    with CATALOG_SYNC_SECONDS.time():
+        return _sync_products_from_csv(csv_file_path, progress)
+
+def _sync_products_from_csv(csv_file_path, progress):
+    import pandas as pd
+    
+    try:
+        df = pd.read_csv(csv_file_path)
+        required_columns = ['name', 'unit_price']
+        if not all(col in df.columns for col in required_columns):
+            return None, f"CSV must have columns: {', '.join(required_columns)}"
+        
+        if 'description' not in df.columns:
+            df['description'] = ''
+        
+        df['name'] = df['name'].str.strip()
+        df['description'] = df['description'].fillna('').str.strip()
+        df['unit_price'] = pd.to_numeric(df['unit_price'], errors='coerce')
+        df = df.dropna(subset=['name', 'unit_price'])
+        df = df[df['unit_price'] > 0]
+        
+        if df.empty:
+            return None, "No valid products found in CSV"
+        
+        added = updated = 0
+        errors, price_changed, new_prices = [], [], []
+        if progress:
+            # Reported before the write transaction, which would block a progress write
+            progress(0.5, f"{len(df)} products read")
+        
+        with write_transaction() as cur:
+            for _, row in df.iterrows():
+                try:
+                    existing = cur.execute("SELECT id, unit_price FROM products WHERE name = ?",
+                                           (row['name'],)).fetchone()
+                    if existing:
+                        cur.execute("UPDATE products SET description = ?, unit_price = ? WHERE name = ?",
+                                  (row['description'], row['unit_price'], row['name']))
+                        if existing['unit_price'] != row['unit_price']:
+                            price_changed.append(existing['id'])
+                            new_prices.append((existing['id'], row['unit_price']))
+                        updated += 1
+                    else:
+                        cur.execute("INSERT INTO products (name, description, unit_price) VALUES (?, ?, ?)",
+                                  (row['name'], row['description'], row['unit_price']))
+                        new_prices.append((cur.lastrowid, row['unit_price']))
+                        added += 1
+                except Exception as e:
+                    errors.append(f"{row['name']}: {str(e)}")
+            _record_prices(cur, new_prices, "csv")
+        CATALOG_SYNC_PRODUCTS.inc(added, result="added")
+        CATALOG_SYNC_PRODUCTS.inc(updated, result="updated")
+        CATALOG_SYNC_PRODUCTS.inc(len(errors), result="error")
+        
+        message = f"✅ Synced: {added} added, {updated} updated"
+        if errors:
+            message += f"\n⚠️ {len(errors)} errors"
+        return {'added': added, 'updated': updated, 'errors': errors, 'price_changed': price_changed}, message
+    except Exception as e:
+        return None, f"Error reading CSV: {str(e)}"
+
+def reprice_draft_quotes(product_ids=None):
+    """Bring Draft quote lines up to the current catalog (or client list) price in one transaction.
+
+    Lines are matched to products by product_id, or by exact name when it is unset; pass
+    product_ids to limit the work to products whose price changed. Each repriced quote is
+    snapshotted first, then its lines, stored total and report rollups are updated.
+    Returns [{quote_id, old_total, new_total, delta, lines}] for the quotes that changed.
+    """
+    product_filter, params = "", ()
+    if product_ids is not None:
+        if not product_ids:
+            return []
+        product_filter, params = "AND p.id IN (SELECT value FROM json_each(?))", (json.dumps(list(product_ids)),)
+    with write_transaction() as cur:
+        cur.execute("CREATE TEMP TABLE reprice_lines (item_id INTEGER PRIMARY KEY, quote_id TEXT NOT NULL, "
+                    "unit_price REAL NOT NULL)")
+        cur.execute(f"""
+            INSERT INTO temp.reprice_lines (item_id, quote_id, unit_price)
+            SELECT i.id, i.quote_id, COALESCE(cp.unit_price, p.unit_price)
+            FROM quotes q
+            JOIN quote_items i ON i.quote_id = q.quote_id
+            JOIN products p ON p.id = COALESCE(i.product_id,
+                                               (SELECT id FROM products WHERE name = i.product_name))
+            LEFT JOIN client_prices cp ON cp.client_id = q.client_id AND cp.product_id = p.id
+            WHERE q.status = 'Draft' AND i.unit_price != COALESCE(cp.unit_price, p.unit_price) {product_filter}
+        """, params)
+        quote_ids = [r[0] for r in cur.execute("SELECT DISTINCT quote_id FROM temp.reprice_lines").fetchall()]
+        if not quote_ids:
+            return []
+        for quote_id in quote_ids:
+            _snapshot_current_quote(cur, quote_id)
+        in_batch = "q.quote_id IN (SELECT quote_id FROM temp.reprice_lines)"
+        _apply_rollup_where(cur, in_batch, (), -1)
+        cur.execute("""
+            UPDATE quote_items SET unit_price = (SELECT unit_price FROM temp.reprice_lines r
+                                                 WHERE r.item_id = quote_items.id)
+            WHERE id IN (SELECT item_id FROM temp.reprice_lines)
+        """)
+        quotes = {r["quote_id"]: {"quote_id": r["quote_id"], "old_total": r["total_amount"],
+                                  "charges": parse_included_charges(r["included_charges"]), "items": [],
+                                  "lines": r["lines"]}
+                  for r in cur.execute(f"""
+                      SELECT q.quote_id, q.total_amount, q.included_charges,
+                             (SELECT COUNT(*) FROM temp.reprice_lines r WHERE r.quote_id = q.quote_id) AS lines
+                      FROM quotes q WHERE {in_batch}
+                  """).fetchall()}
+        for r in cur.execute("""
+            SELECT id, quote_id, product_name, quantity, unit_price, discount_type, discount_value FROM quote_items
+            WHERE quote_id IN (SELECT quote_id FROM temp.reprice_lines)
+        """).fetchall():
+            quotes[r["quote_id"]]["items"].append({"id": r["id"], "product_name": r["product_name"],
+                                                   "quantity": r["quantity"], "unit_price": r["unit_price"],
+                                                   "discount_type": r["discount_type"] or "none",
+                                                   "discount_value": r["discount_value"] or 0})
+        deltas = []
+        rules = get_pricing_rules()
+        pricing = {}
+        for q in quotes.values():
+            totals = calculate_quote(q["items"], q["charges"], rules)
+            new_total = totals["grand_total"]
+            pricing[q["quote_id"]] = json.dumps(totals, default=float)
+            deltas.append({"quote_id": q["quote_id"], "old_total": q["old_total"], "new_total": new_total,
+                           "delta": new_total - (q["old_total"] or 0), "lines": q["lines"]})
+        cur.executemany("UPDATE quotes SET total_amount = ?, pricing = ? WHERE quote_id = ?",
+                        [(d["new_total"], pricing[d["quote_id"]], d["quote_id"]) for d in deltas])
+        cur.executemany("UPDATE quote_items SET tier_pct = ? WHERE id = ?",
+                        [(rules.tier_pct(item["product_name"], float(item["quantity"] or 0)), item["id"])
+                         for q in quotes.values() for item in q["items"]])
+        _apply_rollup_where(cur, in_batch, (), 1)
+    stored = query_db("SELECT quote_id, COUNT(*) FROM quote_history WHERE quote_id IN (SELECT value FROM json_each(?)) "
+                      "GROUP BY quote_id HAVING COUNT(*) > ?",
+                      (json.dumps(quote_ids), HISTORY_KEEP_VERSIONS + HISTORY_COMPACT_SLACK),
+                      fetch_all=True)
+    for row in stored:
+        compact_quote_history(quote_id=row[0])
+    return sorted(deltas, key=lambda d: d["quote_id"])
+
+# ----------------------------
+# WAREHOUSE CALCULATIONS
+# ----------------------------
+CALCULATION_FIELDS = ("client_id", "project_name", "warehouse_length", "warehouse_width", "lateral_height",
+                      "roof_height", "materials_json", "total_amount", "created_date")
+
+def _calculation_row(calc, created_date):
+    materials = calc.get("materials_json")
+    if materials is None:
+        materials = json.dumps(calc.get("materials") or {})
+    return (calc["client_id"], calc.get("project_name", ""), calc.get("warehouse_length"),
+            calc.get("warehouse_width"), calc.get("lateral_height"), calc.get("roof_height"), materials,
+            calc.get("total_amount"), calc.get("created_date") or created_date)
+
+def _calculation_dict(row):
+    calc = dict(row)
+    calc["materials"] = json.loads(calc.pop("materials_json") or "{}")
+    return calc
+
+def _insert_returning_ids(cur, table, sql, rows):
+    """executemany an INSERT into an AUTOINCREMENT table and return the new ids in order; they
+    are consecutive because the write transaction holds the lock."""
+    last = cur.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+    cur.executemany(sql, rows)
+    return [r[0] for r in cur.execute(f"SELECT id FROM {table} WHERE id > ? ORDER BY id", (last,))]
+
+def _insert_calculations(cur, rows):
+    return _insert_returning_ids(cur, "calculations", f"""
+        INSERT INTO calculations ({", ".join(CALCULATION_FIELDS)}) VALUES ({", ".join("?" * len(CALCULATION_FIELDS))})
+    """, rows)
+
+def save_calculation(client_id, project_name, length, width, lateral_height, roof_height, materials, total_amount):
+    """Store one warehouse calculation (dimensions in metres, materials as a dict); returns its id."""
+    row = _calculation_row({"client_id": client_id, "project_name": project_name, "warehouse_length": length,
+                            "warehouse_width": width, "lateral_height": lateral_height, "roof_height": roof_height,
+                            "materials": materials, "total_amount": total_amount},
+                           datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    return execute_write(lambda cur: _insert_calculations(cur, [row])[0])
+
+def save_calculations_many(calculations):
+    """Insert many calculations in one transaction; returns their ids in order.
+
+    Each entry is a dict with client_id and any of project_name, warehouse_length,
+    warehouse_width, lateral_height, roof_height, materials (dict) or materials_json,
+    total_amount and created_date (defaults to now).
+    """
+    if not calculations:
+        return []
+    created_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    rows = [_calculation_row(calc, created_date) for calc in calculations]
+    with write_transaction() as cur:
+        return _insert_calculations(cur, rows)
+
+def get_calculations_for_clients(client_ids):
+    """{client_id: [calculation, newest first]} for many clients in one indexed query.
+
+    Clients without calculations map to an empty list; materials are decoded to dicts.
+    """
+    client_ids = list(dict.fromkeys(client_ids))
+    result = {client_id: [] for client_id in client_ids}
+    rows = query_db("""
+        SELECT c.* FROM json_each(?) ids
+        JOIN calculations c ON c.client_id = ids.value
+        ORDER BY c.client_id, c.created_date DESC, c.id DESC
+    """, (json.dumps(client_ids),), fetch_all=True)
+    for row in rows:
+        result[row["client_id"]].append(_calculation_dict(row))
+    return result
+
+def get_calculation(calculation_id):
+    row = query_db("SELECT * FROM calculations WHERE id = ?", (calculation_id,), fetch_one=True)
+    return _calculation_dict(row) if row else None
+
+def delete_calculation(calculation_id):
+    execute_write(lambda cur: cur.execute("DELETE FROM calculations WHERE id = ?", (calculation_id,)))
+
+def save_quotation(client_id, calculation_id, quote_number, total_amount, valid_days=30, notes=""):
+    """Record a quote for a warehouse calculation, valid for `valid_days`; it has no line items.
+
+    quote_number=None takes the next COT number. Returns the quote id.
+    """
+    today = datetime.now()
+    valid_until = (today + timedelta(days=valid_days)).strftime("%Y-%m-%d")
+
+    def op(cur):
+        quote_id = quote_number or allocate_quote_ids(cur)[0]
+        cur.execute("""
+            INSERT INTO quotes (quote_id, client_id, project_name, date, total_amount, status, notes,
+                                included_charges, calculation_id, valid_until)
+            VALUES (?, ?, (SELECT project_name FROM calculations WHERE id = ?), ?, ?, 'Draft', ?, ?, ?, ?)
+        """, (quote_id, client_id, calculation_id, today.strftime("%Y-%m-%d"), total_amount, notes, str({}),
+              calculation_id, valid_until))
+        _apply_quote_rollup(cur, quote_id, 1)
+        return quote_id
+    quote_id = execute_write(op)
+    QUOTES_SAVED.inc(mode="single")
+    return quote_id
+
+def get_client_quotations(client_id):
+    """Quotes of a client with their calculation link and validity, newest first."""
+    rows = query_db("""
+        SELECT id, quote_id, calculation_id, date, valid_until, status, total_amount, notes FROM quotes
+        WHERE client_id = ? ORDER BY date DESC, id DESC
+    """, (client_id,), fetch_all=True)
+    return [dict(row) for row in rows]
+
+# ----------------------------
+# PRICE HISTORY
+# ----------------------------
+def _as_of_key(as_of):
+    """valid_from bound for a date/datetime or ISO string; a bare date means the end of that day."""
+    if as_of is None:
+        return datetime.now().isoformat()
+    if hasattr(as_of, "isoformat"):
+        as_of = as_of.isoformat()
+    return f"{as_of}T23:59:59.999999" if len(as_of) == 10 else as_of
+
+def get_price_as_of(product_id, as_of=None):
+    """Catalog price of a product at a point in time, or None if it had no price yet."""
+    row = query_db("""
+        SELECT unit_price FROM product_prices WHERE product_id = ? AND valid_from <= ?
+        ORDER BY valid_from DESC, id DESC LIMIT 1
+    """, (product_id, _as_of_key(as_of)), fetch_one=True)
+    return row[0] if row else None
+
+def get_prices_as_of(product_ids, as_of=None):
+    """{product_id: price} at a point in time for many products; one index seek per product."""
+    rows = query_db("""
+        SELECT ids.value AS product_id,
+               (SELECT unit_price FROM product_prices h WHERE h.product_id = ids.value AND h.valid_from <= ?
+                ORDER BY h.valid_from DESC, h.id DESC LIMIT 1) AS unit_price
+        FROM json_each(?) ids
+    """, (_as_of_key(as_of), json.dumps(list(product_ids))), fetch_all=True)
+    return {r["product_id"]: r["unit_price"] for r in rows if r["unit_price"] is not None}
+
+def get_price_history(product_id):
+    rows = query_db("""
+        SELECT unit_price, valid_from, source FROM product_prices WHERE product_id = ?
+        ORDER BY valid_from, id
+    """, (product_id,), fetch_all=True)
+    return [dict(r) for r in rows]
+
+# ----------------------------
+# PRICING RULES
+# ----------------------------
+_pricing_rules_cache = {"rules": None, "loaded_at": 0.0, "db_path": None, "hits": 0, "misses": 0}
+metrics.register_cache("pricing_rules", lambda: (_pricing_rules_cache["hits"], _pricing_rules_cache["misses"]))
+
+def get_pricing_rules():
+    """Compiled PricingRules from the pricing tables, cached for PRICING_RULES_TTL_SECONDS."""
+    cache = _pricing_rules_cache
+    if (cache["rules"] is not None and cache["db_path"] == DB_PATH
+            and time.monotonic() - cache["loaded_at"] < PRICING_RULES_TTL_SECONDS):
+        cache["hits"] += 1
+        return cache["rules"]
+    cache["misses"] += 1
+    rules = _load_pricing_rules(lambda sql: query_db(sql, fetch_all=True))
+    cache.update(rules=rules, loaded_at=time.monotonic(), db_path=DB_PATH)
+    return rules
+
+def _load_pricing_rules(fetch_all):
+    """PricingRules from the pricing tables; fetch_all(sql) returns a query's rows."""
+    charges = fetch_all("SELECT key, kind, label, rate FROM pricing_charges ORDER BY kind, sort_order, key")
+    tiers = {}
+    for r in fetch_all("""
+        SELECT p.name, t.min_quantity, t.discount_pct FROM price_tiers t
+        LEFT JOIN products p ON p.id = t.product_id
+        WHERE t.product_id IS NULL OR p.id IS NOT NULL
+    """):
+        tiers.setdefault(r["name"], []).append((r["min_quantity"], r["discount_pct"]))
+    client_prices = {}
+    for r in fetch_all("SELECT c.client_id, p.name, c.unit_price FROM client_prices c JOIN products p ON p.id = c.product_id"):
+        client_prices.setdefault(r["client_id"], {})[r["name"]] = r["unit_price"]
+    return PricingRules(
+        surcharges=[(r["key"], r["label"], r["rate"]) for r in charges if r["kind"] == "surcharge"],
+        taxes=[(r["key"], r["label"], r["rate"]) for r in charges if r["kind"] == "tax"],
+        tiers=tiers, client_prices=client_prices)
+
+def _invalidate_pricing_rules():
+    _pricing_rules_cache["rules"] = None
+
+def get_pricing_charges():
+    return [dict(r) for r in query_db("SELECT key, kind, label, rate, sort_order FROM pricing_charges "
+                                      "ORDER BY kind DESC, sort_order, key", fetch_all=True)]
+
+def save_pricing_charges(rows):
+    """Replace the surcharge and tax table with rows of {key, kind, label, rate[, sort_order]}."""
+    def op(cur):
+        cur.execute("DELETE FROM pricing_charges")
+        cur.executemany("INSERT INTO pricing_charges (key, kind, label, rate, sort_order) VALUES (?, ?, ?, ?, ?)",
+                        [(r["key"], r["kind"], r["label"], float(r["rate"]), r.get("sort_order", n))
+                         for n, r in enumerate(rows)])
+    execute_write(op)
+    _invalidate_pricing_rules()
+
+def get_price_tiers():
+    rows = query_db("""
+        SELECT t.id, t.product_id, p.name AS product_name, t.min_quantity, t.discount_pct
+        FROM price_tiers t LEFT JOIN products p ON p.id = t.product_id
+        ORDER BY p.name IS NOT NULL, p.name, t.min_quantity
+    """, fetch_all=True)
+    return [dict(r) for r in rows]
+
+def save_price_tiers(rows):
+    """Replace all quantity tiers with rows of {product_id (None = all products), min_quantity, discount_pct}."""
+    def op(cur):
+        cur.execute("DELETE FROM price_tiers")
+        cur.executemany("INSERT INTO price_tiers (product_id, min_quantity, discount_pct) VALUES (?, ?, ?)",
+                        [(r.get("product_id"), float(r["min_quantity"]), float(r["discount_pct"])) for r in rows])
+    execute_write(op)
+    _invalidate_pricing_rules()
+
+def get_client_prices(client_id):
+    rows = query_db("""
+        SELECT c.product_id, p.name AS product_name, p.unit_price AS catalog_price, c.unit_price
+        FROM client_prices c JOIN products p ON p.id = c.product_id WHERE c.client_id = ? ORDER BY p.name
+    """, (client_id,), fetch_all=True)
+    return [dict(r) for r in rows]
+
+def save_client_prices(client_id, prices):
+    """Replace a client's price list with {product_id: unit_price}."""
+    def op(cur):
+        cur.execute("DELETE FROM client_prices WHERE client_id = ?", (client_id,))
+        cur.executemany("INSERT INTO client_prices (client_id, product_id, unit_price) VALUES (?, ?, ?)",
+                        [(client_id, product_id, float(price)) for product_id, price in prices.items()])
+    execute_write(op)
+    _invalidate_pricing_rules()
+
+def create_sample_csv():
+    import pandas as pd
+    sample_data = {
+        'name': ['Steel Beam IPE 200', 'Galvanized Sheet 2mm', 'Anchor Bolts M20', 'Concrete Mix 25MPa', 'Rebar 12mm'],
+        'description': [
+            'European standard I-beam',
+            'Corrosion-resistant roofing',
+            'Heavy-duty foundation bolts',
+            'High-strength concrete',
+            'Reinforcement steel bar'
+        ],
+        'unit_price': [125.50, 45.75, 8.90, 95.00, 12.50]
+    }
+    df = pd.DataFrame(sample_data)
+    df.to_csv(PRODUCTS_CSV_PATH, index=False)
+    return df
+
+# ----------------------------
+# QUOTE HISTORY
+# ----------------------------
+def _encode_history_payload(payload):
+    return zlib.compress(json.dumps(payload, default=str, separators=(",", ":")).encode("utf-8"))
+
+def _decode_history_payload(blob, encoding):
+    if encoding == "json":
+        # Legacy uncompressed snapshot, either {"data": {"quote", "items"}} or {"quote_data", "items"}
+        legacy = json.loads(blob)
+        data = legacy.get("data") or {"quote": legacy.get("quote_data"), "items": legacy.get("items")}
+        return _history_state(data)
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+def _history_state(data_dict):
+    """Normalize a {"quote", "items"} dict into the compact form stored in history."""
+    state = {
+        "quote": dict(data_dict.get("quote") or {}),
+        "rows": [[item.get(f) for f in HISTORY_ITEM_FIELDS] for item in data_dict.get("items") or []],
+    }
+    # Round-trip so values compare equal to what a later decode returns
+    return json.loads(json.dumps(state, default=str))
+
+def _history_delta(prev, curr):
+    prev_quote, curr_quote = prev["quote"], curr["quote"]
+    prev_rows = [tuple(r) for r in prev["rows"]]
+    curr_rows = [tuple(r) for r in curr["rows"]]
+    matcher = difflib.SequenceMatcher(None, prev_rows, curr_rows, autojunk=False)
+    return {
+        "set": {k: v for k, v in curr_quote.items() if k not in prev_quote or prev_quote[k] != v},
+        "unset": [k for k in prev_quote if k not in curr_quote],
+        "ops": [[i1, i2, curr["rows"][j1:j2]]
+                for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"],
+    }
+
+def _apply_history_delta(state, delta):
+    quote = dict(state["quote"])
+    quote.update(delta["set"])
+    for k in delta["unset"]:
+        quote.pop(k, None)
+    rows = list(state["rows"])
+    # Opcodes index into the previous version, so apply from the end backwards
+    for i1, i2, new_rows in reversed(delta["ops"]):
+        rows[i1:i2] = new_rows
+    return {"quote": quote, "rows": rows}
+
+def _history_snapshot(quote_id, version, snapshot_date, state):
+    items = [dict(zip(HISTORY_ITEM_FIELDS, row)) for row in state["rows"]]
+    return {"quote_id": quote_id, "snapshot_date": snapshot_date, "version": version,
+            "data": {"quote": state["quote"], "items": items}}
+
+def _load_history_state(cur, quote_id, version):
+    checkpoint = cur.execute("""
+        SELECT MAX(version) FROM quote_history
+        WHERE quote_id = ? AND version <= ? AND encoding != 'delta'
+    """, (quote_id, version)).fetchone()[0]
+    if checkpoint is None:
+        return None
+    state = None
+    for encoding, blob in cur.execute("""
+        SELECT encoding, snapshot_data FROM quote_history
+        WHERE quote_id = ? AND version BETWEEN ? AND ? ORDER BY version
+    """, (quote_id, checkpoint, version)):
+        payload = _decode_history_payload(blob, encoding)
+        state = _apply_history_delta(state, payload) if encoding == "delta" else payload
+    return state
+
+def _insert_quote_snapshot(cur, quote_id, data_dict):
+    """Append a history version using an open cursor; returns (version, versions stored)."""
+    state = _history_state(data_dict)
+    last_version, last_checkpoint, stored = cur.execute("""
+        SELECT MAX(version), MAX(CASE WHEN encoding != 'delta' THEN version END), COUNT(*)
+        FROM quote_history WHERE quote_id = ?
+    """, (quote_id,)).fetchone()
+    version = (last_version or 0) + 1
+    encoding, blob = "full", _encode_history_payload(state)
+    if last_checkpoint is not None and version - last_checkpoint < HISTORY_CHECKPOINT_INTERVAL:
+        prev = _load_history_state(cur, quote_id, last_version)
+        delta_blob = _encode_history_payload(_history_delta(prev, state))
+        if len(delta_blob) < len(blob):
+            encoding, blob = "delta", delta_blob
+    cur.execute("""
+        INSERT INTO quote_history (quote_id, snapshot_date, snapshot_data, version, encoding, item_count, total_amount)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (quote_id, datetime.now().isoformat(), blob, version, encoding, len(state["rows"]),
+          state["quote"].get("total_amount")))
+    return version, stored + 1
+
+def save_quote_snapshot(quote_id, data_dict):
+    version, stored = execute_write(lambda cur: _insert_quote_snapshot(cur, quote_id, data_dict))
+    if stored > HISTORY_KEEP_VERSIONS + HISTORY_COMPACT_SLACK:
+        compact_quote_history(quote_id=quote_id)
+    return version
+
+def list_quote_history(quote_id):
+    """Version metadata for a quote, newest first, without decoding any snapshot."""
+    rows = query_db("""
+        SELECT id, version, snapshot_date, encoding, item_count, total_amount,
+               LENGTH(snapshot_data) AS size_bytes
+        FROM quote_history WHERE quote_id = ? ORDER BY version DESC
+    """, (quote_id,), fetch_all=True)
+    return [dict(row) for row in rows]
+
+def get_quote_snapshot(quote_id, version):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        row = cur.execute("SELECT snapshot_date FROM quote_history WHERE quote_id = ? AND version = ?",
+                          (quote_id, version)).fetchone()
+        if not row:
+            return None
+        state = _load_history_state(cur, quote_id, version)
+    return _history_snapshot(quote_id, version, row[0], state)
+
+def get_quote_history(quote_id):
+    rows = query_db("""
+        SELECT version, snapshot_date, encoding, snapshot_data FROM quote_history
+        WHERE quote_id = ? ORDER BY version
+    """, (quote_id,), fetch_all=True)
+    history, state = [], None
+    for version, snapshot_date, encoding, blob in rows:
+        payload = _decode_history_payload(blob, encoding)
+        state = _apply_history_delta(state, payload) if encoding == "delta" else payload
+        history.append(_history_snapshot(quote_id, version, snapshot_date, state))
+    return history[::-1]
+
+def compact_quote_history(keep_versions=HISTORY_KEEP_VERSIONS, max_age_days=HISTORY_MAX_AGE_DAYS,
+                          quote_id=None, vacuum=False):
+    """Drop versions beyond the retention policy and re-encode what is left as checkpoints plus deltas.
+
+    The newest version of every quote is always kept. Legacy JSON snapshots are converted on the way.
+    """
+    cutoff = (datetime.now() - timedelta(days=max_age_days)).isoformat() if max_age_days else None
+    stats = {"quotes": 0, "removed": 0, "rewritten": 0}
+    with write_transaction() as cur:
+        if quote_id:
+            quote_ids = [quote_id]
+        else:
+            quote_ids = [r[0] for r in cur.execute("SELECT DISTINCT quote_id FROM quote_history").fetchall()]
+        for qid in quote_ids:
+            rows = cur.execute("""
+                SELECT id, version, snapshot_date, encoding, snapshot_data, item_count, total_amount
+                FROM quote_history WHERE quote_id = ? ORDER BY version
+            """, (qid,)).fetchall()
+            if not rows:
+                continue
+            keep_from = max(len(rows) - keep_versions, 0) if keep_versions else 0
+            kept = [i for i, r in enumerate(rows)
+                    if i >= keep_from and (cutoff is None or r["snapshot_date"] >= cutoff)]
+            kept = kept or [len(rows) - 1]
+            needs_rewrite = (len(kept) < len(rows) or rows[kept[0]]["encoding"] != "full"
+                             or any(r["encoding"] == "json" for r in rows))
+            if not needs_rewrite:
+                continue
+            kept_set = set(kept)
+            state, prev_kept, checkpoint_at = None, None, None
+            for i, r in enumerate(rows):
+                payload = _decode_history_payload(r["snapshot_data"], r["encoding"])
+                state = _apply_history_delta(state, payload) if r["encoding"] == "delta" else payload
+                if i not in kept_set:
+                    cur.execute("DELETE FROM quote_history WHERE id = ?", (r["id"],))
+                    stats["removed"] += 1
+                    continue
+                encoding, blob = "full", _encode_history_payload(state)
+                if prev_kept is not None and r["version"] - checkpoint_at < HISTORY_CHECKPOINT_INTERVAL:
+                    delta_blob = _encode_history_payload(_history_delta(prev_kept, state))
+                    if len(delta_blob) < len(blob):
+                        encoding, blob = "delta", delta_blob
+                if encoding == "full":
+                    checkpoint_at = r["version"]
+                cur.execute("""
+                    UPDATE quote_history SET snapshot_data = ?, encoding = ?, item_count = ?, total_amount = ?
+                    WHERE id = ?
+                """, (blob, encoding, len(state["rows"]), state["quote"].get("total_amount"), r["id"]))
+                prev_kept = state
+                stats["rewritten"] += 1
+            stats["quotes"] += 1
+    if vacuum:
+        with get_db_connection() as conn:
+            conn.execute("VACUUM")
+    return stats
+
+def _keyed_items(items):
+    """Key lines by product name plus occurrence, so repeated products still pair up in order."""
+    keyed, seen = {}, {}
+    for item in items:
+        name = item.get("product_name")
+        n = seen.get(name, 0)
+        seen[name] = n + 1
+        keyed[(name, n)] = dict(item, discount_type=item.get("discount_type") or "none",
+                                discount_value=item.get("discount_value") or 0)
+    return keyed
+
+def diff_quote_data(old, new):
+    """Line-level diff between two {"quote", "items"} dicts."""
+    old_quote, new_quote = old.get("quote") or {}, new.get("quote") or {}
+    quote_changes = {k: (old_quote.get(k), new_quote.get(k))
+                     for k in HISTORY_QUOTE_FIELDS if old_quote.get(k) != new_quote.get(k)}
+    old_items, new_items = _keyed_items(old.get("items") or []), _keyed_items(new.get("items") or [])
+    added = [new_items[k] for k in new_items if k not in old_items]
+    removed = [old_items[k] for k in old_items if k not in new_items]
+    changed, unchanged = [], 0
+    for key, new_item in new_items.items():
+        old_item = old_items.get(key)
+        if old_item is None:
+            continue
+        fields = {f: (old_item.get(f), new_item.get(f))
+                  for f in HISTORY_DIFF_FIELDS if old_item.get(f) != new_item.get(f)}
+        if fields:
+            changed.append({"product_name": key[0], "changes": fields})
+        else:
+            unchanged += 1
+    return {"quote": quote_changes, "added": added, "removed": removed,
+            "changed": changed, "unchanged": unchanged}
+
+def diff_quote_versions(quote_id, from_version, to_version=None):
+    """Diff two history versions; to_version=None compares against the live quote."""
+    old = get_quote_snapshot(quote_id, from_version)
+    if old is None:
+        return None
+    if to_version is None:
+        quote, items = get_quote_by_id(quote_id)
+        if quote is None:
+            return None
+        new = {"quote": quote, "items": items}
+    else:
+        snapshot = get_quote_snapshot(quote_id, to_version)
+        if snapshot is None:
+            return None
+        new = snapshot["data"]
+    return diff_quote_data(old["data"], new)
+
+def restore_quote_version(quote_id, version):
+    """Replace the live quote with a history version in one transaction.
+
+    The current state is snapshotted first, so a restore can itself be undone.
+    """
+    snapshot = get_quote_snapshot(quote_id, version)
+    if snapshot is None:
+        return False
+    quote, items = snapshot["data"]["quote"], snapshot["data"]["items"]
+    # Versions saved before tier_pct was kept take the current tiers
+    rules = get_pricing_rules()
+    tier_pcts = [item["tier_pct"] if item.get("tier_pct") is not None
+                 else rules.tier_pct(item["product_name"], float(item["quantity"] or 0)) for item in items]
+
+    def op(cur):
+        stored = _snapshot_current_quote(cur, quote_id)
+        if stored is None:
+            return None
+        _apply_quote_rollup(cur, quote_id, -1)
+        cur.execute("""UPDATE quotes SET project_name = ?, notes = ?, total_amount = ?,
+                    included_charges = ?, pricing = ? WHERE quote_id = ?""",
+                    (quote.get("project_name"), quote.get("notes"), quote.get("total_amount"),
+                     quote.get("included_charges"), quote.get("pricing"), quote_id))
+        cur.execute("DELETE FROM quote_items WHERE quote_id = ?", (quote_id,))
+        _insert_quote_items(cur, quote_id, items, tier_pcts)
+        _apply_quote_rollup(cur, quote_id, 1)
+        return stored
+    stored = execute_write(op)
+    if stored is None:
+        return False
+    if stored > HISTORY_KEEP_VERSIONS + HISTORY_COMPACT_SLACK:
+        compact_quote_history(quote_id=quote_id)
+    return True
+
+def parse_included_charges(value):
+    """quotes.included_charges holds str(dict); fall back to every charge on."""
+    try:
+        return ast.literal_eval(value)
+    except:
+        return {k: True for k, _, _ in DEFAULT_SURCHARGES}
+
+def duplicate_quote(original_quote_id):
+    def op(cur):
+        original_quote = cur.execute("SELECT * FROM quotes WHERE quote_id = ?", (original_quote_id,)).fetchone()
+        if not original_quote:
+            return None
+        items = [dict(r) for r in cur.execute("SELECT * FROM quote_items WHERE quote_id = ?",
+                                              (original_quote_id,)).fetchall()]
+        included_charges = parse_included_charges(original_quote["included_charges"])
+
+        notes = original_quote['notes'] or ''
+        notes = f"{notes}\n\nCopied from {original_quote_id}" if notes else f"Copied from {original_quote_id}"
+
+        quote_id = allocate_quote_ids(cur)[0]
+        _insert_quote(cur, quote_id, original_quote['client_id'], original_quote['project_name'] or '',
+                      items, original_quote['total_amount'], notes, included_charges, "Draft",
+                      pricing=original_quote['pricing'])
+        return quote_id
+    quote_id = execute_write(op)
+    if quote_id:
+        QUOTES_SAVED.inc(mode="duplicate")
+    return quote_id
+
+# ----------------------------
+# REPORT ROLLUPS
+# ----------------------------
+def line_net_sql(alias=""):
+    """SQL expression for a quote line's value after its volume tier and its own discount
+    (same order as pricing.price_lines: the tier first, the line's discount on what is left)."""
+    t = f"{alias}." if alias else ""
+    base = f"{t}quantity * {t}unit_price * (1 - COALESCE({t}tier_pct, 0) / 100.0)"
+    return f"""
+    CASE {t}discount_type
+        WHEN 'percentage' THEN {base} * (1 - COALESCE({t}discount_value, 0) / 100.0)
+        WHEN 'fixed' THEN {base} - COALESCE({t}discount_value, 0)
+        ELSE {base}
+    END"""
+
+LINE_NET_SQL = line_net_sql()
+
+def _apply_quote_rollup(cur, quote_id, sign):
+    """Add (sign=1) or remove (sign=-1) one quote's contribution to the report rollups.
+
+    Call with -1 before changing a quote and +1 after, on the same cursor, so reports
+    never need to scan quotes or quote_items.
+    """
+    _apply_rollup_where(cur, "q.quote_id = ?", (quote_id,), sign)
+
+def _apply_rollup_where(cur, where, params, sign):
+    """Set-based _apply_quote_rollup for every quote `q` matching the SQL condition."""
+    cur.execute(f"""
+        INSERT INTO report_monthly (month, status, quote_count, total_value)
+        SELECT substr(q.date, 1, 7), q.status, ? * COUNT(*), ? * SUM(COALESCE(q.total_amount, 0))
+        FROM quotes q WHERE {where} GROUP BY substr(q.date, 1, 7), q.status
+        ON CONFLICT (month, status) DO UPDATE SET
+            quote_count = quote_count + excluded.quote_count,
+            total_value = total_value + excluded.total_value
+    """, (sign, sign, *params))
+    cur.execute(f"""
+        INSERT INTO report_clients (client_id, status, quote_count, total_value)
+        SELECT q.client_id, q.status, ? * COUNT(*), ? * SUM(COALESCE(q.total_amount, 0))
+        FROM quotes q WHERE {where} GROUP BY q.client_id, q.status
+        ON CONFLICT (client_id, status) DO UPDATE SET
+            quote_count = quote_count + excluded.quote_count,
+            total_value = total_value + excluded.total_value
+    """, (sign, sign, *params))
+    cur.execute(f"""
+        INSERT INTO report_products (product_name, status, line_count, quantity, revenue)
+        SELECT i.product_name, q.status, ? * COUNT(*), ? * SUM(i.quantity), ? * SUM({line_net_sql('i')})
+        FROM quotes q JOIN quote_items i ON i.quote_id = q.quote_id
+        WHERE {where} GROUP BY i.product_name, q.status
+        ON CONFLICT (product_name, status) DO UPDATE SET
+            line_count = line_count + excluded.line_count,
+            quantity = quantity + excluded.quantity,
+            revenue = revenue + excluded.revenue
+    """, (sign, sign, sign, *params))
+    if sign < 0:
+        cur.execute("DELETE FROM report_monthly WHERE quote_count <= 0")
+        cur.execute("DELETE FROM report_clients WHERE quote_count <= 0")
+        cur.execute("DELETE FROM report_products WHERE line_count <= 0")
+
+def _rebuild_report_rollups(cur):
+    cur.execute("DELETE FROM report_monthly")
+    cur.execute("DELETE FROM report_clients")
+    cur.execute("DELETE FROM report_products")
+    cur.execute("""
+        INSERT INTO report_monthly (month, status, quote_count, total_value)
+        SELECT substr(date, 1, 7), status, COUNT(*), SUM(total_amount) FROM quotes
+        GROUP BY substr(date, 1, 7), status
+    """)
+    cur.execute("""
+        INSERT INTO report_clients (client_id, status, quote_count, total_value)
+        SELECT client_id, status, COUNT(*), SUM(total_amount) FROM quotes
+        GROUP BY client_id, status
+    """)
+    cur.execute(f"""
+        INSERT INTO report_products (product_name, status, line_count, quantity, revenue)
+        SELECT i.product_name, q.status, COUNT(*), SUM(i.quantity), SUM({LINE_NET_SQL})
+        FROM quote_items i JOIN quotes q ON q.quote_id = i.quote_id
+        GROUP BY i.product_name, q.status
+    """)
+
+def _backfill_tier_pcts(cur):
+    """Set tier_pct on lines saved before it was stored, from the current tiers, and refresh the rollups."""
+    rules = _load_pricing_rules(lambda sql: cur.execute(sql).fetchall())
+    if not rules.tier_tables:
+        return
+    updates = []
+    for item_id, product_name, quantity in cur.execute("SELECT id, product_name, quantity FROM quote_items").fetchall():
+        tier_pct = rules.tier_pct(product_name, float(quantity or 0))
+        if tier_pct:
+            updates.append((tier_pct, item_id))
+    if updates:
+        cur.executemany("UPDATE quote_items SET tier_pct = ? WHERE id = ?", updates)
+        _rebuild_report_rollups(cur)
+
+def rebuild_report_rollups():
+    """Recompute all rollups from scratch; only needed after editing the database by hand."""
+    with write_transaction() as cur:
+        _rebuild_report_rollups(cur)
+
+def get_report_data(status=None, top_n=10):
+    """Read report figures from the rollup tables; status=None covers every status."""
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        monthly = cur.execute("""
+            SELECT month, status, quote_count, total_value FROM report_monthly ORDER BY month
+        """).fetchall()
+        clients = cur.execute("""
+            SELECT r.client_id, COALESCE(c.company_name, '#' || r.client_id) AS company_name,
+                   SUM(r.quote_count) AS quote_count, SUM(r.total_value) AS total_value
+            FROM report_clients r LEFT JOIN clients c ON c.id = r.client_id
+            WHERE ? IS NULL OR r.status = ?
+            GROUP BY r.client_id ORDER BY total_value DESC LIMIT ?
+        """, (status, status, top_n)).fetchall()
+        products = cur.execute("""
+            SELECT product_name, SUM(line_count) AS line_count, SUM(quantity) AS quantity,
+                   SUM(revenue) AS revenue
+            FROM report_products WHERE ? IS NULL OR status = ?
+            GROUP BY product_name ORDER BY revenue DESC LIMIT ?
+        """, (status, status, top_n)).fetchall()
+    return {
+        "monthly": [dict(r) for r in monthly],
+        "clients": [dict(r) for r in clients],
+        "products": [dict(r) for r in products],
+    }
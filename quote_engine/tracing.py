@@ -0,0 +1,125 @@
+"""Opt-in span tracing: where the time of one app rerun (or background job) goes.
+
+    with tracing.trace("rerun", user="fabian") as t:    # one trace per rerun or job
+        with tracing.span("show_quote_form"):
+            ...
+
+    @tracing.traced()
+    def show_saved_quotes(): ...
+
+Spans nest by context (contextvars), so they work across threads that copy the context,
+e.g. storage's writer thread. SQL statements timed by querylog are recorded as "sql" spans.
+Outside a trace span() costs one context-variable lookup.
+
+Finished traces are appended to a JSON-lines file for offline analysis:
+    RIGC_TRACE=1               trace every rerun and job
+    RIGC_TRACE_FILE=path       trace log (default traces.jsonl; empty disables it)
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+ENABLED = os.environ.get("RIGC_TRACE", "0") == "1"
+TRACE_FILE = os.environ.get("RIGC_TRACE_FILE", "traces.jsonl")
+
+_trace = contextvars.ContextVar("rigc_trace", default=None)
+_depth = contextvars.ContextVar("rigc_trace_depth", default=0)
+_write_lock = threading.Lock()
+
+class Trace:
+    """Spans of one unit of work; offsets are milliseconds from the trace start."""
+
+    def __init__(self, name, **attrs):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.attrs = attrs
+        self.ts = datetime.now().isoformat(timespec="milliseconds")
+        self.t0 = time.perf_counter()
+        self.duration_ms = None
+        self.spans = []
+
+    def add(self, name, start, duration, depth, attrs):
+        self.spans.append({"name": name, "start_ms": (start - self.t0) * 1000, "duration_ms": duration * 1000,
+                           "depth": depth, **({"attrs": attrs} if attrs else {})})
+
+    def finish(self):
+        self.duration_ms = (time.perf_counter() - self.t0) * 1000
+        self.spans.sort(key=lambda s: (s["start_ms"], s["depth"]))
+
+    def to_dict(self):
+        return {"trace_id": self.id, "name": self.name, "ts": self.ts, "duration_ms": self.duration_ms,
+                "attrs": self.attrs, "spans": self.spans}
+
+def active():
+    return _trace.get() is not None
+
+def current():
+    return _trace.get()
+
+@contextmanager
+def trace(name, write=True, **attrs):
+    """Collect the spans of the enclosed work into a new Trace, written to TRACE_FILE at the end."""
+    t = Trace(name, **attrs)
+    token, depth_token = _trace.set(t), _depth.set(0)
+    try:
+        yield t
+    finally:
+        _trace.reset(token)
+        _depth.reset(depth_token)
+        t.finish()
+        if write:
+            write_trace(t)
+
+@contextmanager
+def span(name, **attrs):
+    t = _trace.get()
+    if t is None:
+        yield
+        return
+    depth = _depth.get()
+    token = _depth.set(depth + 1)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _depth.reset(token)
+        t.add(name, start, time.perf_counter() - start, depth, attrs)
+
+def position():
+    """(trace, depth) of the current context, for spans recorded later with record()."""
+    t = _trace.get()
+    return (t, _depth.get()) if t is not None else None
+
+def record(name, start, duration, at=None, **attrs):
+    """Add an already timed span (perf_counter start, seconds) to the current trace, or to
+    the position() captured when the work started."""
+    at = at or position()
+    if at is not None:
+        t, depth = at
+        t.add(name, start, duration, depth, attrs)
+
+def traced(name=None):
+    """Decorator: run the function inside span(name or its qualified name)."""
+    def decorate(fn):
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def write_trace(t, path=None):
+    path = TRACE_FILE if path is None else path
+    if not path:
+        return
+    line = json.dumps(t.to_dict(), ensure_ascii=False, default=str) + "\n"
+    with _write_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(line)